@@ -7,7 +7,7 @@ from Crypto.Random import get_random_bytes
 from Client import data
 from lib.ServerException import ServerException
 from lib.utils import send_request, hash_password, decrypt_aes_cbc, \
-    encrypt_aes_cbc, color, GREEN
+    encrypt_aes_cbc, encrypt_aes_cbc_fields, decrypt_aes_cbc_fields, color, GREEN
 import Client.config as cfg
 from lib.config import __api_version__
 from lib.config import salt
@@ -123,12 +123,23 @@ def get_symmetric_key_kdc(client_id: str, client_password: str, server_id: str)
     encrypted_session_aes_key = symmetric_key['aes_key']
     encrypted_nonce = symmetric_key['nonce']
 
-    client_password_hash = hash_password(client_password, salt)
-    decrypted_session_aes_key = decrypt_aes_cbc(client_password_hash, iv, encrypted_session_aes_key)
-    decrypted_nonce = decrypt_aes_cbc(client_password_hash, iv, encrypted_nonce)
+    # the key derived from the password is cached, only the first ticket of the session pays for the hashing
+    derived_keys = data.db['derived_keys']
+    client_password_hash = derived_keys.get_key(client_id)
+    if client_password_hash is None:
+        client_password_hash = hash_password(client_password, salt)
+        derived_keys.add_key(client_id, client_password_hash)
+
+    try:
+        decrypted_session_aes_key, decrypted_nonce = decrypt_aes_cbc_fields(
+            client_password_hash, iv, (encrypted_session_aes_key, encrypted_nonce))
+    except ValueError:  # bad padding, the password is wrong
+        derived_keys.invalidate(client_id)
+        raise ServerException()
 
     # Check if nonces are different
     if nonce != decrypted_nonce:
+        derived_keys.invalidate(client_id)
         raise ServerException()
 
     ticket = response['payload']['ticket']
@@ -153,14 +164,11 @@ def send_symmetric_key_msg_server(client_id, server_info, session_aes_key, ticke
     server_id, server_ip, server_port = server_info["server_id"], server_info["server_ip"], server_info["server_port"]
 
     timestamp = str(time.time())
-    iv, encrypted_version__with_session_key = encrypt_aes_cbc(key=session_aes_key,
-                                                              data=str(__api_version__).encode('utf-8'))
-    _, encrypted_client_id__with_session_key = encrypt_aes_cbc(key=session_aes_key, data=client_id.encode('utf-8'),
-                                                               iv=iv)
-    _, encrypted_server_id__with_session_key = encrypt_aes_cbc(key=session_aes_key, data=server_id.encode('utf-8'),
-                                                               iv=iv)
-    _, encrypted_timestamp__with_session_key = encrypt_aes_cbc(key=session_aes_key, data=timestamp.encode('utf-8'),
-                                                               iv=iv)
+    iv, (encrypted_version__with_session_key, encrypted_client_id__with_session_key,
+         encrypted_server_id__with_session_key, encrypted_timestamp__with_session_key) = \
+        encrypt_aes_cbc_fields(key=session_aes_key, fields=(str(__api_version__).encode('utf-8'),
+                                                            client_id.encode('utf-8'), server_id.encode('utf-8'),
+                                                            timestamp.encode('utf-8')))
 
     request = {
         'header': {
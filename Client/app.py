@@ -124,9 +124,10 @@ def send_message_gui(client: dict, server: dict) -> bool:
         # send the message to the Messages server
         send_message(client_id, client_password, server, message)
     except Exception as e:
-        # delete the password since it is maybe the problem for the issue
+        # delete the password and the key derived from it since it is maybe the problem for the issue
         # maybe the user typed a wrong password
         del data.db['client_password']
+        data.db['derived_keys'].invalidate(client_id)
         print(color('Maybe the password you\'ve entered is wrong, or the problem is with the Messaging server.', CYAN))
         raise e
 
@@ -187,10 +188,16 @@ def main():
 
     except KeyboardInterrupt:
         print("\nServer shutting down...")
+
+        # logout, zeroize the keys derived from the password
+        if 'derived_keys' in data.db:
+            data.db['derived_keys'].clear()
         sys.exit()
     except Exception as e:
         print(e)
         print("\nServer shutting down...")
+        if 'derived_keys' in data.db:
+            data.db['derived_keys'].clear()
         sys.exit()
 
 
@@ -3,6 +3,8 @@ __user_creds_filename__ = 'me.info'
 __kdc_server_ip__ = '127.0.0.1'  # default
 __kdc_server_port__ = 8000  # default
 
+__derived_key_ttl__ = 15 * 60  # seconds the key derived from the password is cached
+
 
 import ipaddress
 
@@ -0,0 +1,58 @@
+"""
+Module: DerivedKeys.py
+
+This module defines the DerivedKeys class, an in-memory cache of the keys derived from the client password (PBKDF2).
+Deriving the key costs about a second, with the cache only the first ticket of a session pays for it.
+
+Keys are kept in mutable buffers so they can be zeroized when they are invalidated: on password failure, when they
+expire (TTL) and on logout.
+
+Methods:
+- __init__: Initializes an empty cache with a time to live for the keys.
+- add_key: Caches the derived key of a client.
+- get_key: Retrieves the derived key of a client, None if it is missing or expired.
+- invalidate: Zeroizes and removes the derived key of a client.
+- clear: Zeroizes and removes all the derived keys.
+"""
+
+import threading
+import time
+
+
+class DerivedKeys:
+    def __init__(self, ttl=15 * 60):
+        self.ttl = ttl
+        self.keys = {}  # client_id -> (derived key, expiration time)
+        self.lock = threading.Lock()
+
+    def add_key(self, client_id, derived_key):
+        self.invalidate(client_id)
+
+        with self.lock:
+            self.keys[client_id] = (bytearray(derived_key), time.monotonic() + self.ttl)
+
+    def get_key(self, client_id):
+        with self.lock:
+            entry = self.keys.get(client_id)
+
+        if entry is None:
+            return None
+
+        derived_key, expiration_time = entry
+        if time.monotonic() > expiration_time:
+            self.invalidate(client_id)
+            return None
+
+        return derived_key
+
+    def invalidate(self, client_id):
+        with self.lock:
+            entry = self.keys.pop(client_id, None)
+
+        if entry is not None:
+            derived_key, _ = entry
+            derived_key[:] = bytes(len(derived_key))  # zeroize
+
+    def clear(self):
+        for client_id in list(self.keys):
+            self.invalidate(client_id)
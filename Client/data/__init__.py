@@ -1,4 +1,6 @@
 from Client.data.Keys import Keys
+from Client.data.DerivedKeys import DerivedKeys
+import Client.config as cfg
 
 db = {}
 
@@ -9,10 +11,12 @@ def load_db():
 
         The database includes:
         - 'keys': An instance of the Keys class for managing symmetric keys.
+        - 'derived_keys': An instance of the DerivedKeys class caching the keys derived from the client password.
 
         """
 
     global db
     db = {
-        'keys': Keys()
+        'keys': Keys(),
+        'derived_keys': DerivedKeys(ttl=cfg.__derived_key_ttl__)
     }
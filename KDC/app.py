@@ -1,41 +1,86 @@
+import argparse
+import asyncio
+import logging
 import socket
 import sys
-import threading
+import time
 import __init__
 
 from lib.config import package_dict
-from lib.utils import receive_data, unpack_data, REQUEST, send, RESPONSE
+from lib.async_server import serve_async
+from lib.Connection import Connection
+from lib.Metrics import metrics, start_metrics_server, stop_metrics_server
+from lib.log import start_logging, log_request, dropped_records
+from lib.WorkerPool import WorkerPool
+from lib.utils import receive_data, unpack_data, pack_data, is_keep_alive, REQUEST, send, RESPONSE
 from KDC.utils import read_port_from_file
-from routes import routes
+from routes import routes, blocking_routes
+from controller import nonce_cache
+from kdf_pool import start_kdf_pool, stop_kdf_pool
+import config as cfg
 from config import __api_version__
 import db.models as models
 
+logger = logging.getLogger('kdc')
+
 
 def handle_request(connection):
     """
         Handles incoming requests from clients and Messaging servers.
 
+        A client may ask to keep the connection alive (see `lib.config.keep_alive_flag`), the connection is then left
+        open and the worker pool hands it back here when the next frame arrives.
+
+        Every request is recorded in the request metrics (lib.Metrics): decode, controller and send time, the response
+        code and the exceptions.
+
         Params:
-        - connection: The socket connection with the client or the Messaging server.
+        - connection (Connection): The connection with the client or the Messaging server.
+
+        Returns:
+        - bool: True if the connection is kept alive.
 
         Raises:
         - Exception: Raised in case of an error during request processing.
         """
 
     controller = 'undefined'
+    keep_alive = False
+    metrics_code = None  # the route of the request, once the frame is decoded
+    phase_times = {}
+    is_request = True
+    is_exception = False
+    client_id = None
+    connection.response_code, connection.send_time = None, 0.0
+    start = time.perf_counter()
     try:
         # Receive request from client
         data_receive = receive_data(connection, REQUEST)
         req = unpack_data(package_dict, REQUEST, data_receive)
 
+        # keep the connection open for the next frames if the client asked for it
+        connection.keep_alive = is_keep_alive(req['header'])
+
         req_code = str(req['header']['code'])
+        client_id = req['header']['client_id']
 
-        controller = routes.get(req_code, '0')  # 0 means, not found
+        controller = routes.get(req_code, routes['0'])  # 0 means, not found
+        metrics_code = req_code if req_code in routes else '0'
+        metrics.start_request(metrics_code)
+        controller_start = time.perf_counter()
+        phase_times['decode'] = controller_start - start
         controller(connection, req)
+        phase_times['controller'] = time.perf_counter() - controller_start - connection.send_time
+        keep_alive = connection.keep_alive
+
+    except EOFError:
+        is_request = False  # the client closed the connection
 
     except Exception as e:
-        print(f"Exception in function: {controller.__name__ or controller}")
-        print(f"Error during communication: {e}")
+        is_exception = True
+        logger.warning("Error during communication",
+                       extra={'route': metrics_code or 'undecoded', 'client_id': client_id,
+                              'controller': getattr(controller, '__name__', controller), 'error': e})
 
         # Response to client in case of error
         err_response = {
@@ -44,45 +89,167 @@ def handle_request(connection):
                 'code': 1609
             }
         }
+        connection.keep_alive = False
         send(connection, RESPONSE, err_response)
 
     finally:
-        connection.close()
+        if not keep_alive:
+            connection.close()
+
+        if is_request:
+            phase_times['send'] = connection.send_time
+            metrics.end_request(metrics_code or 'undecoded', phase_times, connection.response_code, is_exception,
+                                in_flight=metrics_code is not None)
+            log_request(logger, metrics_code or 'undecoded', client_id, connection.response_code,
+                        time.perf_counter() - start)
+
+    return keep_alive
+
+
+worker_pool = None  # the worker pool of the threads engine, exposes the queue depth and rejection counters
+
+
+def create_worker_pool():
+    """
+        Creates the worker pool serving the connections of the threads engine, with the limits from the config.
+        Connections are rejected with a prebuilt 1609 response once the accept queue is too deep.
+
+        Returns:
+        - WorkerPool: The (not started) worker pool.
+        """
+    reject_response = bytes(pack_data(package_dict, RESPONSE, {
+        'header': {
+            'version': __api_version__,
+            'code': 1609
+        }
+    }))
+
+    return WorkerPool(handle_request,
+                      size=cfg.__worker_pool_size__,
+                      queue_size=cfg.__accept_queue_size__,
+                      reject_depth=cfg.__reject_queue_depth__,
+                      reject_response=reject_response,
+                      idle_timeout=cfg.__keep_alive_timeout__,
+                      max_idle=cfg.__max_idle_connections__)
 
 
-def run_server():
+def run_server(port=None):
     """
-        Runs the Key Distribution Center (KDC) server, handling incoming connections.
+        Runs the Key Distribution Center (KDC) server, handling incoming connections with a fixed-size worker pool.
+
+        Params:
+        - port (int): The listening port, read from port.info by default.
 
         Raises:
         - KeyboardInterrupt: Raised when the server is manually interrupted, leading to a graceful shutdown.
         """
 
-    port = read_port_from_file()
+    port = read_port_from_file() if port is None else port
 
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.bind(('localhost', port))
-    server_socket.listen(10)  # Allow up to 10 queued connections
+    server_socket.listen(cfg.__listen_backlog__)
 
-    print(f"KDC server is listening on port {port}")
+    logger.info("KDC server is listening", extra={'port': port})
 
     try:
         # load database models
         models.load_db()
 
+        # hash passwords of registrations in worker processes
+        start_kdf_pool(cfg.__kdf_pool_size__, cfg.__kdf_queue_limit__)
+
+        global worker_pool
+        worker_pool = create_worker_pool()
+        worker_pool.start()
+        metrics.add_gauge('worker_pool', worker_pool.stats)
+
         while True:
             connection, address = server_socket.accept()
             # print(f"Connection established from {address}")
 
-            # Start a new thread to handle the client
-            client_handler = threading.Thread(target=handle_request, args=[connection])
-            client_handler.start()
+            # Hand the client to the worker pool, it is rejected with 1609 when the pool is overloaded
+            worker_pool.submit(Connection(connection))
 
     except KeyboardInterrupt:
-        print("\nServer shutting down...")
+        logger.info("Server shutting down")
+        stop_metrics_server()
+        stop_kdf_pool()
+        models.close_db()
         server_socket.close()
+        if worker_pool is not None:  # None if interrupted while loading the models or starting the KDF pool
+            worker_pool.shutdown()
+            logger.info("Worker pool stats", extra=worker_pool.stats())
+        sys.exit()
+
+
+def run_server_async(port=None):
+    """
+        Runs the Key Distribution Center (KDC) server with the asyncio engine, all the connections are served from a
+        single event loop and the blocking routes run in worker threads.
+
+        Params:
+        - port (int): The listening port, read from port.info by default.
+
+        Raises:
+        - KeyboardInterrupt: Raised when the server is manually interrupted, leading to a graceful shutdown.
+        """
+
+    port = read_port_from_file() if port is None else port
+
+    logger.info("KDC server (asyncio) is listening", extra={'port': port})
+
+    try:
+        # load database models
+        models.load_db()
+
+        # hash passwords of registrations in worker processes
+        start_kdf_pool(cfg.__kdf_pool_size__, cfg.__kdf_queue_limit__)
+
+        asyncio.run(serve_async('localhost', port, routes, __api_version__, blocking_routes,
+                                cfg.__listen_backlog__, cfg.__keep_alive_timeout__, logger))
+
+    except KeyboardInterrupt:
+        logger.info("Server shutting down")
+        stop_metrics_server()
+        stop_kdf_pool()
+        models.close_db()
         sys.exit()
 
 
+def parse_args():
+    """
+        Parses the command-line arguments of the KDC server.
+
+        Returns:
+        - argparse.Namespace: The parsed arguments.
+        """
+
+    parser = argparse.ArgumentParser(description="Key Distribution Center (KDC) server")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads',
+                        help="serving engine: a thread per connection or a single asyncio event loop")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve the request metrics (Prometheus text format) on http://127.0.0.1:<port>/metrics")
+    parser.add_argument('--log-level', default=cfg.__log_level__, choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="minimum level of the logs, WARNING turns off the per-request success logs")
+    parser.add_argument('--port', type=int, help="listening port, read from port.info by default")
+    parser.add_argument('--db-dir', help="directory of the db data files (all the backends), db/data by default")
+
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    run_server()
+    args = parse_args()
+    start_logging(args.log_level)
+    if args.db_dir is not None:
+        models.set_db_dir(args.db_dir)
+
+    metrics.add_gauge('nonce_cache', nonce_cache.stats)
+    metrics.add_gauge('log_dropped', dropped_records)
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port, 'kdc')
+
+    if args.engine == 'asyncio':
+        run_server_async(args.port)
+    else:
+        run_server(args.port)
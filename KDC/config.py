@@ -1 +1,35 @@
 __api_version__ = 24
+
+# Serving engine limits
+__listen_backlog__ = 128  # queued connections at the listening socket
+__worker_pool_size__ = 8  # worker threads serving connections
+__accept_queue_size__ = 256  # accepted connections waiting for a worker
+__reject_queue_depth__ = 192  # from this queue depth new connections are rejected with 1609
+__keep_alive_timeout__ = 30  # seconds a kept-alive connection may stay idle between frames
+__max_idle_connections__ = 1024  # kept-alive idle connections held by the threads engine
+
+# Password hashing (PBKDF2) process pool
+__kdf_pool_size__ = 4  # worker processes hashing passwords, 0 hashes inline on the request thread
+__kdf_queue_limit__ = 64  # pending hashes waiting for a worker process, more registrations are refused (1601)
+
+# db models persistence
+__journal_compact_threshold__ = 10000  # journal records which trigger a background compaction into the snapshot
+__journal_batch_size__ = 256  # registrations written and fsynced together by the journal flusher
+__journal_linger__ = 0.002  # seconds the journal flusher waits for more registrations before writing a batch
+
+# db models storage backend
+# 'text' (snapshot files + journal, loaded in memory), 'sqlite' or 'binary' (mmap clients records, text servers),
+# migrate the text registry with migrate.py
+__db_backend__ = 'text'
+__db_clients_path__ = '/db/data/clients'  # relative to the KDC directory, used by the text backend
+__db_servers_path__ = '/db/data/servers'  # relative to the KDC directory, used by the text and binary backends
+__db_sqlite_path__ = '/db/data/kdc.sqlite3'  # relative to the KDC directory, used by the sqlite backend
+__db_binary_clients_path__ = '/db/data/clients.bin'  # relative to the KDC directory, used by the binary backend
+__last_seen_flush_interval__ = 5  # seconds between the batched writes of the clients last_seen (write-behind)
+
+# Replay protection of the ticket requests (1027)
+__nonce_replay_window__ = 300  # seconds a (client id, nonce) is remembered, a repeated one is rejected with 1609
+__replay_cache_bloom_bits__ = 0  # bits of the replay cache Bloom filter front, 0 disables it (~10 bits per nonce)
+
+# Logging
+__log_level__ = 'INFO'  # minimum level of the logs, 'WARNING' turns off the per-request success logs
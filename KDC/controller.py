@@ -1,5 +1,6 @@
 import inspect
 import json
+import logging
 import struct
 import time
 from datetime import datetime, timedelta
@@ -7,12 +8,21 @@ from datetime import datetime, timedelta
 from Crypto.Random import get_random_bytes
 
 from lib.config import salt
-from config import __api_version__
-from lib.utils import pack_key_hex, hash_password, encrypt_aes_cbc, pack_key_base64, unpack_key_hex, unpack_key_base64, \
-    send, RESPONSE, color, RED, decrypt_aes_cbc, GREEN
+from lib.Metrics import metrics
+from lib.ReplayCache import ReplayCache
+from lib.ServerException import ServerException
+from config import __api_version__, __nonce_replay_window__, __replay_cache_bloom_bits__
+from lib.utils import pack_key_hex, encrypt_aes_cbc, pack_key_base64, unpack_key_hex, unpack_key_base64, \
+    send, RESPONSE, decrypt_aes_cbc, encrypt_aes_cbc_fields
 from KDC.utils import generate_random_uuid
+from kdf_pool import hash_password_in_pool
 import db.models as models
 
+logger = logging.getLogger('kdc')
+
+# (client id, nonce) of the ticket requests of the last window
+nonce_cache = ReplayCache(window=__nonce_replay_window__, bloom_bits=__replay_cache_bloom_bits__)
+
 
 def register_client(connection, req):
     """
@@ -33,7 +43,7 @@ def register_client(connection, req):
         # add client to clients list
         client_id = generate_random_uuid()
         name = req['payload']['name']
-        password_hash = hash_password(req['payload']['password'], salt)
+        password_hash = hash_password_in_pool(req['payload']['password'], salt)
         timestamp = time.time()
         client = {
             "client_id": client_id,
@@ -53,11 +63,11 @@ def register_client(connection, req):
                 'client_id': client_id
             }
         }
-        print(color('[SUCCESS] Client registered successfully', GREEN))
+        logger.info("Client registered", extra={'route': '1024', 'client_id': client_id})
 
     except Exception as e:
-        print(f"Exception in function: {inspect.currentframe().f_code.co_name}")
-        print(f"Exception message: {str(e)}")
+        logger.warning("Registration failed", extra={'route': '1024', 'error': e,
+                                                     'controller': inspect.currentframe().f_code.co_name})
 
         response = {
             'header': {
@@ -107,11 +117,11 @@ def register_server(connection, req):
                 'server_id': server_id
             }
         }
-        print(color('[SUCCESS] Server registered successfully', GREEN))
+        logger.info("Server registered", extra={'route': '1025', 'server_id': server_id})
 
     except Exception as e:
-        print(f"Exception in function: {inspect.currentframe().f_code.co_name}")
-        print(f"Exception message: {str(e)}")
+        logger.warning("Registration failed", extra={'route': '1025', 'error': e,
+                                                     'controller': inspect.currentframe().f_code.co_name})
 
         response = {
             'header': {
@@ -150,7 +160,8 @@ def get_servers_list(connection, req):
         response['payload']['server_port__' + str(ind)] = server['server_port']
 
     send(connection, RESPONSE, response)
-    print(color('[SUCCESS] Servers list sent', GREEN))
+    logger.info("Servers list sent", extra={'route': '1026', 'client_id': req['header']['client_id'],
+                                            'servers': len(servers_list)})
 
 
 def get_symmetric_key(connection, req):
@@ -161,37 +172,46 @@ def get_symmetric_key(connection, req):
     - connection: The socket connection with the client.
     - req (dict): The request containing client id, server id, and a nonce.
 
+    Raises:
+    - ServerException: The nonce was already used by the client during the replay window.
+
     Response:
     - Sends a response to the client containing the symmetric key and a ticket for secure communication.
     """
     # unpack request values
     client_id = req["header"]["client_id"]
     server_id = req["payload"]["server_id"]
-    nonce = req["payload"]["nonce"]  # TODO: handle nonce
+    nonce = req["payload"]["nonce"]
+
+    # a replayed request is rejected (1609)
+    if not nonce_cache.check_and_add(client_id.encode('utf-8') + nonce):
+        raise ServerException("Replayed nonce")
+
     # # Prepare response to client
     # Generate AES key SHA-256
     session_aes_key = get_random_bytes(32)
 
     # client_password_hash - a hash of the client password that he used at registration
     client_password_hash = models.db["clients"].get_password_hash_by_client_id(client_id)
+    if client_password_hash is None:
+        raise ServerException("Unknown client")
+    models.db["clients"].touch(client_id)  # written behind, no I/O on the ticket path
 
-    # Encrypted [Nonce] with [Client key]
-    iv__c, encrypted_nonce__with_c = encrypt_aes_cbc(key=client_password_hash, data=nonce)
-
-    # Encrypted [Session key] with [Client key]
-    _, encrypted_session_aes_key__with_c = encrypt_aes_cbc(key=client_password_hash, data=session_aes_key, iv=iv__c)
+    # Encrypted [Nonce] and [Session key] with [Client key], under the same IV
+    iv__c, (encrypted_nonce__with_c, encrypted_session_aes_key__with_c) = \
+        encrypt_aes_cbc_fields(key=client_password_hash, fields=(nonce, session_aes_key))
 
-    # server AES key generated at server registration
-    server_aes_key = models.db["servers"].get_aes_key_by_server_id(server_id)
-
-    # Encrypted [Session key] with [Server key]
-    ticket_iv, encrypted_session_aes_key__with_s = encrypt_aes_cbc(key=server_aes_key, data=session_aes_key)
+    # cipher of the server AES key generated at server registration, its key schedule is cached
+    server_aes_ecb = models.db["servers"].get_aes_ecb_by_server_id(server_id)
+    if server_aes_ecb is None:
+        raise ServerException("Unknown server")
 
     timestamp = time.time()
     expiration_time = str(int(time.time() + 5 * 60)).encode('utf-8')  # Now + 5 minutes (seconds) & Pack the timestamp into bytes
 
-    # Encrypt [expiration_time] with the key [server_aes_key] using the *same* IV as before
-    _, encrypted_expiration_time__with_s = encrypt_aes_cbc(key=server_aes_key, data=expiration_time, iv=ticket_iv)
+    # Encrypted [Session key] and [expiration_time] with [Server key], under the same IV
+    ticket_iv, (encrypted_session_aes_key__with_s, encrypted_expiration_time__with_s) = \
+        encrypt_aes_cbc_fields(key=server_aes_ecb, fields=(session_aes_key, expiration_time))
 
     response = {
         'header': {
@@ -216,7 +236,33 @@ def get_symmetric_key(connection, req):
     }
 
     send(connection, RESPONSE, response)
-    print(color('[SUCCESS] Symmetric key sent to client', GREEN))
+    logger.info("Symmetric key sent", extra={'route': '1027', 'client_id': client_id, 'server_id': server_id})
+
+
+def get_stats(connection, req):
+    """
+    Sends the request metrics of the KDC (see lib.Metrics) as a JSON snapshot.
+
+    Params:
+    - connection: The socket connection with the client.
+    - req (dict): The stats request.
+
+    Response:
+    - Sends a response (1606) containing the JSON snapshot of the metrics.
+    """
+
+    stats = metrics.to_json()
+    response = {
+        'header': {
+            'version': __api_version__,
+            'code': 1606,
+        }, 'payload': {
+            'stats_size': len(stats),
+            'stats': stats
+        }
+    }
+
+    send(connection, RESPONSE, response)
 
 
 def not_found_controller(connection, req):
@@ -0,0 +1,283 @@
+"""
+Module: BinaryClients.py
+
+This module defines the BinaryClients class (the binary storage backend), which manages clients information in a file of
+fixed-width binary records accessed through mmap, with an on-disk hash index. Nothing is decoded at startup and no
+client is materialized as a dict, so the start is instant and the memory use does not grow with the registry (the pages
+of the files are cached by the OS).
+
+Records file (`clients.bin`):
+    header (64 bytes): magic, records count
+    records: client_id (16 bytes), name length (1 byte), name (255 bytes), password hash (32 bytes), last_seen (double)
+The file grows by doubling its capacity. A record is flushed before the records count, so a crash never exposes a torn
+record.
+
+Index file (`clients.bin.idx`):
+    header (64 bytes): magic, slots count, clean flag
+    client_id table, name table: `slots` uint32 each, the record number + 1 (0 is an empty slot), open addressing with
+    linear probing on a blake2b hash of the key.
+The index is derived from the records: it is doubled (rebuilt) when it is half full, and rebuilt at startup if the
+previous process did not close it cleanly.
+
+Methods:
+- __init__: Opens (and creates if needed) the records and index files.
+- is_exist: Checks if a client with the same name already exists.
+- get_password_hash_by_client_id: Retrieves the password hash based on the client's ID.
+- add_client: Adds a new client, checking for existence by name and raising an exception if already present.
+- add_clients: Adds clients in bulk (migration), skipping the existing names.
+- write_last_seen: Writes a batch of last_seen in place, the records file is flushed once.
+- close: Marks the index clean and closes the files.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+from KDC.db.models.RecordAlreadyExist import RecordAlreadyExist
+from KDC.db.models.Storage import ClientsStorage
+
+HEADER_SIZE = 64
+RECORDS_MAGIC = b'KDCCLI01'
+RECORDS_HEADER = struct.Struct('<8sQ')  # magic, records count
+RECORD = struct.Struct('<16sB255s32sd')  # client_id, name length, name, password hash, last_seen
+
+INDEX_MAGIC = b'KDCIDX01'
+INDEX_HEADER = struct.Struct('<8sQB')  # magic, slots count, clean flag
+SLOT = struct.Struct('<I')
+LAST_SEEN = struct.Struct('<d')
+
+ID_OFFSET = 0
+NAME_OFFSET = 16  # the name length byte, then the name
+PASSWORD_HASH_OFFSET = 272
+LAST_SEEN_OFFSET = 304
+
+
+def key_hash(key):
+    # a stable hash (the hash() of str is salted per process), the index is shared between runs
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def page_aligned(offset):
+    return offset - offset % mmap.ALLOCATIONGRANULARITY
+
+
+class BinaryClients(ClientsStorage):
+
+    def __init__(self, file_path='/db/data/clients.bin', initial_capacity=1024):
+        """
+        Params:
+        - file_path (str): Path of the records file, relative to the working directory (like the text models files).
+        - initial_capacity (int): Number of records of a new file.
+        """
+        super().__init__()
+        self.file_path = os.getcwd()+file_path
+        self.index_path = self.file_path + '.idx'
+        self.lock = threading.Lock()
+
+        self.records_file = None
+        self.records = None
+        self.count = 0
+        self.capacity = 0
+
+        self.index_file = None
+        self.index = None
+        self.slots = 0
+
+        self.open_records(initial_capacity)
+        self.open_index()
+
+    def open_records(self, initial_capacity):
+        if not os.path.exists(self.file_path):
+            with open(self.file_path, 'wb') as file:
+                file.write(RECORDS_HEADER.pack(RECORDS_MAGIC, 0).ljust(HEADER_SIZE, b'\0'))
+                file.truncate(HEADER_SIZE + initial_capacity * RECORD.size)
+                file.flush()
+                os.fsync(file.fileno())
+
+        self.records_file = open(self.file_path, 'r+b')
+        self.records = mmap.mmap(self.records_file.fileno(), 0)
+
+        magic, self.count = RECORDS_HEADER.unpack_from(self.records, 0)
+        if magic != RECORDS_MAGIC:
+            raise ValueError(f"'{self.file_path}' is not a clients records file")
+        self.capacity = (len(self.records) - HEADER_SIZE) // RECORD.size
+
+    def open_index(self):
+        slots, clean = 0, False
+        if os.path.exists(self.index_path):
+            self.index_file = open(self.index_path, 'r+b')
+            self.index = mmap.mmap(self.index_file.fileno(), 0)
+            magic, slots, clean = INDEX_HEADER.unpack_from(self.index, 0)
+            clean = magic == INDEX_MAGIC and clean and len(self.index) == HEADER_SIZE + 2 * slots * SLOT.size
+
+        if clean and slots >= 2 * (self.count + 1):
+            self.slots = slots
+        else:
+            # first start, or the previous process crashed: the index may miss records
+            self.rebuild_index(max(slots, 1024))
+
+        # the index is dirty until it is closed
+        INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, self.slots, 0)
+        self.index.flush(0, HEADER_SIZE)
+
+    def rebuild_index(self, slots):
+        while slots < 2 * (self.count + 1):
+            slots *= 2
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, slots, 0).ljust(HEADER_SIZE, b'\0'))
+            file.truncate(HEADER_SIZE + 2 * slots * SLOT.size)
+
+        self.close_index()
+        os.replace(temp_path, self.index_path)
+
+        self.index_file = open(self.index_path, 'r+b')
+        self.index = mmap.mmap(self.index_file.fileno(), 0)
+        self.slots = slots
+        for record_number in range(self.count):
+            self.index_record(record_number)
+
+    def close_index(self):
+        if self.index is not None:
+            self.index.close()
+            self.index_file.close()
+            self.index, self.index_file = None, None
+
+    def record_offset(self, record_number):
+        return HEADER_SIZE + record_number * RECORD.size
+
+    def record_key(self, record_number, table):
+        offset = self.record_offset(record_number)
+        if table == 0:
+            return self.records[offset + ID_OFFSET:offset + ID_OFFSET + 16]
+
+        name_length = self.records[offset + NAME_OFFSET]
+        return self.records[offset + NAME_OFFSET + 1:offset + NAME_OFFSET + 1 + name_length]
+
+    def slot_offset(self, table, slot):
+        return HEADER_SIZE + (table * self.slots + slot) * SLOT.size
+
+    def find(self, table, key):
+        """
+        Finds a record in the client_id (0) or name (1) table.
+
+        Returns:
+        - int: The record number, None if there is no record with this key.
+        """
+        mask = self.slots - 1
+        slot = key_hash(key) & mask
+        while True:
+            entry, = SLOT.unpack_from(self.index, self.slot_offset(table, slot))
+            if entry == 0:
+                return None
+            if self.record_key(entry - 1, table) == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def index_record(self, record_number):
+        mask = self.slots - 1
+        for table in (0, 1):
+            slot = key_hash(self.record_key(record_number, table)) & mask
+            while SLOT.unpack_from(self.index, self.slot_offset(table, slot))[0] != 0:
+                slot = (slot + 1) & mask
+            SLOT.pack_into(self.index, self.slot_offset(table, slot), record_number + 1)
+
+    def grow_records(self):
+        capacity = max(self.capacity * 2, 1024)
+        self.records.flush()
+        self.records.close()
+        self.records_file.truncate(HEADER_SIZE + capacity * RECORD.size)
+        self.records = mmap.mmap(self.records_file.fileno(), 0)
+        self.capacity = capacity
+
+    def append_record(self, client, name):
+        if self.count == self.capacity:
+            self.grow_records()
+        if 2 * (self.count + 1) > self.slots:
+            self.rebuild_index(self.slots * 2)
+
+        offset = self.record_offset(self.count)
+        RECORD.pack_into(self.records, offset, client['client_id'].encode('utf-8'), len(name), name,
+                         client['password_hash'], float(client['last_seen']))
+        self.count += 1
+        self.index_record(self.count - 1)
+
+        return offset
+
+    def flush_count(self):
+        RECORDS_HEADER.pack_into(self.records, 0, RECORDS_MAGIC, self.count)
+        self.records.flush(0, HEADER_SIZE)
+
+    def is_exist(self, other_client):
+        with self.lock:
+            return self.find(1, other_client['name'].encode('utf-8')) is not None
+
+    def get_password_hash_by_client_id(self, client_id):
+        with self.lock:
+            record_number = self.find(0, client_id.encode('utf-8'))
+            if record_number is not None:
+                offset = self.record_offset(record_number)
+                return self.records[offset + PASSWORD_HASH_OFFSET:offset + LAST_SEEN_OFFSET]
+
+    def add_client(self, client):
+        name = client['name'].encode('utf-8')
+        if len(name) > 255:
+            raise ValueError("Client name is longer than 255 bytes")
+
+        with self.lock:
+            # check if client already exist by name
+            if self.find(1, name) is not None:
+                err_msg = "Client already exist"
+                raise RecordAlreadyExist(err_msg)
+
+            offset = self.append_record(client, name)
+
+            # the record is durable before it is counted
+            aligned = page_aligned(offset)
+            self.records.flush(aligned, offset + RECORD.size - aligned)
+            self.flush_count()
+
+    def add_clients(self, clients):
+        """
+        Adds clients in bulk, the files are flushed once.
+
+        Returns:
+        - int: Number of added clients, the clients whose name exists are skipped.
+        """
+        added = 0
+        with self.lock:
+            for client in clients:
+                name = client['name'].encode('utf-8')
+                if len(name) <= 255 and self.find(1, name) is None:
+                    self.append_record(client, name)
+                    added += 1
+
+            self.records.flush()
+            self.flush_count()
+
+        return added
+
+    def write_last_seen(self, last_seen):
+        with self.lock:
+            for client_id, timestamp in last_seen.items():
+                record_number = self.find(0, client_id.encode('utf-8'))
+                if record_number is not None:
+                    LAST_SEEN.pack_into(self.records, self.record_offset(record_number) + LAST_SEEN_OFFSET,
+                                        float(timestamp))
+            self.records.flush()
+
+    def close(self):
+        with self.lock:
+            if self.index is not None:
+                self.index.flush()
+                INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, self.slots, 1)
+                self.index.flush(0, HEADER_SIZE)
+                self.close_index()
+
+            if self.records is not None:
+                self.records.close()
+                self.records_file.close()
+                self.records, self.records_file = None, None
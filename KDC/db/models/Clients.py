@@ -1,93 +1,244 @@
+import logging
 import os
 import threading
 
+from KDC.db.models.Journal import Journal
 from KDC.db.models.RecordAlreadyExist import RecordAlreadyExist
+from KDC.db.models.Registry import Registry
+from KDC.db.models.Storage import ClientsStorage
 from lib.utils import pack_key_hex, pack_key_base64, unpack_key_hex, unpack_key_base64
 
-
 """
 Module: clients.py
 
-This module defines the Clients class, which manages clients information, including loading and saving to a file.
+This module defines the Clients class (the text storage backend), which manages clients information, including loading
+and saving to a file.
+Clients are indexed by client_id and by name (dicts), so lookups are O(1) regardless of the number of registered clients.
+The clients and their indexes are an immutable snapshot (see Registry.py) which writers replace under the lock, readers
+never take the lock.
+
+The clients file is a snapshot, every registration is appended to its journal (see Journal.py) so a registration costs
+one line of I/O regardless of the number of registered clients, and concurrent registrations share its fsync (group
+commit). The journal is compacted into the snapshot in the background once it holds `compact_threshold` records, and on
+load if it is not empty.
+
+Journal records:
+- add:<client line>: A client was registered.
+
+The last_seen of the clients, written behind in batches (see Storage.py), are kept in a sidecar snapshot
+(`<clients file>.last_seen`, one `<client_id hex>:<last_seen>` line per client) with its own journal. So heartbeat
+traffic never compacts the clients file, and the sidecar is compacted once its journal holds as many records as there are
+clients (at least `compact_threshold`), which keeps its compactions amortized O(1) per record. On load the sidecar
+overrides the last_seen of the clients file.
 
 Methods:
 - __init__: Initializes an instance of the Clients class with a default file path.
-- load_clients_from_file: Loads client information from a file.
-- save_clients_to_file: Saves client information to a file.
+- load_clients_from_file: Loads client information from the snapshot file and replays the journal.
+- save_clients_to_file: Saves client information to the snapshot file, returns True on success.
+- compact: Folds the journal into the snapshot file.
+- load_last_seen: Applies the last_seen of the sidecar snapshot and of its journal to the loaded clients.
+- compact_last_seen: Folds the last_seen journal into the sidecar snapshot.
 - is_exist: Checks if a client with the same name already exists.
 - get_password_hash_by_client_id: Retrieves the password hash based on the client's ID.
 - add_client: Adds a new client, checking for existence by name and raising an exception if already present.
+  Returns once the client is durable in the journal, the client is removed again if the write failed.
+- write_last_seen: Journals a batch of last_seen in the sidecar and publishes the updated clients.
+- close: Compacts and closes the journals.
 """
 
+logger = logging.getLogger('kdc.db')
+
+
+def client_to_line(client):
+    client_id_hex = pack_key_hex(client['client_id'].encode('utf-8'))
+    client_name = client['name']
+    password_hash_base64 = pack_key_base64(client['password_hash'])
+    last_seen = client['last_seen']
+
+    return f"{client_id_hex}:{client_name}:{password_hash_base64}:{last_seen}"
+
 
-class Clients:
+def line_to_client(line):
+    client_data = line.strip().split(':')
+    if len(client_data) != 4:
+        return None
 
-    def __init__(self, file_path='/db/data/clients'):
-        self.clients = []
+    return {
+        'client_id': unpack_key_hex(client_data[0].encode('utf-8')).decode('utf-8'),
+        'name': client_data[1],
+        'password_hash': unpack_key_base64(client_data[2].encode('utf-8')),
+        'last_seen': client_data[3]
+    }
+
+
+class Clients(ClientsStorage):
+
+    def __init__(self, file_path='/db/data/clients', compact_threshold=10000, batch_size=256, linger=0.002):
+        super().__init__()
+        self.registry = Registry('client_id')
         self.lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
         self.file_path = file_path
+        self.compact_threshold = compact_threshold
+        self.journal = Journal(os.getcwd()+self.file_path, batch_size, linger)
+        self.last_seen_journal = Journal(os.getcwd()+self.file_path+'.last_seen', batch_size, linger)
+        self.last_seen_compaction_lock = threading.Lock()
 
         self.load_clients_from_file()
 
+    @property
+    def clients(self):
+        return self.registry.records
+
     def load_clients_from_file(self):
         with self.lock:
-            clients_temp = []
+            self.journal.close()
+            self.last_seen_journal.close()
+            clients, clients_by_id = [], {}
 
             try:
                 with open(os.getcwd()+self.file_path, 'r') as file:
-
                     for line in file:
-                        client_data = line.strip().split(':')
-                        if len(client_data) == 4:
-                            client = {
-                                'client_id': unpack_key_hex(client_data[0].encode('utf-8')).decode('utf-8'),
-                                'name': client_data[1],
-                                'password_hash':  unpack_key_base64(client_data[2].encode('utf-8')),
-                                'last_seen': client_data[3]
-                            }
-                            clients_temp.append(client)
-
-                    self.clients = list(clients_temp)  # shallow copy
+                        client = line_to_client(line)
+                        if client is not None:
+                            clients.append(client)
+                            clients_by_id[client['client_id']] = client
             except (FileNotFoundError, IOError):
-                print(f"Error: Unable to load clients from file '{self.file_path}'")
+                logger.warning("Unable to load the clients snapshot", extra={'file': self.file_path})
+
+            # replay the journal, records which are already in the snapshot are skipped
+            for record in self.journal.read_records():
+                op, _, line = record.partition(':')
+                client = line_to_client(line) if op == 'add' else None
+                if client is not None and client['client_id'] not in clients_by_id:
+                    clients.append(client)
+                    clients_by_id[client['client_id']] = client
+
+            self.load_last_seen(clients_by_id)
+            self.registry = Registry('client_id', clients)
+            self.journal.open()
+            self.last_seen_journal.open()
+
+        if self.journal.records_count:
+            self.compact()
+        if self.last_seen_journal.records_count:
+            self.compact_last_seen()
+
+    def load_last_seen(self, clients_by_id):
+        lines = []
+        try:
+            with open(self.last_seen_journal.file_path, 'r') as file:
+                lines = file.read().split('\n')
+        except FileNotFoundError:
+            pass
+        except IOError:
+            logger.warning("Unable to load the last_seen snapshot", extra={'file': self.file_path + '.last_seen'})
 
-    def save_clients_to_file(self):
+        for line in lines + self.last_seen_journal.read_records():
+            client_id_hex, _, last_seen = line.strip().partition(':')
+            if not last_seen:
+                continue
+            client = clients_by_id.get(unpack_key_hex(client_id_hex.encode('utf-8')).decode('utf-8'))
+            if client is not None:
+                client['last_seen'] = last_seen
+
+    def save_clients_to_file(self, clients=None):
         try:
-            with open(os.getcwd()+self.file_path, 'w') as file:
-                for client in self.clients:
-                    client_id_hex = pack_key_hex(client['client_id'].encode('utf-8'))
-                    client_name = client['name']
-                    password_hash_base64 = pack_key_base64(client['password_hash'])
-                    last_seen = client['last_seen']
-
-                    file.write(f"{client_id_hex}:{client_name}:{password_hash_base64}:{last_seen}\n")
+            clients = self.clients if clients is None else clients
+            self.journal.write_snapshot(client_to_line(client) for client in clients)
+            return True
         except IOError:
-            print(f"Error: Unable to save clients to file '{self.file_path}'")
+            logger.error("Unable to save the clients snapshot", extra={'file': self.file_path})
         except Exception as e:
-            print(f"Error: ", e)
+            logger.error("Unable to save the clients snapshot", extra={'file': self.file_path, 'error': e})
+
+        return False
+
+    def compact(self):
+        with self.compaction_lock:
+            with self.lock:
+                self.journal.rotate()
+                clients = self.registry.records  # immutable, new registrations go to the new journal
+
+            # the journal records are removed only once they are durable in the snapshot
+            if self.save_clients_to_file(clients):
+                self.journal.finish_compaction()
+
+    def compact_last_seen(self):
+        with self.last_seen_compaction_lock:
+            with self.lock:
+                self.last_seen_journal.rotate()
+                clients = self.registry.records  # immutable, new last_seen go to the new journal
+
+            try:
+                self.last_seen_journal.write_snapshot(f"{pack_key_hex(client['client_id'].encode('utf-8'))}:"
+                                                      f"{client['last_seen']}" for client in clients)
+            except IOError as e:
+                logger.error("Unable to save the last_seen snapshot", extra={'file': self.file_path + '.last_seen',
+                                                                             'error': e})
+                return
+
+            self.last_seen_journal.finish_compaction()
 
     def is_exist(self, other_client):
-        is_exist = False
-        for client in self.clients:
-            if client["name"] == other_client["name"]:
-                is_exist = True
-                break
-                
-        return is_exist
+        return other_client["name"] in self.registry.by_name
 
     def get_password_hash_by_client_id(self, client_id):
-        for client in self.clients:
-            if client["client_id"] == client_id:
-                return client["password_hash"]
+        client = self.registry.by_id.get(client_id)
+        if client is not None:
+            return client["password_hash"]
 
     def add_client(self, client):
         with self.lock:
             # check if client already exist by name
             if self.is_exist(client):
                 err_msg = "Client already exist"
-                print(err_msg)
                 raise RecordAlreadyExist(err_msg)
             else:
-                self.clients.append(client)
-                self.save_clients_to_file()
+                # the name is reserved under the lock, the write is group committed outside of it
+                durable = self.journal.append(f"add:{client_to_line(client)}")
+                self.registry = self.registry.added(client)
 
+                should_compact = self.journal.records_count >= self.compact_threshold
+
+        try:
+            durable.result()
+        except Exception:
+            with self.lock:
+                self.registry = self.registry.removed(client)
+            raise
+
+        if should_compact and not self.compaction_lock.locked():
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def write_last_seen(self, last_seen):
+        with self.lock:
+            registry = self.registry
+            updates, durable = {}, []
+            for client_id, timestamp in last_seen.items():
+                client = registry.by_id.get(client_id)
+                if client is not None:
+                    # the published records are immutable, the updated client is a copy
+                    updates[client_id] = dict(client, last_seen=timestamp)
+                    client_id_hex = pack_key_hex(client_id.encode('utf-8'))
+                    durable.append(self.last_seen_journal.append(f"{client_id_hex}:{timestamp}"))
+
+            self.registry = registry.updated(updates)
+            should_compact = self.last_seen_journal.records_count >= max(self.compact_threshold, len(registry.ids))
+
+        for future in durable:
+            future.result()
+
+        if should_compact and not self.last_seen_compaction_lock.locked():
+            threading.Thread(target=self.compact_last_seen, daemon=True).start()
+
+    def close(self):
+        # fold the journal into the snapshot, the next start does not have to replay it
+        if self.journal.file is not None:
+            self.compact()
+        if self.last_seen_journal.file is not None:
+            self.compact_last_seen()
+
+        with self.lock:
+            self.journal.close()
+            self.last_seen_journal.close()
@@ -0,0 +1,236 @@
+"""
+Module: Journal.py
+
+This module defines the Journal class, the append-only persistence of a db model.
+
+A model is persisted as a snapshot file (one line per record, the same format as before) plus a journal file next to it
+(`<snapshot>.journal`) with one line per mutation. A mutation only costs appending a single line, instead of rewriting
+the whole file.
+
+Appends are group committed: `append` only queues the record and returns a future, a single flusher thread writes the
+queued records together (up to `batch_size`, waiting up to `linger` seconds for more) and fsyncs them once. The future
+is resolved when its batch is durable, or fails with the write error (the batch is then truncated from the journal). So
+concurrent mutations share an fsync instead of queueing for one each.
+
+Compaction folds the journal into a new snapshot:
+    1. rotate: under the model lock, the journal is renamed to `<snapshot>.journal.old` and a fresh journal is opened,
+       so new mutations never wait for the compaction.
+    2. write_snapshot: the snapshot is written to a temporary file, fsynced and atomically renamed over the old one.
+    3. finish_compaction: the old journal is removed.
+
+Recovery reads the snapshot, then the old journal (if a compaction was interrupted) and the journal. A torn last line
+(a crash in the middle of an append) is ignored. Replaying a record which is already in the snapshot must be a no-op for
+the model, so a crash between steps 2 and 3 is harmless.
+
+Methods:
+- __init__: Initializes the journal of a snapshot file.
+- open: Drops a torn last record, opens the journal for appending and starts the flusher thread.
+- read_records: Reads the records of the old journal and of the journal.
+- append: Queues a record, returns a future resolved once it is durable.
+- flush_batches: The flusher thread, writes and fsyncs the queued records in batches.
+- drain: Waits until every queued record is written.
+- rotate: Starts a compaction, moves the journal records aside.
+- write_snapshot: Writes a snapshot atomically.
+- finish_compaction: Removes the journal records which are in the snapshot.
+- close: Writes the queued records, stops the flusher thread and closes the journal file.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+def fsync_directory(path):
+    """
+    Fsync the directory of a path so a rename in it is durable. Not supported (nor needed) on Windows.
+    """
+    try:
+        directory_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(directory_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(directory_fd)
+
+
+class Journal:
+
+    def __init__(self, file_path, batch_size=256, linger=0.002):
+        """
+        Params:
+        - file_path (str): Path of the snapshot file.
+        - batch_size (int): Maximum number of records written and fsynced together.
+        - linger (float): Seconds the flusher waits for more records before writing a batch which is not full.
+        """
+        self.file_path = file_path
+        self.journal_path = file_path + '.journal'
+        self.old_journal_path = self.journal_path + '.old'
+        self.batch_size = batch_size
+        self.linger = linger
+        self.file = None
+        self.records_count = 0
+
+        self.condition = threading.Condition()
+        self.pending = []  # [(record, future), ...] waiting for the flusher
+        self.writing = False
+        self.flusher = None
+
+    def open(self):
+        # drop a torn last record, left by a crash in the middle of an append
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb+') as file:
+                content = file.read()
+                if content and not content.endswith(b'\n'):
+                    file.truncate(content.rfind(b'\n') + 1)
+
+        self.file = open(self.journal_path, 'a', encoding='utf-8')
+        self.records_count = len(self.read_records())
+
+        self.flusher = threading.Thread(target=self.flush_batches, name=f"journal-{os.path.basename(self.file_path)}",
+                                        daemon=True)
+        self.flusher.start()
+
+    def read_records(self):
+        records = []
+        for path in (self.old_journal_path, self.journal_path):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    lines = file.read().split('\n')
+            except FileNotFoundError:
+                continue
+
+            records += [line for line in lines[:-1] if line]  # the last item is empty or a torn record
+
+        return records
+
+    def append(self, record):
+        """
+        Queue a record for the flusher thread.
+        Records are written in the order they are appended, so appending under the model lock keeps the journal in the
+        order of the model.
+
+        Params:
+        - record (str): The record, without a newline.
+
+        Returns:
+        - Future: Resolved once the record is durable, raises the write error if its batch failed.
+        """
+        future = Future()
+        with self.condition:
+            if self.file is None:
+                raise IOError(f"Journal '{self.journal_path}' is closed")
+            self.pending.append((record, future))
+            self.records_count += 1
+            self.condition.notify_all()
+
+        return future
+
+    def flush_batches(self):
+        while True:
+            with self.condition:
+                while not self.pending and self.file is not None:
+                    self.condition.wait()
+                if not self.pending:  # closed
+                    return
+
+                # linger for more records, a fuller batch shares the fsync between more writers
+                deadline = time.monotonic() + self.linger
+                while len(self.pending) < self.batch_size and self.file is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                self.writing = True
+                file = self.file
+
+            error = None
+            try:
+                position = file.tell()
+                try:
+                    file.write(''.join(record + '\n' for record, _ in batch))
+                    file.flush()
+                    os.fsync(file.fileno())
+                except Exception:
+                    # do not leave a partially written batch behind the next one
+                    file.seek(position)
+                    file.truncate()
+                    raise
+            except Exception as e:
+                error = e
+
+            with self.condition:
+                self.writing = False
+                if error is not None:
+                    self.records_count -= len(batch)
+                self.condition.notify_all()
+
+            for _, future in batch:
+                if error is None:
+                    future.set_result(True)
+                else:
+                    future.set_exception(error)
+
+    def drain(self):
+        with self.condition:
+            while self.pending or self.writing:
+                self.condition.wait()
+
+    def rotate(self):
+        # the queued records belong to the rotated journal, the caller holds the model lock so no more are appended
+        self.drain()
+
+        with self.condition:
+            self.file.close()
+
+            if os.path.exists(self.old_journal_path):
+                # a previous compaction did not finish, keep its records too
+                with open(self.journal_path, 'r', encoding='utf-8') as journal, \
+                        open(self.old_journal_path, 'a', encoding='utf-8') as old_journal:
+                    old_journal.write(journal.read())
+                    old_journal.flush()
+                    os.fsync(old_journal.fileno())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.old_journal_path)
+            fsync_directory(self.journal_path)
+
+            self.file = open(self.journal_path, 'a', encoding='utf-8')
+            self.records_count = 0
+
+    def write_snapshot(self, lines):
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for line in lines:
+                file.write(line + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp_path, self.file_path)
+        fsync_directory(self.file_path)
+
+    def finish_compaction(self):
+        if os.path.exists(self.old_journal_path):
+            os.remove(self.old_journal_path)
+            fsync_directory(self.old_journal_path)
+
+    def close(self):
+        with self.condition:
+            while self.pending or self.writing:
+                self.condition.wait()
+
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.condition.notify_all()
+
+        if self.flusher is not None and self.flusher is not threading.current_thread():
+            self.flusher.join()
+            self.flusher = None
@@ -0,0 +1,198 @@
+"""
+Module: Registry.py
+
+This module defines the Registry class, an immutable snapshot of the records of a db model and of their indexes.
+
+The text models keep their records in a registry which is never modified: a writer builds a new registry (under the
+model lock) and swaps it in with a single attribute assignment. A reader takes the current registry once and does all
+its lookups on it, so the hot read paths (1026, 1027) never take a lock and never see a record in one index and not in
+the other.
+
+A new registry shares almost all its memory with the previous one (structural sharing): the indexes are split in
+`INDEX_SHARDS` shards by the hash of the key and a write copies only the shards it touches, the registration order is a
+list of ids in chunks of `IDS_CHUNK` and an append copies only the last chunk. So a write costs about n / 1024 copied
+entries instead of n (a few microseconds at a million clients) and the write throughput of the journal group commit is
+kept. Removing a record (the rollback of a failed journal write) rebuilds the registration order, O(n).
+
+Classes:
+- SharedMap: Immutable mapping whose versions share their unmodified shards.
+- SharedList: Immutable list whose versions share their full chunks.
+- Records: Read-only sequence of the records of a registry, in registration order.
+- Registry: The records of a model and their indexes by id and by name.
+"""
+
+from collections.abc import Mapping, Sequence
+
+INDEX_SHARDS = 1024  # shards of an index, a write copies the written shards and the tuple of the shards
+IDS_CHUNK = 1024  # ids per chunk of the registration order, an append copies the last chunk and the tuple of chunks
+
+
+class SharedMap(Mapping):
+    __slots__ = ('shards', 'size')
+
+    def __init__(self, items=(), shards=None, size=0):
+        """
+        Params:
+        - items (Iterable[tuple]): The (key, value) items, ignored if the shards are given.
+        - shards (tuple[dict]): The shards of an existing map, never modified once shared.
+        - size (int): The number of items of the shards.
+        """
+        if shards is None:
+            shards = tuple({} for _ in range(INDEX_SHARDS))
+            for key, value in items:
+                shards[hash(key) % INDEX_SHARDS][key] = value
+            size = sum(len(shard) for shard in shards)
+
+        self.shards = shards
+        self.size = size
+
+    def __getitem__(self, key):
+        return self.shards[hash(key) % INDEX_SHARDS][key]
+
+    def get(self, key, default=None):
+        return self.shards[hash(key) % INDEX_SHARDS].get(key, default)
+
+    def __contains__(self, key):
+        return key in self.shards[hash(key) % INDEX_SHARDS]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def updated(self, items):
+        """
+        Returns a new map with the items (key, value) set, the shards which are not written are shared.
+        """
+        shards, copied, size = list(self.shards), set(), self.size
+        for key, value in items:
+            index = hash(key) % INDEX_SHARDS
+            if index not in copied:
+                shards[index] = dict(shards[index])
+                copied.add(index)
+            size += key not in shards[index]
+            shards[index][key] = value
+
+        return SharedMap(shards=tuple(shards), size=size)
+
+    def removed(self, key):
+        index = hash(key) % INDEX_SHARDS
+        if key not in self.shards[index]:
+            return self
+
+        shard = dict(self.shards[index])
+        del shard[key]
+        return SharedMap(shards=self.shards[:index] + (shard,) + self.shards[index + 1:], size=self.size - 1)
+
+
+class SharedList(Sequence):
+    __slots__ = ('chunks', 'size')
+
+    def __init__(self, items=(), chunks=None, size=0):
+        """
+        Params:
+        - items (Iterable): The items, ignored if the chunks are given.
+        - chunks (tuple[tuple]): The chunks of an existing list, all of them full but the last one.
+        - size (int): The number of items of the chunks.
+        """
+        if chunks is None:
+            items = tuple(items)
+            chunks = tuple(items[start:start + IDS_CHUNK] for start in range(0, len(items), IDS_CHUNK))
+            size = len(items)
+
+        self.chunks = chunks
+        self.size = size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("SharedList index out of range")
+
+        return self.chunks[index // IDS_CHUNK][index % IDS_CHUNK]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def appended(self, item):
+        if self.chunks and len(self.chunks[-1]) < IDS_CHUNK:
+            chunks = self.chunks[:-1] + (self.chunks[-1] + (item,),)
+        else:
+            chunks = self.chunks + ((item,),)
+
+        return SharedList(chunks=chunks, size=self.size + 1)
+
+    def removed(self, item):
+        return SharedList(other for other in self if other != item)
+
+
+class Records(Sequence):
+    __slots__ = ('ids', 'by_id')
+
+    def __init__(self, ids, by_id):
+        self.ids = ids
+        self.by_id = by_id
+
+    def __getitem__(self, index):
+        return self.by_id[self.ids[index]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        by_id = self.by_id
+        for record_id in self.ids:
+            yield by_id[record_id]
+
+
+class Registry:
+    __slots__ = ('id_key', 'ids', 'by_id', 'by_name')
+
+    def __init__(self, id_key, records=(), ids=None, by_id=None, by_name=None):
+        """
+        Params:
+        - id_key (str): The id field of the records ('client_id', 'server_id').
+        - records (Iterable[dict]): The records, in registration order, ignored if the indexes are given.
+        - ids (SharedList): The ids of the records in registration order.
+        - by_id (SharedMap): Index of the records by id.
+        - by_name (SharedMap): Index of the records by name.
+        """
+        self.id_key = id_key
+        if ids is None:
+            records = tuple(records)
+            ids = SharedList(record[id_key] for record in records)
+            by_id = SharedMap((record[id_key], record) for record in records)
+            by_name = SharedMap((record['name'], record) for record in records)
+
+        self.ids = ids
+        self.by_id = by_id
+        self.by_name = by_name
+
+    @property
+    def records(self):
+        return Records(self.ids, self.by_id)
+
+    def added(self, record):
+        return Registry(self.id_key, ids=self.ids.appended(record[self.id_key]),
+                        by_id=self.by_id.updated(((record[self.id_key], record),)),
+                        by_name=self.by_name.updated(((record['name'], record),)))
+
+    def removed(self, record):
+        return Registry(self.id_key, ids=self.ids.removed(record[self.id_key]),
+                        by_id=self.by_id.removed(record[self.id_key]), by_name=self.by_name.removed(record['name']))
+
+    def updated(self, updates):
+        """
+        Params:
+        - updates (dict): id -> the updated copy of the record with this id, the unknown ids are ignored.
+        """
+        updates = {record_id: record for record_id, record in updates.items() if record_id in self.by_id}
+
+        return Registry(self.id_key, ids=self.ids, by_id=self.by_id.updated(updates.items()),
+                        by_name=self.by_name.updated((record['name'], record) for record in updates.values()))
@@ -1,82 +1,139 @@
 """
 Module: servers.py
 
-This module defines the Servers class, which manages servers information, including loading and saving to a file.
+This module defines the Servers class (the text storage backend), which manages servers information, including loading
+and saving to a file.
+Servers are indexed by server_id and by name (dicts), so lookups are O(1) regardless of the number of registered servers.
+The servers and their indexes are an immutable snapshot (see Registry.py) which writers replace under the lock, readers
+never take the lock.
+
+The servers file is a snapshot, every registration is appended to its journal (see Journal.py) so a registration costs
+one line of I/O regardless of the number of registered servers, and concurrent registrations share its fsync (group
+commit). The journal is compacted into the snapshot in the background once it holds `compact_threshold` records, and on
+load if it is not empty.
+
+Journal records:
+- add:<server line>: A server was registered.
 
 Methods:
 - __init__: Initializes an instance of the Servers class with a default file path.
-- load_servers_from_file: Loads server information from a file.
-- save_servers_to_file: Saves server information to a file.
+- load_servers_from_file: Loads server information from the snapshot file and replays the journal.
+- save_servers_to_file: Saves server information to the snapshot file, returns True on success.
+- compact: Folds the journal into the snapshot file.
 - is_exist: Checks if a server with the same server_id already exists.
 - get_all_servers: Retrieves information about all servers.
 - get_aes_key_by_server_id: Retrieves the AES key based on the server's ID.
 - add_server: Adds a new server, checking for existence by name and raising an exception if already present.
+  Returns once the server is durable in the journal, the server is removed again if the write failed.
+- close: Compacts and closes the journal.
 """
 
+import logging
 import os
 import threading
 
+from KDC.db.models.Journal import Journal
 from KDC.db.models.RecordAlreadyExist import RecordAlreadyExist
+from KDC.db.models.Registry import Registry
+from KDC.db.models.Storage import ServersStorage
 from lib.utils import pack_key_hex, pack_key_base64, unpack_key_hex, unpack_key_base64
 
+logger = logging.getLogger('kdc.db')
+
+
+def server_to_line(server):
+    server_id_hex = pack_key_hex(server['server_id'].encode('utf-8'))
+    server_name = server['name']
+    server_ip = server['server_ip']
+    server_port = server['server_port']
+    server_aes_key_base64 = pack_key_base64(server['aes_key'])
+
+    return f"{server_id_hex}:{server_name}:{server_ip}:{server_port}:{server_aes_key_base64}"
+
 
-class Servers:
+def line_to_server(line):
+    server_data = line.strip().split(':')
+    if len(server_data) != 5:
+        return None
 
-    def __init__(self, file_path='/db/data/servers'):
-        self.servers = []
+    return {
+        'server_id': unpack_key_hex(server_data[0].encode('utf-8')).decode('utf-8'),
+        'name': server_data[1],
+        'server_ip': server_data[2],
+        'server_port': int(server_data[3]),
+        'aes_key': unpack_key_base64(server_data[4].encode('utf-8')),
+    }
+
+
+class Servers(ServersStorage):
+
+    def __init__(self, file_path='/db/data/servers', compact_threshold=10000, batch_size=256, linger=0.002):
+        self.registry = Registry('server_id')
         self.lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
         self.file_path = file_path
+        self.compact_threshold = compact_threshold
+        self.journal = Journal(os.getcwd()+self.file_path, batch_size, linger)
 
         self.load_servers_from_file()
 
+    @property
+    def servers(self):
+        return self.registry.records
+
     def load_servers_from_file(self):
         with self.lock:
-            servers_temp = []
+            self.journal.close()
+            servers, server_ids = [], set()
 
             try:
                 with open(os.getcwd()+self.file_path, 'r') as file:
                     for line in file:
-                        server_data = line.strip().split(':')
-                        if len(server_data) == 5:
-                            server = {
-                                'server_id': unpack_key_hex(server_data[0].encode('utf-8')).decode('utf-8'),
-                                'name': server_data[1],
-                                'server_ip': server_data[2],
-                                'server_port': int(server_data[3]),
-                                'aes_key': unpack_key_base64(server_data[4].encode('utf-8')),
-                            }
-                            servers_temp.append(server)
-
-                    self.servers = list(servers_temp)  # shallow copy
+                        server = line_to_server(line)
+                        if server is not None:
+                            servers.append(server)
+                            server_ids.add(server['server_id'])
             except (FileNotFoundError, IOError):
-                print(f"Error: Unable to load servers from file '{self.file_path}'")
-
-    def save_servers_to_file(self):
-        with self.lock:
-            try:
-                with open(os.getcwd()+self.file_path, 'w') as file:
-                    for server in self.servers:
-                        server_id_hex = pack_key_hex(server['server_id'].encode('utf-8'))
-                        server_name = server['name']
-                        server_ip = server['server_ip']
-                        server_port = server['server_port']
-                        server_aes_key_base64 = pack_key_base64(server['aes_key'])
-
-                        file.write(f"{server_id_hex}:{server_name}:{server_ip}:{server_port}:{server_aes_key_base64}\n")
-
-            except IOError:
-                print(f"Error: Unable to save servers to file '{self.file_path}'")
-            except Exception as e:
-                print(f"Error: ", e)
+                logger.warning("Unable to load the servers snapshot", extra={'file': self.file_path})
+
+            # replay the journal, records which are already in the snapshot are skipped
+            for record in self.journal.read_records():
+                op, _, line = record.partition(':')
+                server = line_to_server(line) if op == 'add' else None
+                if server is not None and server['server_id'] not in server_ids:
+                    servers.append(server)
+                    server_ids.add(server['server_id'])
+
+            self.registry = Registry('server_id', servers)
+            self.journal.open()
+
+        if self.journal.records_count:
+            self.compact()
+
+    def save_servers_to_file(self, servers=None):
+        try:
+            servers = self.servers if servers is None else servers
+            self.journal.write_snapshot(server_to_line(server) for server in servers)
+            return True
+        except IOError:
+            logger.error("Unable to save the servers snapshot", extra={'file': self.file_path})
+        except Exception as e:
+            logger.error("Unable to save the servers snapshot", extra={'file': self.file_path, 'error': e})
+
+        return False
+
+    def compact(self):
+        with self.compaction_lock:
+            with self.lock:
+                self.journal.rotate()
+                servers = self.registry.records  # immutable, new registrations go to the new journal
+
+            # the journal records are removed only once they are durable in the snapshot
+            if self.save_servers_to_file(servers):
+                self.journal.finish_compaction()
 
     def is_exist(self, other_server):
-        is_exist = False
-        for server in self.servers:
-            if server["name"] == other_server["name"]:
-                is_exist = True
-                break
-
-        return is_exist
+        return other_server["name"] in self.registry.by_name
 
     def get_all_servers(self):
         servers_list = []
@@ -91,16 +148,37 @@ class Servers:
         return servers_list
 
     def get_aes_key_by_server_id(self, server_id):
-        for server in self.servers:
-            if server["server_id"] == server_id:
-                return server["aes_key"]
+        server = self.registry.by_id.get(server_id)
+        if server is not None:
+            return server["aes_key"]
 
     def add_server(self, server):
-        # check if client already exist by name
-        if self.is_exist(server):
-            err_msg = "Server already exist"
-            print(err_msg)
-            raise RecordAlreadyExist(err_msg)
-        else:
-            self.servers.append(server)
-            self.save_servers_to_file()
+        with self.lock:
+            # check if client already exist by name
+            if self.is_exist(server):
+                err_msg = "Server already exist"
+                raise RecordAlreadyExist(err_msg)
+            else:
+                # the name is reserved under the lock, the write is group committed outside of it
+                durable = self.journal.append(f"add:{server_to_line(server)}")
+                self.registry = self.registry.added(server)
+
+                should_compact = self.journal.records_count >= self.compact_threshold
+
+        try:
+            durable.result()
+        except Exception:
+            with self.lock:
+                self.registry = self.registry.removed(server)
+            raise
+
+        if should_compact and not self.compaction_lock.locked():
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def close(self):
+        # fold the journal into the snapshot, the next start does not have to replay it
+        if self.journal.file is not None:
+            self.compact()
+
+        with self.lock:
+            self.journal.close()
@@ -0,0 +1,60 @@
+"""
+Module: SqliteClients.py
+
+This module defines the SqliteClients class (the sqlite storage backend), which manages clients information in the
+clients table of the KDC SQLite database. Nothing is loaded in memory, lookups use the client_id (primary key) and name
+(unique) indexes.
+
+Methods:
+- __init__: Initializes an instance of the SqliteClients class with the shared database.
+- is_exist: Checks if a client with the same name already exists.
+- get_password_hash_by_client_id: Retrieves the password hash based on the client's ID.
+- add_client: Adds a new client, raising an exception if a client with the same name is already present.
+- write_last_seen: Updates a batch of last_seen in one transaction.
+- close: Closes the database.
+"""
+
+import sqlite3
+
+from KDC.db.models.RecordAlreadyExist import RecordAlreadyExist
+from KDC.db.models.Storage import ClientsStorage
+
+SELECT_BY_NAME = "SELECT 1 FROM clients WHERE name = ?"
+SELECT_PASSWORD_HASH = "SELECT password_hash FROM clients WHERE client_id = ?"
+INSERT_CLIENT = "INSERT INTO clients (client_id, name, password_hash, last_seen) VALUES (?, ?, ?, ?)"
+UPDATE_LAST_SEEN = "UPDATE clients SET last_seen = ? WHERE client_id = ?"
+
+
+class SqliteClients(ClientsStorage):
+
+    def __init__(self, database):
+        """
+        Params:
+        - database (SqliteDatabase): The KDC database.
+        """
+        super().__init__()
+        self.database = database
+
+    def is_exist(self, other_client):
+        return self.database.query_one(SELECT_BY_NAME, (other_client['name'],)) is not None
+
+    def get_password_hash_by_client_id(self, client_id):
+        row = self.database.query_one(SELECT_PASSWORD_HASH, (client_id,))
+        if row is not None:
+            return row[0]
+
+    def add_client(self, client):
+        try:
+            self.database.write(INSERT_CLIENT, (client['client_id'], client['name'], client['password_hash'],
+                                                float(client['last_seen'])))
+        except sqlite3.IntegrityError:
+            # the name is unique
+            err_msg = "Client already exist"
+            raise RecordAlreadyExist(err_msg)
+
+    def write_last_seen(self, last_seen):
+        self.database.write_many(UPDATE_LAST_SEEN, ((float(timestamp), client_id)
+                                                    for client_id, timestamp in last_seen.items()))
+
+    def close(self):
+        self.database.close()
@@ -0,0 +1,100 @@
+"""
+Module: SqliteDatabase.py
+
+This module defines the SqliteDatabase class, the SQLite database shared by the sqlite storage backend models.
+
+The database runs in WAL mode, so the worker threads read concurrently (each thread has its own connection) while a
+registration is written. Writes are serialized by a lock instead of waiting on SQLite busy errors. The statements are
+constant parameterized SQL, so they are prepared once per connection and reused from the sqlite3 statement cache.
+
+Methods:
+- __init__: Opens (and creates if needed) the database.
+- connection: Returns the connection of the calling thread.
+- query_one: Runs a read statement, returns its first row.
+- query_all: Runs a read statement, returns all its rows.
+- write: Runs a write statement in its own transaction.
+- write_many: Runs a write statement for a batch of parameters in one transaction.
+- close: Closes the connections of all the threads.
+"""
+
+import os
+import sqlite3
+import threading
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS clients (
+        client_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        password_hash BLOB NOT NULL,
+        last_seen REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS servers (
+        server_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        server_ip TEXT NOT NULL,
+        server_port INTEGER NOT NULL,
+        aes_key BLOB NOT NULL
+    )
+    """,
+)
+
+
+class SqliteDatabase:
+
+    def __init__(self, file_path='/db/data/kdc.sqlite3', cached_statements=128):
+        """
+        Params:
+        - file_path (str): Path of the database, relative to the working directory (like the text models files).
+        - cached_statements (int): Size of the prepared statements cache of each connection.
+        """
+        self.file_path = os.getcwd()+file_path
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path, timeout=30, check_same_thread=False,
+                                         cached_statements=self.cached_statements)
+            connection.execute("PRAGMA synchronous=FULL")  # a registration is durable once it is acknowledged
+            self.local.connection = connection
+            with self.connections_lock:
+                self.connections.append(connection)
+
+        return connection
+
+    def query_one(self, statement, params=()):
+        return self.connection().execute(statement, params).fetchone()
+
+    def query_all(self, statement, params=()):
+        return self.connection().execute(statement, params).fetchall()
+
+    def write(self, statement, params=()):
+        connection = self.connection()
+        with self.write_lock, connection:  # commits, or rolls back on error
+            connection.execute(statement, params)
+
+    def write_many(self, statement, params_batch):
+        connection = self.connection()
+        with self.write_lock, connection:
+            connection.executemany(statement, params_batch)
+
+    def close(self):
+        with self.connections_lock:
+            connections, self.connections = self.connections, []
+
+        for connection in connections:
+            connection.close()
+        self.local = threading.local()
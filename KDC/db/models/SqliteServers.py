@@ -0,0 +1,63 @@
+"""
+Module: SqliteServers.py
+
+This module defines the SqliteServers class (the sqlite storage backend), which manages servers information in the
+servers table of the KDC SQLite database. Nothing is loaded in memory, lookups use the server_id (primary key) and name
+(unique) indexes.
+
+Methods:
+- __init__: Initializes an instance of the SqliteServers class with the shared database.
+- is_exist: Checks if a server with the same name already exists.
+- get_all_servers: Retrieves information about all servers.
+- get_aes_key_by_server_id: Retrieves the AES key based on the server's ID.
+- add_server: Adds a new server, raising an exception if a server with the same name is already present.
+- close: Closes the database.
+"""
+
+import sqlite3
+
+from KDC.db.models.RecordAlreadyExist import RecordAlreadyExist
+from KDC.db.models.Storage import ServersStorage
+
+SELECT_BY_NAME = "SELECT 1 FROM servers WHERE name = ?"
+SELECT_ALL = "SELECT server_id, name, server_ip, server_port FROM servers ORDER BY rowid"
+SELECT_AES_KEY = "SELECT aes_key FROM servers WHERE server_id = ?"
+INSERT_SERVER = "INSERT INTO servers (server_id, name, server_ip, server_port, aes_key) VALUES (?, ?, ?, ?, ?)"
+
+
+class SqliteServers(ServersStorage):
+
+    def __init__(self, database):
+        """
+        Params:
+        - database (SqliteDatabase): The KDC database.
+        """
+        self.database = database
+
+    def is_exist(self, other_server):
+        return self.database.query_one(SELECT_BY_NAME, (other_server['name'],)) is not None
+
+    def get_all_servers(self):
+        return [{
+            "server_id": server_id,
+            "name": name,
+            "server_ip": server_ip,
+            "server_port": server_port
+        } for server_id, name, server_ip, server_port in self.database.query_all(SELECT_ALL)]
+
+    def get_aes_key_by_server_id(self, server_id):
+        row = self.database.query_one(SELECT_AES_KEY, (server_id,))
+        if row is not None:
+            return row[0]
+
+    def add_server(self, server):
+        try:
+            self.database.write(INSERT_SERVER, (server['server_id'], server['name'], server['server_ip'],
+                                                int(server['server_port']), server['aes_key']))
+        except sqlite3.IntegrityError:
+            # the name is unique
+            err_msg = "Server already exist"
+            raise RecordAlreadyExist(err_msg)
+
+    def close(self):
+        self.database.close()
@@ -0,0 +1,149 @@
+"""
+Module: Storage.py
+
+This module defines the storage interface of the KDC db models, the controllers only use these methods so the storage
+backend (see `__db_backend__` in the KDC config) can be replaced without touching them.
+
+Backends:
+- text: Clients/Servers, colon-delimited snapshot files with an append-only journal, loaded in memory.
+- sqlite: SqliteClients/SqliteServers, a single SQLite database, nothing is loaded in memory.
+- binary: BinaryClients (fixed-width records through mmap, nothing is loaded in memory) and the text Servers.
+
+The last_seen of the clients is written behind: a ticket request only records it in memory (`touch`), the latest
+timestamp of every touched client is written by `flush_last_seen` in a single batch, periodically and on shutdown (see
+`__last_seen_flush_interval__` in the KDC config). A crash loses at most one interval of last_seen updates.
+
+Classes:
+- ClientsStorage: Storage of the registered clients.
+- ServersStorage: Storage of the registered messaging servers.
+"""
+
+import abc
+import logging
+import threading
+import time
+
+from lib.utils import get_server_aes_ecb
+
+logger = logging.getLogger('kdc.db')
+
+
+class ClientsStorage(abc.ABC):
+
+    def __init__(self):
+        self.last_seen_dirty = {}  # client_id -> latest last_seen, not written yet
+        self.last_seen_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def is_exist(self, other_client):
+        """
+        Returns:
+        - bool: True if a client with the same name is registered.
+        """
+
+    @abc.abstractmethod
+    def get_password_hash_by_client_id(self, client_id):
+        """
+        Returns:
+        - bytes: The password hash of the client, None if the client is not registered.
+        """
+
+    @abc.abstractmethod
+    def add_client(self, client):
+        """
+        Adds a client, returns once it is durable.
+
+        Raises:
+        - RecordAlreadyExist: A client with the same name is registered.
+        """
+
+    def touch(self, client_id, timestamp=None):
+        """
+        Records the activity of a client in memory, it is written by the next `flush_last_seen`. Only called for a
+        registered client (once its lookup succeeded), so unknown ids are never buffered.
+        """
+        with self.last_seen_lock:
+            self.last_seen_dirty[client_id] = time.time() if timestamp is None else timestamp
+
+    def flush_last_seen(self):
+        """
+        Writes the last_seen of the clients touched since the previous flush, in one batch.
+
+        Returns:
+        - int: Number of flushed clients.
+        """
+        with self.last_seen_lock:
+            dirty, self.last_seen_dirty = self.last_seen_dirty, {}
+
+        if dirty:
+            try:
+                self.write_last_seen(dirty)
+            except Exception as e:
+                # last_seen is activity data, it is not worth failing (or retrying) the requests for
+                logger.error("Unable to write the last_seen", extra={'clients': len(dirty), 'error': e})
+
+        return len(dirty)
+
+    @abc.abstractmethod
+    def write_last_seen(self, last_seen):
+        """
+        Writes a batch of last_seen, the unknown client ids are ignored.
+
+        Params:
+        - last_seen (dict): client_id -> last_seen timestamp.
+        """
+
+    @abc.abstractmethod
+    def close(self):
+        """
+        Writes what is pending and releases the storage, called on shutdown.
+        """
+
+
+class ServersStorage(abc.ABC):
+
+    @abc.abstractmethod
+    def is_exist(self, other_server):
+        """
+        Returns:
+        - bool: True if a server with the same name is registered.
+        """
+
+    @abc.abstractmethod
+    def get_all_servers(self):
+        """
+        Returns:
+        - list: The servers (server_id, name, server_ip, server_port), without their keys.
+        """
+
+    @abc.abstractmethod
+    def get_aes_key_by_server_id(self, server_id):
+        """
+        Returns:
+        - bytes: The AES key of the server, None if the server is not registered.
+        """
+
+    def get_aes_ecb_by_server_id(self, server_id):
+        """
+        Returns:
+        - The AES cipher (ECB mode) of the server key, cached across the tickets of the server (see
+          lib.utils.get_server_aes_ecb), None if the server is not registered.
+        """
+        server_aes_key = self.get_aes_key_by_server_id(server_id)
+        if server_aes_key is not None:
+            return get_server_aes_ecb(bytes(server_aes_key))
+
+    @abc.abstractmethod
+    def add_server(self, server):
+        """
+        Adds a server, returns once it is durable.
+
+        Raises:
+        - RecordAlreadyExist: A server with the same name is registered.
+        """
+
+    @abc.abstractmethod
+    def close(self):
+        """
+        Writes what is pending and releases the storage, called on shutdown.
+        """
@@ -1,12 +1,108 @@
 from KDC.db.models.Clients import Clients
 from KDC.db.models.Servers import Servers
+from KDC.db.models.SqliteDatabase import SqliteDatabase
+from KDC.db.models.SqliteClients import SqliteClients
+from KDC.db.models.SqliteServers import SqliteServers
+from KDC.db.models.BinaryClients import BinaryClients
+import os
+import threading
+
+import KDC.config as cfg
 
 db = {}
+last_seen_flusher = None
+last_seen_flusher_stop = threading.Event()
 
 
-def load_db():
-    global db
-    db = {
-        'clients': Clients(),
-        'servers': Servers()
+def open_text_db():
+    return {
+        'clients': Clients(cfg.__db_clients_path__, compact_threshold=cfg.__journal_compact_threshold__,
+                           batch_size=cfg.__journal_batch_size__, linger=cfg.__journal_linger__),
+        'servers': Servers(cfg.__db_servers_path__, compact_threshold=cfg.__journal_compact_threshold__,
+                           batch_size=cfg.__journal_batch_size__, linger=cfg.__journal_linger__)
+    }
+
+
+def open_sqlite_db():
+    database = SqliteDatabase(cfg.__db_sqlite_path__)
+    return {
+        'clients': SqliteClients(database),
+        'servers': SqliteServers(database)
+    }
+
+
+def open_binary_db():
+    # the servers are few, they stay in the text backend
+    return {
+        'clients': BinaryClients(cfg.__db_binary_clients_path__),
+        'servers': Servers(cfg.__db_servers_path__, compact_threshold=cfg.__journal_compact_threshold__,
+                           batch_size=cfg.__journal_batch_size__, linger=cfg.__journal_linger__)
     }
+
+
+backends = {
+    'text': open_text_db,
+    'sqlite': open_sqlite_db,
+    'binary': open_binary_db,
+}
+
+
+def set_db_dir(db_dir):
+    """
+    Places the data files of all the backends in `db_dir` (relative to the KDC directory or absolute) instead of
+    db/data, e.g. a scratch registry for a load test.
+    """
+    # the models open os.getcwd() + file_path
+    db_dir = '/' + os.path.relpath(os.path.abspath(db_dir), os.getcwd())
+    cfg.__db_clients_path__ = db_dir + '/clients'
+    cfg.__db_servers_path__ = db_dir + '/servers'
+    cfg.__db_sqlite_path__ = db_dir + '/kdc.sqlite3'
+    cfg.__db_binary_clients_path__ = db_dir + '/clients.bin'
+
+
+def load_db(backend=None):
+    """
+    Opens the models of a storage backend, the `__db_backend__` of the config by default.
+    """
+    global db
+    backend = cfg.__db_backend__ if backend is None else backend
+    if backend not in backends:
+        raise ValueError(f"Unknown db backend '{backend}', expected one of: {', '.join(backends)}")
+
+    db = backends[backend]()
+    start_last_seen_flusher(cfg.__last_seen_flush_interval__)
+
+
+def flush_last_seen_periodically(interval):
+    while not last_seen_flusher_stop.wait(interval):
+        db['clients'].flush_last_seen()
+
+
+def start_last_seen_flusher(interval):
+    """
+    Starts the thread which writes the last_seen of the clients touched by ticket requests every `interval` seconds.
+    """
+    global last_seen_flusher
+    last_seen_flusher_stop.clear()
+    last_seen_flusher = threading.Thread(target=flush_last_seen_periodically, args=(interval,), name="last-seen-flusher",
+                                         daemon=True)
+    last_seen_flusher.start()
+
+
+def close_db():
+    """
+    Writes the pending last_seen and closes the models (the text backend compacts its journals into the snapshots),
+    called on shutdown.
+    """
+    global last_seen_flusher
+    if last_seen_flusher is not None:
+        last_seen_flusher_stop.set()
+        last_seen_flusher.join()
+        last_seen_flusher = None
+
+    if 'clients' not in db:  # interrupted before the models were loaded
+        return
+
+    db['clients'].flush_last_seen()
+    for model in db.values():
+        model.close()
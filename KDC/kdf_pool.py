@@ -0,0 +1,83 @@
+"""
+Module: kdf_pool.py
+
+Runs the password hashing (PBKDF2, 1,000,000 iterations) of client registrations in a dedicated pool of processes.
+
+Hashing on the request thread holds the GIL for about a second and stalls every other request of the KDC, the pool moves
+this work to other cores. The number of hashes waiting for a worker process is bounded, registrations beyond the limit
+are refused instead of piling up.
+
+Functions:
+- start_kdf_pool: Starts the pool of worker processes.
+- stop_kdf_pool: Stops the pool.
+- hash_password_in_pool: Hashes a password in the pool (inline if the pool is not started).
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from lib.ServerException import ServerException
+from lib.utils import hash_password
+
+kdf_pool = None
+kdf_slots = None  # running + pending hashes
+
+
+def start_kdf_pool(size: int, queue_limit: int):
+    """
+    Starts the pool of worker processes. Workers are spawned (not forked) since the KDC is already multithreaded.
+
+    Params:
+    - size (int): Number of worker processes, 0 keeps hashing inline.
+    - queue_limit (int): Maximum number of hashes waiting for a worker process.
+    """
+
+    global kdf_pool, kdf_slots
+    if size <= 0:
+        return
+
+    kdf_pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn'))
+    kdf_slots = threading.BoundedSemaphore(size + queue_limit)
+
+
+def stop_kdf_pool():
+    """
+    Stops the pool, pending hashes are cancelled.
+    """
+
+    global kdf_pool
+    if kdf_pool is not None:
+        kdf_pool.shutdown(wait=False, cancel_futures=True)
+        kdf_pool = None
+
+
+def hash_password_in_pool(password: str, salt: bytes) -> bytes:
+    """
+    Hashes a password in the pool of worker processes and waits for the result.
+
+    Params:
+    - password (str): The password to be hashed.
+    - salt (bytes): The salt to be used in the hashing process.
+
+    Returns:
+    - bytes: The hashed password.
+
+    Raises:
+    - ServerException: Raised when too many hashes are already waiting for a worker process.
+    """
+
+    if kdf_pool is None:
+        return hash_password(password, salt)
+
+    if not kdf_slots.acquire(blocking=False):
+        raise ServerException("Too many pending password hashes")
+
+    try:
+        future = kdf_pool.submit(hash_password, password, salt)
+    except Exception:
+        kdf_slots.release()
+        raise
+    future.add_done_callback(lambda _: kdf_slots.release())
+
+    return future.result()
@@ -0,0 +1,120 @@
+"""
+Module: migrate.py
+
+Migrates the KDC registry from the text storage backend (the clients and servers files and their journals) to the sqlite
+or the binary storage backend. Set `__db_backend__` in the config once it is done. The binary backend only stores the
+clients, its servers stay in the text files so they do not need a migration.
+
+The migration can be run again: records which are already in the database are skipped. The text registry is left in
+place (its journals are compacted), so switching back to the text backend only loses the registrations made since.
+
+The text registry is opened as the KDC opens it (see db.models.open_text_db): the clients and servers files of the
+config, in the `--db-dir` directory when it is given.
+
+Usage (from the KDC directory):
+    python migrate.py [--db-dir db/data] [--to sqlite] [--sqlite-path /db/data/kdc.sqlite3]
+    python migrate.py [--db-dir db/data] --to binary [--binary-path /db/data/clients.bin]
+"""
+
+import argparse
+
+if not __package__:  # run as a script from the KDC directory, not imported as KDC.migrate
+    import __init__
+
+import KDC.config as cfg
+import KDC.db.models as models
+from KDC.db.models import SqliteDatabase, BinaryClients
+
+INSERT_CLIENT = "INSERT OR IGNORE INTO clients (client_id, name, password_hash, last_seen) VALUES (?, ?, ?, ?)"
+INSERT_SERVER = "INSERT OR IGNORE INTO servers (server_id, name, server_ip, server_port, aes_key) " \
+                "VALUES (?, ?, ?, ?, ?)"
+
+
+def migrate_to_sqlite(sqlite_path=None):
+    """
+        Copies the clients and servers of the text backend into the SQLite database, in one transaction.
+
+        Params:
+        - sqlite_path (str): Path of the SQLite database, relative to the KDC directory, the config one by default.
+
+        Returns:
+        - tuple: (migrated clients, migrated servers)
+        """
+
+    sqlite_path = cfg.__db_sqlite_path__ if sqlite_path is None else sqlite_path
+    text_db = models.open_text_db()
+    clients, servers = text_db['clients'], text_db['servers']
+    database = SqliteDatabase(sqlite_path)
+
+    try:
+        connection = database.connection()
+        with connection:
+            clients_before = connection.total_changes
+            connection.executemany(INSERT_CLIENT, ((client['client_id'], client['name'], client['password_hash'],
+                                                    float(client['last_seen'])) for client in clients.clients))
+            clients_count = connection.total_changes - clients_before
+
+            servers_before = connection.total_changes
+            connection.executemany(INSERT_SERVER, ((server['server_id'], server['name'], server['server_ip'],
+                                                    int(server['server_port']), server['aes_key'])
+                                                   for server in servers.servers))
+            servers_count = connection.total_changes - servers_before
+    finally:
+        database.close()
+        clients.close()
+        servers.close()
+
+    print(f"Migrated {clients_count}/{len(clients.clients)} clients and {servers_count}/{len(servers.servers)} servers "
+          f"to '{sqlite_path}' (the others already exist)")
+
+    return clients_count, servers_count
+
+
+def migrate_to_binary(binary_path=None):
+    """
+        Copies the clients of the text backend into the binary clients records.
+
+        Params:
+        - binary_path (str): Path of the records file, relative to the KDC directory, the config one by default.
+
+        Returns:
+        - int: Number of migrated clients
+        """
+
+    binary_path = cfg.__db_binary_clients_path__ if binary_path is None else binary_path
+    text_db = models.open_text_db()
+    clients = text_db['clients']
+    binary_clients = BinaryClients(binary_path)
+
+    try:
+        clients_count = binary_clients.add_clients(clients.clients)
+    finally:
+        binary_clients.close()
+        for model in text_db.values():
+            model.close()
+
+    print(f"Migrated {clients_count}/{len(clients.clients)} clients to '{binary_path}' (the others already exist)")
+
+    return clients_count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate the KDC registry from the text files to another backend")
+    parser.add_argument('--to', choices=('sqlite', 'binary'), default='sqlite', help="target storage backend")
+    parser.add_argument('--db-dir', help="directory of the db data files (all the backends), db/data by default")
+    parser.add_argument('--sqlite-path', help="path of the SQLite database, relative to the KDC directory, "
+                                              f"{cfg.__db_sqlite_path__} (in --db-dir) by default")
+    parser.add_argument('--binary-path', help="path of the binary clients records, relative to the KDC directory, "
+                                              f"{cfg.__db_binary_clients_path__} (in --db-dir) by default")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.db_dir is not None:
+        models.set_db_dir(args.db_dir)
+
+    if args.to == 'sqlite':
+        migrate_to_sqlite(args.sqlite_path)
+    else:
+        migrate_to_binary(args.binary_path)
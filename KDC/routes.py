@@ -2,6 +2,7 @@ from controller import (register_client,
                         get_servers_list,
                         register_server,
                         get_symmetric_key,
+                        get_stats,
                         not_found_controller)
 
 """
@@ -10,6 +11,7 @@ Routes dictionary for mapping request codes to corresponding controller function
 - '1025': register_server - Handles server registration requests.
 - '1026': get_servers_list - Retrieves the list of registered servers.
 - '1027': get_symmetric_key - Retrieves a symmetric key for secure communication.
+- '1030': get_stats - Retrieves the request metrics of the server.
 - '0': not_found_controller - Handles invalid request codes.
 """
 
@@ -18,5 +20,12 @@ routes = {
     '1025': register_server,
     '1026': get_servers_list,
     '1027': get_symmetric_key,
+    '1030': get_stats,
     '0': not_found_controller
 }
+
+"""
+Request codes whose controllers are CPU-heavy or do blocking file I/O (password hashing, saving the db files).
+The asyncio engine runs them in a worker thread instead of on the event loop.
+"""
+blocking_routes = ('1024', '1025')
@@ -3,6 +3,7 @@ import binascii
 import hashlib
 import hmac
 import json
+import logging
 import sys
 
 from Crypto.Cipher import AES
@@ -14,6 +15,8 @@ from Crypto.Random import get_random_bytes
 from Crypto.Hash import SHA256
 import uuid
 
+logger = logging.getLogger('kdc')
+
 
 def generate_random_uuid():
     """
@@ -51,12 +54,12 @@ def read_port_from_file(port_filename="port.info"):
             if 1 <= port <= 65535:
                 return port
             else:
-                print("Error: Port number must be between 1 and 65535.")
+                logger.error("Port number must be between 1 and 65535", extra={'file': port_filename})
 
     except FileNotFoundError:
-        print(f"Error: File '{port_filename}' not found.")
+        logger.warning("Port file not found", extra={'file': port_filename})
     except ValueError:
-        print(f"Error: Invalid port number in '{port_filename}'.")
+        logger.error("Invalid port number", extra={'file': port_filename})
 
-    print(f"Using default port: {default_port}")
+    logger.info("Using the default port", extra={'port': default_port})
     return default_port
@@ -1,3 +1,5 @@
+import logging
+
 from Crypto.Random import get_random_bytes
 
 from lib.ServerException import ServerException
@@ -5,8 +7,10 @@ from lib.utils import pack_key_base64, send_request, pack_key_hex
 from MSG.config import __api_version__, __server_creds_filename__
 import MSG.config as cfg
 
+logger = logging.getLogger('msg')
+
 
-def register_new_server(server_info):
+def register_new_server(server_info, creds_filename=__server_creds_filename__):
     """
         Registers a new server with the Key Distribution Center (KDC).
 
@@ -15,6 +19,7 @@ def register_new_server(server_info):
 
         Args:
             server_info (dict): Information about the new server.
+            creds_filename (str): The file the server credentials are written to.
 
         Returns:
             dict: Server information, including server ID and AES key.
@@ -43,9 +48,9 @@ def register_new_server(server_info):
     response = send_request(cfg.__kdc_server_ip__, cfg.__kdc_server_port__, request)
     response_code = response["header"]["code"]
     if response_code == 16000:  # registration success
-        print("[SUCCESS] Server registered")
+        logger.info("Server registered", extra={'route': '1025', 'server_id': response["payload"]["server_id"]})
         # save user to file
-        with open(__server_creds_filename__, "w") as file:
+        with open(creds_filename, "w") as file:
             server_id = response["payload"]["server_id"]
             server_id_hex = pack_key_hex(server_id.encode('utf-8'))
             aes_key_base64 = pack_key_base64(aes_key)
@@ -57,9 +62,9 @@ def register_new_server(server_info):
             return server_info
 
     elif response_code == 1601:  # registration failed
-        print("[1601] Registration failed")
+        logger.error("Registration failed", extra={'route': '1025', 'response': response_code})
         raise ServerException()
 
     else:  # unknown response
-        print("Unknown response from server: ", response)
+        logger.error("Unknown response from the KDC", extra={'route': '1025', 'response': response_code})
         raise ServerException()
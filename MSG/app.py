@@ -1,17 +1,27 @@
+import argparse
+import asyncio
+import logging
 import socket
 import sys
-import threading
+import time
 import __init__
 
 import data
 from api import register_new_server
 from lib.ServerException import ServerException
+from lib.async_server import serve_async
 from lib.config import package_dict
-from routes import routes
-from lib.utils import receive_data, unpack_data, REQUEST, send, RESPONSE, unpack_key_hex, unpack_key_base64, color, RED
+from routes import routes, blocking_routes
+from lib.Connection import Connection
+from lib.Metrics import metrics, start_metrics_server, stop_metrics_server
+from lib.log import start_logging, log_request, dropped_records
+from lib.WorkerPool import WorkerPool
+from lib.utils import receive_data, unpack_data, pack_data, is_keep_alive, REQUEST, send, RESPONSE, unpack_key_hex, unpack_key_base64
 from MSG.config import __api_version__, __server_creds_filename__
 import MSG.config as cfg
 
+logger = logging.getLogger('msg')
+
 
 def handle_request(connection):
     """
@@ -20,24 +30,56 @@ def handle_request(connection):
     This function receives a request from the client, determines the appropriate controller based on the request code,
     and then executes the corresponding controller to process the request.
 
+    A client may ask to keep the connection alive (see `lib.config.keep_alive_flag`), the connection is then left open
+    and the worker pool hands it back here when the next frame arrives.
+
+    Every request is recorded in the request metrics (lib.Metrics): decode, controller and send time, the response code
+    and the exceptions.
+
     Args:
-        connection (socket): The connection socket for communication with the client.
+        connection (Connection): The connection for communication with the client.
+
+    Returns:
+        bool: True if the connection is kept alive.
     """
 
     controller = 'undefined'
+    keep_alive = False
+    metrics_code = None  # the route of the request, once the frame is decoded
+    phase_times = {}
+    is_request = True
+    is_exception = False
+    client_id = None
+    connection.response_code, connection.send_time = None, 0.0
+    start = time.perf_counter()
     try:
         # Receive request from client
         data_receive = receive_data(connection, REQUEST)
         req = unpack_data(package_dict, REQUEST, data_receive)
 
+        # keep the connection open for the next frames if the client asked for it
+        connection.keep_alive = is_keep_alive(req['header'])
+
         req_code = str(req['header']['code'])
+        client_id = req['header']['client_id']
 
-        controller = routes.get(req_code, '0')  # 0 means, not found
+        controller = routes.get(req_code, routes['0'])  # 0 means, not found
+        metrics_code = req_code if req_code in routes else '0'
+        metrics.start_request(metrics_code)
+        controller_start = time.perf_counter()
+        phase_times['decode'] = controller_start - start
         controller(connection, req)
+        phase_times['controller'] = time.perf_counter() - controller_start - connection.send_time
+        keep_alive = connection.keep_alive
+
+    except EOFError:
+        is_request = False  # the client closed the connection
 
     except Exception as e:
-        print(f"Exception in function: {controller.__name__ or controller}")
-        print(f"Error during communication: {e}")
+        is_exception = True
+        logger.warning("Error during communication",
+                       extra={'route': metrics_code or 'undecoded', 'client_id': client_id,
+                              'controller': getattr(controller, '__name__', controller), 'error': e})
 
         # Response to client in case of error
         err_response = {
@@ -47,10 +89,48 @@ def handle_request(connection):
             }
         }
 
+        connection.keep_alive = False
         send(connection, RESPONSE, err_response)
 
     finally:
-        connection.close()
+        if not keep_alive:
+            connection.close()
+
+        if is_request:
+            phase_times['send'] = connection.send_time
+            metrics.end_request(metrics_code or 'undecoded', phase_times, connection.response_code, is_exception,
+                                in_flight=metrics_code is not None)
+            log_request(logger, metrics_code or 'undecoded', client_id, connection.response_code,
+                        time.perf_counter() - start)
+
+    return keep_alive
+
+
+worker_pool = None  # the worker pool of the threads engine, exposes the queue depth and rejection counters
+
+
+def create_worker_pool():
+    """
+    Creates the worker pool serving the connections of the threads engine, with the limits from the config.
+    Connections are rejected with a prebuilt 1609 response once the accept queue is too deep.
+
+    Returns:
+        WorkerPool: The (not started) worker pool.
+    """
+    reject_response = bytes(pack_data(package_dict, RESPONSE, {
+        'header': {
+            'version': __api_version__,
+            'code': 1609
+        }
+    }))
+
+    return WorkerPool(handle_request,
+                      size=cfg.__worker_pool_size__,
+                      queue_size=cfg.__accept_queue_size__,
+                      reject_depth=cfg.__reject_queue_depth__,
+                      reject_response=reject_response,
+                      idle_timeout=cfg.__keep_alive_timeout__,
+                      max_idle=cfg.__max_idle_connections__)
 
 
 def run_server():
@@ -58,30 +138,60 @@ def run_server():
     Runs the Messages server.
 
     This function binds the server socket to the specified IP address and port, listens for incoming connections,
-    and starts a new thread to handle each client.
+    and hands each client to a fixed-size worker pool.
 
     Note: The server socket is bound to the IP and port specified in the 'server_info' stored in the 'data.db'.
     """
     msg_server_ip, msg_server_port = data.db['server_info']['server_ip'], data.db['server_info']['server_port']
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.bind((msg_server_ip, msg_server_port))
-    server_socket.listen(10)  # Allow up to 10 queued connections
+    server_socket.listen(cfg.__listen_backlog__)
 
-    print(f"Messages server is listening on port {msg_server_port}")
+    logger.info("Messages server is listening", extra={'port': msg_server_port})
 
     try:
+        global worker_pool
+        worker_pool = create_worker_pool()
+        worker_pool.start()
+        metrics.add_gauge('worker_pool', worker_pool.stats)
 
         while True:
             connection, address = server_socket.accept()
             # print(f"Connection established from {address}")
 
-            # Start a new thread to handle the client
-            client_handler = threading.Thread(target=handle_request, args=[connection])
-            client_handler.start()
+            # Hand the client to the worker pool, it is rejected with 1609 when the pool is overloaded
+            worker_pool.submit(Connection(connection))
 
     except KeyboardInterrupt:
-        print("\nServer shutting down...")
+        logger.info("Server shutting down")
+        stop_metrics_server()
         server_socket.close()
+        if worker_pool is not None:  # None if interrupted before the pool was created
+            worker_pool.shutdown()
+            logger.info("Worker pool stats", extra=worker_pool.stats())
+        data.close_db()
+        sys.exit()
+
+
+def run_server_async():
+    """
+    Runs the Messages server with the asyncio engine.
+
+    All the client connections are served from a single event loop, so one core can hold thousands of concurrent idle
+    connections and the tickets store is never accessed from two threads at once.
+    """
+    msg_server_ip, msg_server_port = data.db['server_info']['server_ip'], data.db['server_info']['server_port']
+
+    logger.info("Messages server (asyncio) is listening", extra={'port': msg_server_port})
+
+    try:
+        asyncio.run(serve_async(msg_server_ip, msg_server_port, routes, __api_version__, blocking_routes,
+                                cfg.__listen_backlog__, cfg.__keep_alive_timeout__, logger))
+
+    except KeyboardInterrupt:
+        logger.info("Server shutting down")
+        stop_metrics_server()
+        data.close_db()
         sys.exit()
 
 
@@ -135,62 +245,105 @@ def read_server_creds_from_file(filename='msg.info'):
             return server_info
 
     except FileNotFoundError:
-        print(f"Info: File '{filename}' not found.")
+        logger.info("Server credentials file not found", extra={'file': filename})
     except ValueError as ve:
-        print(f"Error: {str(ve)}")
+        logger.error("Invalid server credentials file", extra={'file': filename, 'error': ve})
     except Exception as e:
-        print(f"Error: {type(e).__name__} - {str(e)}")
+        logger.error("Unable to read the server credentials file", extra={'file': filename, 'error': repr(e)})
 
     return None
 
 
-def get_server_info_gui():
+def get_server_info_gui(creds_filename=__server_creds_filename__):
     """
     Gets server information, reads it from a file, and registers a new server if necessary.
 
+    Args:
+        creds_filename (str): The server credentials file, the credentials of a new server are written to it.
+
     Returns:
         dict: Server information including 'server_id', 'name', 'server_ip', 'server_port', and 'aes_key'.
     """
-    server = read_server_creds_from_file(__server_creds_filename__)
+    server = read_server_creds_from_file(creds_filename)
 
     # register new client at KDC server
     if 'server_id' not in server:
-        server = register_new_server(server)
+        server = register_new_server(server, creds_filename)
 
     return server
 
 
-def main():
+def main(engine='threads', creds_filename=__server_creds_filename__, kdc_server_filename='srv.info'):
     """
     Main function for running the server.
 
-    - Loads server information from a file. If the file does not exist, registers a new server.
-    - Loads the database.
     - Reads Key Distribution Center (KDC) server information from a file.
-    - Runs the server.
+    - Loads server information from a file. If the server is not registered yet, registers it at the KDC.
+    - Loads the database.
+    - Runs the server with the selected engine ('threads' or 'asyncio').
+
+    Args:
+        engine (str): The serving engine, 'threads' or 'asyncio'.
+        creds_filename (str): The server credentials file.
+        kdc_server_filename (str): The KDC server information file.
 
     Raises:
         ServerException: If there is an issue with server registration.
     """
     try:
+        # read KDC server info file, the registration is sent to it
+        cfg.read_kdc_server_info(kdc_server_filename)
+
         # load server info from file, if not exist, register new server
-        server_info = get_server_info_gui()
-        print(f"Server Info: {server_info}")
+        server_info = get_server_info_gui(creds_filename)
+        logger.info("Server info", extra={'server_id': server_info['server_id'], 'server_name': server_info['name'],
+                                          'address': f"{server_info['server_ip']}:{server_info['server_port']}"})
 
         # load database
         data.load_db(server_info_init=server_info)
-
-        # read KDC server info file
-        cfg.read_kdc_server_info()
+        metrics.add_gauge('tickets', lambda: len(data.db['tickets'].tickets))
+        metrics.add_gauge('authenticators', data.db['authenticators'].stats)
 
         if server_info:
-            run_server()
+            if engine == 'asyncio':
+                run_server_async()
+            else:
+                run_server()
     except ServerException as se:
-        print(color(str(se), RED))
+        logger.error(str(se))
     except KeyboardInterrupt:
         print("\nBye Bye...")
         sys.exit()
 
 
+def parse_args():
+    """
+    Parses the command-line arguments of the Messages server.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Messages server")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads',
+                        help="serving engine: a thread per connection or a single asyncio event loop")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve the request metrics (Prometheus text format) on http://127.0.0.1:<port>/metrics")
+    parser.add_argument('--log-level', default=cfg.__log_level__, choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="minimum level of the logs, WARNING turns off the per-request success logs")
+    parser.add_argument('--creds', default=__server_creds_filename__,
+                        help="server credentials file ('ip:port' and name lines of a server to register)")
+    parser.add_argument('--kdc-info', default='srv.info', help="KDC server information file ('ip:port')")
+    parser.add_argument('--tickets-snapshot', default=cfg.__tickets_snapshot_path__,
+                        help="encrypted snapshot of the tickets, one per server")
+
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    start_logging(args.log_level)
+    cfg.__tickets_snapshot_path__ = args.tickets_snapshot
+    metrics.add_gauge('log_dropped', dropped_records)
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port, 'msg')
+    main(args.engine, args.creds, args.kdc_info)
@@ -6,6 +6,27 @@ __server_creds_filename__ = 'msg.info'  # default
 __kdc_server_ip__ = '127.0.0.1'  # default
 __kdc_server_port__ = 8000  # default
 
+# Serving engine limits
+__listen_backlog__ = 4096  # queued connections at the listening socket
+__worker_pool_size__ = 8  # worker threads serving connections
+__accept_queue_size__ = 256  # accepted connections waiting for a worker
+__reject_queue_depth__ = 192  # from this queue depth new connections are rejected with 1609
+__keep_alive_timeout__ = 30  # seconds a kept-alive connection may stay idle between frames
+__max_idle_connections__ = 1024  # kept-alive idle connections held by the threads engine
+
+# Tickets store
+__max_tickets__ = 100000  # cached tickets, the least recently used ticket is evicted beyond this
+__tickets_sweep_interval__ = 10  # seconds between two sweeps of the expired tickets
+__tickets_snapshot_path__ = 'tickets.snapshot'  # encrypted snapshot of the unexpired tickets, reloaded on start
+__tickets_snapshot_interval__ = 60  # seconds between two snapshots of the tickets (and one on shutdown)
+
+# Replay protection of the authenticators (1028)
+__authenticator_window__ = 300  # seconds an authenticator timestamp may differ from now, seen ones are remembered
+__replay_cache_bloom_bits__ = 0  # bits of the replay cache Bloom filter front, 0 disables it (~10 bits per key)
+
+# Logging
+__log_level__ = 'INFO'  # minimum level of the logs, 'WARNING' turns off the per-request success logs
+
 
 def read_kdc_server_info(kdc_server_filename='srv.info'):
     """
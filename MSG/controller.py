@@ -1,12 +1,15 @@
+import logging
 import time
-from datetime import datetime
 
 from MSG.utils import are_timestamps_close
-from lib.utils import decrypt_aes_cbc, send, RESPONSE, color, GREEN, BLUE
-from config import __api_version__
+from lib.utils import decrypt_aes_cbc, decrypt_aes_cbc_fields, send, RESPONSE
+from config import __api_version__, __authenticator_window__
+from lib.Metrics import metrics
 from lib.ServerException import ServerException
 import data as data
 
+logger = logging.getLogger('msg')
+
 
 def accept_symmetric_key(connection, req):
     """
@@ -19,11 +22,11 @@ def accept_symmetric_key(connection, req):
         req (dict): The request received from the client.
 
     Raises:
-        ServerException: If there is an issue with the validation or if the ticket has expired.
+        ServerException: If there is an issue with the validation, if the ticket has expired or if the authenticator is
+                         stale or replayed.
     """
 
-    server_info = data.db["server_info"]
-    server_aes_key = server_info["aes_key"]
+    server_aes_ecb = data.db["server_aes_ecb"]  # the cipher of the server key, built once (see data.load_db)
 
     authenticator = req['payload']['authenticator']
     ticket = req['payload']['ticket']
@@ -34,32 +37,43 @@ def accept_symmetric_key(connection, req):
     ticket_server_id = ticket['server_id']
     ticket_timestamp = float(ticket['timestamp'])
     ticket_iv = ticket['ticket_iv']
-    ticket_aes_key = decrypt_aes_cbc(server_aes_key, ticket_iv, ticket['aes_key'])
-    ticket_expiration_time = float(decrypt_aes_cbc(server_aes_key, ticket_iv, ticket['expiration_time']).decode('utf-8'))
+    ticket_aes_key, ticket_expiration_time = decrypt_aes_cbc_fields(server_aes_ecb, ticket_iv,
+                                                                    (ticket['aes_key'], ticket['expiration_time']))
+    ticket_expiration_time = float(ticket_expiration_time.decode('utf-8'))
 
-    # Authenticator
+    # Authenticator, all its fields are decrypted at once
     auth_iv = authenticator['auth_iv']
-    auth_version = int(decrypt_aes_cbc(ticket_aes_key, auth_iv, authenticator['version']).decode('utf-8'))
-    auth_client_id = decrypt_aes_cbc(ticket_aes_key, auth_iv, authenticator['client_id']).decode('utf-8')
-    auth_server_id = decrypt_aes_cbc(ticket_aes_key, auth_iv, authenticator['server_id']).decode('utf-8')
-    auth_timestamp = float(decrypt_aes_cbc(ticket_aes_key, auth_iv, authenticator['timestamp']).decode('utf-8'))
+    auth_version, auth_client_id, auth_server_id, auth_timestamp = decrypt_aes_cbc_fields(
+        ticket_aes_key, auth_iv,
+        (authenticator['version'], authenticator['client_id'], authenticator['server_id'], authenticator['timestamp']))
+    auth_version = int(auth_version.decode('utf-8'))
+    auth_client_id = auth_client_id.decode('utf-8')
+    auth_server_id = auth_server_id.decode('utf-8')
+    auth_timestamp = float(auth_timestamp.decode('utf-8'))
 
     # Validation: Ticket info match the Auth info
     if auth_version != ticket_version or \
             auth_client_id != ticket_client_id or \
             auth_server_id != ticket_server_id or \
             not are_timestamps_close(auth_timestamp, ticket_timestamp, 200):
-        print(auth_version, ticket_version)
-        print(auth_client_id, ticket_client_id)
-        print(auth_server_id, ticket_server_id)
-        print(auth_timestamp, ticket_timestamp, are_timestamps_close(auth_timestamp, ticket_timestamp, 200))
-        print('invalid ticket')
+        logger.warning("Invalid ticket", extra={'route': '1028', 'client_id': ticket_client_id,
+                                                'auth_client_id': auth_client_id, 'server_id': ticket_server_id,
+                                                'auth_server_id': auth_server_id})
         raise ServerException()
 
     # Validation: check that ticket has not expired
     current_time = time.time()
     if float(ticket_expiration_time) < current_time:
-        print('ticket expired')
+        logger.warning("Ticket expired", extra={'route': '1028', 'client_id': ticket_client_id})
+        raise ServerException()
+
+    # Validation: the authenticator is fresh, and was not seen during the window (the older ones are not fresh)
+    if not are_timestamps_close(auth_timestamp, current_time, __authenticator_window__):
+        logger.warning("Authenticator is not fresh", extra={'route': '1028', 'client_id': ticket_client_id})
+        raise ServerException()
+    authenticator_key = auth_client_id.encode('utf-8') + auth_iv + authenticator['timestamp']
+    if not data.db['authenticators'].check_and_add(authenticator_key, current_time):
+        logger.warning("Authenticator replayed", extra={'route': '1028', 'client_id': ticket_client_id})
         raise ServerException()
 
     # add ticket to tickets cache
@@ -84,13 +98,13 @@ def accept_symmetric_key(connection, req):
         }
     }
     send(connection, RESPONSE, response)
-    print(color('[SUCCESS] Symmetric key accepted', GREEN))
+    logger.info("Symmetric key accepted", extra={'route': '1028', 'client_id': ticket_client_id})
 
 
 def send_message(connection, req):
     """
-    This function decrypts the received message using the client's AES key, prints the message to the screen with a
-    timestamp, and sends an appropriate response back to the client.
+    This function decrypts the received message using the client's AES key, logs its size (its content at DEBUG), and
+    sends an appropriate response back to the client.
     if the ticket already exist from previous relations then it will use it to decrypt the message (only if the ticket is not expired)
 
     Args:
@@ -108,12 +122,8 @@ def send_message(connection, req):
         # the decrypted message from client
         message = decrypt_aes_cbc(aes_key, iv, encrypted_message).decode('utf-8')
 
-        # add time to message
-        current_time = datetime.now()
-        formatted_time = current_time.strftime("%H:%M")
-
-        # print the message from the client to the screen with blue color
-        print(color(f"Message received ({formatted_time}): {message}", BLUE))
+        logger.info("Message received", extra={'route': '1029', 'client_id': client_id, 'size': len(message)})
+        logger.debug("Message content", extra={'route': '1029', 'client_id': client_id, 'content': message})
 
         response = {
             'header': {
@@ -132,6 +142,29 @@ def send_message(connection, req):
     send(connection, RESPONSE, response)
 
 
+def get_stats(connection, req):
+    """
+    Sends the request metrics of the Messages server (see lib.Metrics) as a JSON snapshot.
+
+    Args:
+        connection (socket.socket): The socket connection to the client.
+        req (dict): The stats request.
+    """
+
+    stats = metrics.to_json()
+    response = {
+        'header': {
+            'version': __api_version__,
+            'code': 1606
+        }, 'payload': {
+            'stats_size': len(stats),
+            'stats': stats
+        }
+    }
+
+    send(connection, RESPONSE, response)
+
+
 def not_found_controller(connection, req):
     """
     Handles a request with an invalid code.
@@ -1,4 +1,7 @@
+import heapq
+import threading
 import time
+from collections import OrderedDict
 
 
 def is_expired(ticket):
@@ -28,42 +31,76 @@ class Tickets:
         Tickets are used to store information related to client-server communication,
         including AES keys and expiration times.
 
+        The tickets are indexed by client ID in an LRU ordered dict, and their expiration times are kept in a min-heap.
+        A background thread sweeps the expired tickets, so they do not wait for their owner to send a message. Once the
+        store holds `capacity` tickets, adding a ticket evicts the least recently used one, so the memory is bounded
+        whatever the number of sessions. All the methods are thread-safe.
+
         Attributes:
-            tickets_list (list): A list to store ticket information.
+            tickets (OrderedDict): client ID -> ticket, from the least to the most recently used.
+            expirations (list): Min-heap of (expiration time, client ID). Entries of replaced or evicted tickets are
+                                skipped when they are popped.
+            capacity (int): Maximum number of tickets.
+            sweep_interval (float): Seconds between two sweeps of the expired tickets.
 
         Methods:
-            __init__(self): Initializes a Tickets object with an empty list.
+            __init__(self, capacity, sweep_interval): Initializes an empty Tickets object.
             add_ticket(self, ticket): Adds a ticket, replacing any existing ticket for the same client.
-            remove_ticket(self, ticket): Removes a ticket from the list.
+            remove_ticket(self, ticket): Removes a ticket.
             get_ticket_by_client_id(self, client_id): Retrieves a ticket based on the client ID.
             get_aes_key(self, client_id): Retrieves the AES key associated with a client ID, checking for expiration.
+            remove_expired(self): Removes the expired tickets, returns how many were removed.
+            unexpired_tickets(self): Returns the unexpired tickets, from the least to the most recently used.
+            start_sweeper(self): Starts the thread which removes the expired tickets.
+            stop_sweeper(self): Stops the sweeper thread.
         """
 
-    def __init__(self):
-        self.tickets_list = []
+    def __init__(self, capacity=100000, sweep_interval=10):
+        self.tickets = OrderedDict()
+        self.expirations = []
+        self.capacity = capacity
+        self.sweep_interval = sweep_interval
+        self.lock = threading.Lock()
+
+        self.sweeper = None
+        self.sweeper_stop = threading.Event()
 
     def add_ticket(self, ticket):
-        # make sure there is not more tickets for this client
         client_id = ticket['client_id']
-        old_ticket = self.get_ticket_by_client_id(client_id)
-        if old_ticket:
-            self.remove_ticket(old_ticket)
-
-        # add the new ticket
-        self.tickets_list += [ticket]
+        with self.lock:
+            # make sure there is not more tickets for this client
+            self.tickets.pop(client_id, None)
+
+            # add the new ticket, evict the least recently used tickets beyond the capacity
+            self.tickets[client_id] = ticket
+            while len(self.tickets) > self.capacity:
+                self.tickets.popitem(last=False)
+
+            heapq.heappush(self.expirations, (ticket['expiration_time'], client_id))
+            if len(self.expirations) > 2 * len(self.tickets) + 1024:
+                # too many entries of replaced or evicted tickets
+                self.expirations = [(ticket['expiration_time'], client_id)
+                                    for client_id, ticket in self.tickets.items()]
+                heapq.heapify(self.expirations)
 
     def remove_ticket(self, ticket):
-        self.tickets_list.remove(ticket)
+        with self.lock:
+            if self.tickets.get(ticket['client_id']) is ticket:
+                del self.tickets[ticket['client_id']]
 
     def get_ticket_by_client_id(self, client_id):
-        for ticket in self.tickets_list:
-            if ticket['client_id'] == client_id:
-                return ticket
+        with self.lock:
+            ticket = self.tickets.get(client_id)
+            if ticket is not None:
+                self.tickets.move_to_end(client_id)
 
-        return None
+            return ticket
 
     def get_aes_key(self, client_id):
         ticket = self.get_ticket_by_client_id(client_id)
+        if ticket is None:
+            return None
+
         if is_expired(ticket):
             self.remove_ticket(ticket)
             return None
@@ -72,11 +109,37 @@ class Tickets:
 
         return aes_key
 
-
-
-
-
-
-
-
-
+    def remove_expired(self):
+        removed = 0
+        now = time.time()
+        while True:
+            # in batches, the requests do not wait for a sweep of many tickets
+            with self.lock:
+                for _ in range(1000):
+                    if not self.expirations or self.expirations[0][0] >= now:
+                        return removed
+
+                    expiration_time, client_id = heapq.heappop(self.expirations)
+                    ticket = self.tickets.get(client_id)
+                    if ticket is not None and ticket['expiration_time'] == expiration_time:
+                        del self.tickets[client_id]
+                        removed += 1
+
+    def unexpired_tickets(self):
+        with self.lock:
+            return [ticket for ticket in self.tickets.values() if not is_expired(ticket)]
+
+    def sweep(self):
+        while not self.sweeper_stop.wait(self.sweep_interval):
+            self.remove_expired()
+
+    def start_sweeper(self):
+        self.sweeper_stop.clear()
+        self.sweeper = threading.Thread(target=self.sweep, name="tickets-sweeper", daemon=True)
+        self.sweeper.start()
+
+    def stop_sweeper(self):
+        if self.sweeper is not None:
+            self.sweeper_stop.set()
+            self.sweeper.join()
+            self.sweeper = None
@@ -1,10 +1,23 @@
+import logging
+import threading
+
+from lib.ReplayCache import ReplayCache
+from lib.utils import get_aes_ecb
 from .Tickets import Tickets
+from .snapshot import save_tickets_snapshot, load_tickets_snapshot
+import MSG.config as cfg
+
+logger = logging.getLogger('msg.data')
+
 db = {}
+snapshot_thread = None
+snapshot_stop = threading.Event()
 
 
 def load_db(server_info_init=None):
     """
-    Load the database with the initial server information and an empty Tickets object.
+    Load the database with the initial server information and the AES cipher of the server key, the tickets of the
+    snapshot and an empty authenticators replay cache, start sweeping the expired tickets and snapshotting the tickets periodically.
 
     Args:
         server_info_init: Initial server information.
@@ -13,5 +26,61 @@ def load_db(server_info_init=None):
     global db
     db = {
         'server_info': server_info_init.copy(),
-        'tickets': Tickets()
+        'server_aes_ecb': get_aes_ecb(server_info_init['aes_key']),  # for the process lifetime, one key schedule
+        'tickets': Tickets(capacity=cfg.__max_tickets__, sweep_interval=cfg.__tickets_sweep_interval__),
+        'authenticators': ReplayCache(window=cfg.__authenticator_window__, bloom_bits=cfg.__replay_cache_bloom_bits__)
     }
+
+    # sessions survive restarts, the clients do not have to go back to the KDC
+    tickets = load_tickets_snapshot(cfg.__tickets_snapshot_path__, db['server_info']['aes_key'])
+    for ticket in tickets:
+        db['tickets'].add_ticket(ticket)
+    db['tickets'].remove_expired()
+    if tickets:
+        logger.info("Restored the tickets snapshot", extra={'tickets': len(db['tickets'].tickets)})
+
+    db['tickets'].start_sweeper()
+    start_snapshot_thread(cfg.__tickets_snapshot_interval__)
+
+
+def save_snapshot():
+    """
+    Write the unexpired tickets to the snapshot file.
+    """
+
+    try:
+        save_tickets_snapshot(db['tickets'].unexpired_tickets(), cfg.__tickets_snapshot_path__,
+                              db['server_info']['aes_key'])
+    except (OSError, ValueError) as e:
+        logger.error("Unable to save the tickets snapshot", extra={'error': e})
+
+
+def snapshot_periodically(interval):
+    while not snapshot_stop.wait(interval):
+        save_snapshot()
+
+
+def start_snapshot_thread(interval):
+    global snapshot_thread
+    snapshot_stop.clear()
+    snapshot_thread = threading.Thread(target=snapshot_periodically, args=(interval,), name="tickets-snapshot",
+                                       daemon=True)
+    snapshot_thread.start()
+
+
+def close_db():
+    """
+    Stop sweeping and snapshotting the tickets and write a last snapshot, called on shutdown.
+    """
+
+    global snapshot_thread
+    if 'tickets' not in db:
+        return
+
+    db['tickets'].stop_sweeper()
+    if snapshot_thread is not None:
+        snapshot_stop.set()
+        snapshot_thread.join()
+        snapshot_thread = None
+
+    save_snapshot()
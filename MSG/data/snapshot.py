@@ -0,0 +1,90 @@
+"""
+Module: snapshot.py
+
+Persists the unexpired tickets of the Messages server across restarts, so the clients keep their sessions instead of
+all going back to the KDC after a restart.
+
+The snapshot is a JSON list of the tickets encrypted and authenticated with AES-GCM under the AES key of the server
+(the key shared with the KDC, the tickets are encrypted with it anyway). A snapshot which cannot be authenticated, e.g.
+after the server registered again with a new key, is ignored. It is written to a temporary file (readable by its owner
+only), fsynced and atomically renamed.
+
+File format: magic (8 bytes), nonce (16 bytes), tag (16 bytes), ciphertext.
+
+Functions:
+- save_tickets_snapshot: Writes the unexpired tickets to the snapshot file.
+- load_tickets_snapshot: Reads the tickets of the snapshot file.
+"""
+
+import json
+import logging
+import os
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from lib.utils import pack_key_base64, unpack_key_base64
+
+SNAPSHOT_MAGIC = b'MSGTKT01'
+BYTES_FIELDS = ('iv', 'aes_key')
+
+logger = logging.getLogger('msg.data')
+
+
+def save_tickets_snapshot(tickets, file_path, key):
+    """
+    Writes tickets to the snapshot file.
+
+    Args:
+        tickets (list): The tickets, from the least to the most recently used.
+        file_path (str): Path of the snapshot file.
+        key (bytes): The AES key of the server.
+    """
+    plaintext = json.dumps([{field: pack_key_base64(value) if field in BYTES_FIELDS else value
+                             for field, value in ticket.items()} for ticket in tickets]).encode('utf-8')
+
+    nonce = get_random_bytes(16)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+
+    temp_path = file_path + '.tmp'
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as file:
+        file.write(SNAPSHOT_MAGIC + nonce + tag + ciphertext)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, file_path)
+
+
+def load_tickets_snapshot(file_path, key):
+    """
+    Reads the tickets of the snapshot file.
+
+    Args:
+        file_path (str): Path of the snapshot file.
+        key (bytes): The AES key of the server.
+
+    Returns:
+        list: The tickets, from the least to the most recently used. Empty if there is no snapshot or it cannot be
+              authenticated.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            content = file.read()
+    except FileNotFoundError:
+        return []
+
+    if content[:8] != SNAPSHOT_MAGIC:
+        logger.error("Not a tickets snapshot", extra={'file': file_path})
+        return []
+
+    nonce, tag, ciphertext = content[8:24], content[24:40], content[40:]
+    try:
+        plaintext = AES.new(key, AES.MODE_GCM, nonce=nonce).decrypt_and_verify(ciphertext, tag)
+    except ValueError:
+        logger.warning("Unable to authenticate the tickets snapshot, it is ignored", extra={'file': file_path})
+        return []
+
+    return [{field: unpack_key_base64(value.encode('utf-8')) if field in BYTES_FIELDS else value
+             for field, value in ticket.items()} for ticket in json.loads(plaintext)]
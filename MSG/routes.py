@@ -1,5 +1,6 @@
 from controller import (accept_symmetric_key,
                         send_message,
+                        get_stats,
                         not_found_controller)
 
 """
@@ -8,6 +9,7 @@ This dictionary maps request codes to their corresponding handling functions.
 Explanation:
     - '1028': accept_symmetric_key - Handles requests related to accepting symmetric keys.
     - '1029': send_message - Handles requests related to sending messages.
+    - '1030': get_stats - Handles requests for the request metrics of the server.
     - '0': not_found_controller - Handles cases where the request code is not recognized.
 
 Note:
@@ -17,5 +19,14 @@ Note:
 routes = {
     '1028': accept_symmetric_key,
     '1029': send_message,
+    '1030': get_stats,
     '0': not_found_controller
 }
+
+"""
+Request codes whose controllers should run in a worker thread under the asyncio engine.
+Both MSG controllers only decrypt short fields, so they run on the event loop. The tickets store is still shared with
+the sweeper thread (expired tickets) and the snapshot thread, every access goes through its lock (see
+data/Tickets.py).
+"""
+blocking_routes = ()
@@ -0,0 +1,180 @@
+"""
+Module: bench_codec.py
+
+Benchmark of the protocol codec for every request and response code of `lib.config.package_dict`.
+
+A representative frame is built for every code from its struct format (fields filled to their full size), plus:
+    - 1602 (servers list) with 10, 1k and 100k servers,
+    - 1029 (message) with 100 B to 10 MB of message content.
+
+For every frame it times, call by call, `pack_data` and `unpack_data` (ops/sec and latency percentiles), then the
+transfer of the frame over a socketpair: the frame parts are sent with `send_data` (as `send` does) while another
+thread receives them with `receive_data`, and the time per frame and the throughput are reported. Comparing the time
+per byte of the sizes of a code shows the codes which scale badly.
+
+The results are printed as a table and written as JSON, with the machine, the library versions and the git commit.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_codec [--list-sizes 10 1000 100000] [--message-sizes 100 10000 1000000 10000000]
+                                     [--repeat 2000] [--max-time 2] [--transfers 200] [--output bench_codec.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from benchmarks.bench_crypto import time_calls, environment
+from lib.config import package_dict, __api_version__
+from lib.codec import pack_frame_parts, compiled_package_dict
+from lib.utils import pack_data, unpack_data, send_data, receive_data
+
+REQUEST = 'request'
+RESPONSE = 'response'
+DEFAULT_SIZE = 1  # items of a list / bytes of a last item of unknown size, for the frames of every code
+
+
+def format_fields(struct_format):
+    # (count, type character) of each field of a struct format, e.g. '<16sBH' -> [(16, 's'), (1, 'B'), (1, 'H')]
+    return [(int(count) if count else 1, char) for count, char in re.findall(r'(\d*)([a-zA-Z?])', struct_format)]
+
+
+def field_value(count, char, value_type):
+    if char == 's':
+        # full size fields, the str ones without null bytes so they come back unchanged
+        return 'x' * count if value_type is str else os.urandom(count)
+    if char in 'fd':
+        return 1.5
+
+    return 1
+
+
+def build_item(payload_format):
+    """
+    Returns:
+        dict: The flattened fields of one payload item, each filled to its full size.
+    """
+    return {key: field_value(count, char, value_type)
+            for key, (count, char), value_type in zip(payload_format['keys'], format_fields(payload_format['format']),
+                                                       payload_format['types'])}
+
+
+def build_frame(packing_type, code, size=DEFAULT_SIZE):
+    """
+    Params:
+    - packing_type (str): 'request' or 'response'.
+    - code (str): The request/response code.
+    - size (int): Items of a list payload, bytes of a last item of unknown size, ignored by the other codes.
+
+    Returns:
+    - dict: The request/response dictionary.
+    """
+    header = {'version': __api_version__, 'code': int(code)}
+    if packing_type == REQUEST:
+        header['client_id'] = '0123456789abcdef'
+
+    payload_format = package_dict[packing_type]['payload'][code]
+    if payload_format is None:
+        return {'header': header, 'payload': None}
+
+    item = build_item(payload_format)
+    if 'is_list' in payload_format:
+        payload = {f'{key}__{i}': value for i in range(size) for key, value in item.items()}
+    elif 'is_last_item_has_unknown_size' in payload_format:
+        payload = {**item, payload_format['keys'][-1]: os.urandom(size)}
+    else:
+        payload = item
+
+    return {'header': header, 'payload': payload}
+
+
+def frames(list_sizes, message_sizes):
+    # (packing type, code, size, frame) of every code, the list and message codes in several sizes
+    for packing_type, packing_dict in package_dict.items():
+        for code, payload_format in packing_dict['payload'].items():
+            sizes = [DEFAULT_SIZE]
+            if payload_format is not None and 'is_list' in payload_format:
+                sizes = list_sizes
+            elif payload_format is not None and 'is_last_item_has_unknown_size' in payload_format:
+                sizes = message_sizes
+
+            for size in sizes:
+                yield packing_type, code, size, build_frame(packing_type, code, size)
+
+
+def time_transfer(packing_type, frame, transfers, max_time):
+    """
+    Sends the frame `transfers` times over a socketpair with send_data, received by another thread with receive_data.
+
+    Returns:
+        dict: The number of frames, the time per frame in microseconds and the throughput in MB/s.
+    """
+    parts = pack_frame_parts(compiled_package_dict, packing_type, frame)
+    frame_size = sum(len(part) for part in parts)
+    sender, receiver = socket.socketpair()
+    transfers = max(1, min(transfers, int(max_time * 2e9 / frame_size) or 1))  # about 2 GB/s at most
+    received = []
+
+    def receive():
+        for _ in range(transfers):
+            received.append(len(receive_data(receiver, packing_type)))
+
+    with sender, receiver:
+        receiver_thread = threading.Thread(target=receive)
+        start = time.perf_counter()
+        receiver_thread.start()
+        for _ in range(transfers):
+            send_data(sender, parts)
+        receiver_thread.join()
+        elapsed = time.perf_counter() - start
+
+    if received != [frame_size] * transfers:
+        raise ValueError(f"Received {received[:1]} bytes frames instead of {frame_size}")
+
+    return {
+        'transfers': transfers,
+        'transfer_us': elapsed / transfers * 1e6,
+        'transfer_mb_per_second': frame_size * transfers / elapsed / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Protocol codec pack/unpack/send/receive cost per code")
+    parser.add_argument('--list-sizes', type=int, nargs='+', default=[10, 1000, 100000], help="servers in 1602")
+    parser.add_argument('--message-sizes', type=int, nargs='+', default=[100, 10000, 1000000, 10000000],
+                        help="bytes of message content in 1029")
+    parser.add_argument('--repeat', type=int, default=2000, help="pack_data/unpack_data calls per frame")
+    parser.add_argument('--max-time', type=float, default=2, help="seconds per measure (at least 5 calls are timed)")
+    parser.add_argument('--transfers', type=int, default=200, help="frames sent over the socketpair per frame")
+    parser.add_argument('--output', default='bench_codec.json', help="JSON results file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'type':<9} {'code':>5} {'size':>9} {'frame B':>10} {'pack us':>11} {'pack p99':>11} {'unpack us':>11} "
+          f"{'unpack p99':>11} {'transfer us':>12} {'MB/s':>8} {'ns/byte':>8}")
+    for packing_type, code, size, frame in frames(args.list_sizes, args.message_sizes):
+        data = pack_data(package_dict, packing_type, frame)
+        if unpack_data(package_dict, packing_type, data)['header']['code'] != int(code):
+            raise ValueError(f"{packing_type} {code} does not unpack to its code")
+
+        pack = time_calls(lambda: pack_data(package_dict, packing_type, frame), args.repeat, args.max_time)
+        unpack = time_calls(lambda: unpack_data(package_dict, packing_type, data), args.repeat, args.max_time)
+        transfer = time_transfer(packing_type, frame, args.transfers, args.max_time)
+        total_us = pack['mean_us'] + unpack['mean_us'] + transfer['transfer_us']
+
+        results.append({'packing_type': packing_type, 'code': int(code), 'size': size, 'frame_bytes': len(data),
+                        'pack': pack, 'unpack': unpack, **transfer})
+        print(f"{packing_type:<9} {code:>5} {size:>9} {len(data):>10} {pack['mean_us']:>11.2f} {pack['p99_us']:>11.2f} "
+              f"{unpack['mean_us']:>11.2f} {unpack['p99_us']:>11.2f} {transfer['transfer_us']:>12.2f} "
+              f"{transfer['transfer_mb_per_second']:>8.1f} {total_us * 1e3 / len(data):>8.2f}")
+
+    with open(args.output, 'w') as file:
+        json.dump({'environment': environment(), 'parameters': vars(args), 'results': results}, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Module: bench_crypto.py
+
+Micro-benchmark of the lib.utils crypto primitives used by the handshake, with ops/sec and latency percentiles.
+
+Cases:
+    - hash_password (PBKDF2-HMAC-SHA1), for each backend: pycryptodome (lib.utils.hash_password, the one in use) and
+      hashlib.pbkdf2_hmac (OpenSSL). Both derive the same key (pycryptodome encodes a str password as latin-1), which is
+      checked before timing. The KDC runs 1,000,000 iterations per request, the number is configurable to keep short
+      runs short; the cost is linear in it.
+    - encrypt_aes_cbc / decrypt_aes_cbc across payload sizes.
+    - encrypt_aes_cbc_fields / decrypt_aes_cbc_fields on the fields of a ticket request (1027), against one
+      encrypt_aes_cbc / decrypt_aes_cbc per field.
+    - pack_key_base64 / unpack_key_base64 / pack_key_hex / unpack_key_hex on a 32 bytes key and a 16 bytes id.
+
+Every case is timed call by call for `--repeat` calls (or until `--max-time` seconds passed), after a few warmup calls.
+The results are printed as a table and written as JSON, with the machine, the library versions and the git commit, so
+runs on different machines or commits can be compared.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_crypto [--sizes 16 256 4096 65536 1048576] [--repeat 2000] [--max-time 2]
+                                      [--iterations 1000000] [--hash-repeat 10] [--output bench_crypto.json]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import ssl
+import statistics
+import subprocess
+import time
+
+import Crypto
+
+from lib.utils import (hash_password, encrypt_aes_cbc, decrypt_aes_cbc, encrypt_aes_cbc_fields, decrypt_aes_cbc_fields,
+                       pack_key_base64, unpack_key_base64, pack_key_hex, unpack_key_hex)
+from lib.config import salt as general_salt
+
+WARMUP_CALLS = 3
+
+
+def hash_password_hashlib(password: str, salt: bytes = general_salt, key_length=32, iterations=1000000):
+    # same derivation as lib.utils.hash_password, on the OpenSSL implementation of hashlib
+    return hashlib.pbkdf2_hmac('sha1', password.encode('latin-1'), salt, iterations, key_length)
+
+
+def time_calls(call, repeat, max_time):
+    """
+    Times `call` call by call.
+
+    Returns:
+        dict: The number of calls, ops/sec and mean/p50/p90/p99/max latency in microseconds.
+    """
+    for _ in range(WARMUP_CALLS):
+        call()
+
+    latencies = []
+    deadline = time.perf_counter() + max_time
+    while len(latencies) < repeat:
+        start = time.perf_counter()
+        call()
+        end = time.perf_counter()
+        latencies.append((end - start) * 1e6)
+        if end > deadline and len(latencies) >= 5:
+            break
+
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'ops_per_second': 1e6 * len(latencies) / sum(latencies),
+        'mean_us': statistics.fmean(latencies),
+        'p50_us': latencies[len(latencies) // 2],
+        'p90_us': latencies[int(len(latencies) * 0.9)],
+        'p99_us': latencies[int(len(latencies) * 0.99)],
+        'max_us': latencies[-1],
+    }
+
+
+def hash_cases(iterations):
+    password = 'correct horse battery staple'
+    backends = {
+        'pycryptodome': hash_password,
+        'hashlib': hash_password_hashlib,
+    }
+    expected = hash_password(password, iterations=iterations)
+    for backend, hash_function in backends.items():
+        if hash_function(password, iterations=iterations) != expected:
+            raise ValueError(f"The {backend} backend derives another key")
+
+        yield 'hash_password', backend, iterations, lambda f=hash_function: f(password, iterations=iterations)
+
+
+def aes_cases(sizes):
+    key = os.urandom(32)
+    for size in sizes:
+        data = os.urandom(size)
+        iv, encrypted_data = encrypt_aes_cbc(key, data)
+        yield 'encrypt_aes_cbc', 'pycryptodome', size, lambda d=data: encrypt_aes_cbc(key, d)
+        yield 'decrypt_aes_cbc', 'pycryptodome', size, lambda i=iv, e=encrypted_data: decrypt_aes_cbc(key, i, e)
+
+
+def fields_cases():
+    # the fields of a ticket request: (nonce, session key) under the client key, (session key, expiration) under the
+    # server key, each field padded to its own blocks
+    key = os.urandom(32)
+    fields = (os.urandom(8), os.urandom(32))
+    size = sum(len(field) for field in fields)
+    iv, encrypted_fields = encrypt_aes_cbc_fields(key, fields)
+
+    def encrypt_per_field():
+        return tuple(encrypt_aes_cbc(key, field, iv)[1] for field in fields)
+
+    def decrypt_per_field():
+        return tuple(decrypt_aes_cbc(key, iv, field) for field in encrypted_fields)
+
+    yield 'encrypt_aes_cbc_fields', 'batch', size, lambda: encrypt_aes_cbc_fields(key, fields, iv)
+    yield 'encrypt_aes_cbc_fields', 'per-field', size, encrypt_per_field
+    yield 'decrypt_aes_cbc_fields', 'batch', size, lambda: decrypt_aes_cbc_fields(key, iv, encrypted_fields)
+    yield 'decrypt_aes_cbc_fields', 'per-field', size, decrypt_per_field
+
+
+def key_cases():
+    for size in (16, 32):
+        key = os.urandom(size)
+        base64_key, hex_key = pack_key_base64(key).encode('utf-8'), pack_key_hex(key).encode('utf-8')
+        yield 'pack_key_base64', 'base64', size, lambda k=key: pack_key_base64(k)
+        yield 'unpack_key_base64', 'base64', size, lambda k=base64_key: unpack_key_base64(k)
+        yield 'pack_key_hex', 'binascii', size, lambda k=key: pack_key_hex(k)
+        yield 'unpack_key_hex', 'binascii', size, lambda k=hex_key: unpack_key_hex(k)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'pycryptodome': Crypto.__version__,
+        'openssl': ssl.OPENSSL_VERSION,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lib.utils crypto primitives ops/sec and latency percentiles")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 256, 4096, 65536, 1048576],
+                        help="payload sizes of encrypt_aes_cbc/decrypt_aes_cbc in bytes")
+    parser.add_argument('--repeat', type=int, default=2000, help="calls per case")
+    parser.add_argument('--max-time', type=float, default=2, help="seconds per case (at least 5 calls are timed)")
+    parser.add_argument('--iterations', type=int, default=1000000, help="PBKDF2 iterations of hash_password")
+    parser.add_argument('--hash-repeat', type=int, default=10, help="calls per hash_password case")
+    parser.add_argument('--output', default='bench_crypto.json', help="JSON results file")
+    args = parser.parse_args()
+
+    cases = [(case, args.hash_repeat) for case in hash_cases(args.iterations)]
+    cases += [(case, args.repeat) for case in (*aes_cases(args.sizes), *fields_cases(), *key_cases())]
+
+    results = []
+    print(f"{'primitive':<24} {'backend':<13} {'size':>9} {'calls':>6} {'ops/s':>11} {'mean us':>11} {'p50 us':>11} "
+          f"{'p90 us':>11} {'p99 us':>11}")
+    for (primitive, backend, size, call), repeat in cases:
+        result = {'primitive': primitive, 'backend': backend, 'size': size,
+                  **time_calls(call, repeat, args.max_time)}
+        results.append(result)
+        print(f"{primitive:<24} {backend:<13} {size:>9} {result['calls']:>6} {result['ops_per_second']:>11.1f} "
+              f"{result['mean_us']:>11.2f} {result['p50_us']:>11.2f} {result['p90_us']:>11.2f} "
+              f"{result['p99_us']:>11.2f}")
+
+    with open(args.output, 'w') as file:
+        json.dump({'environment': environment(), 'parameters': vars(args), 'results': results}, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
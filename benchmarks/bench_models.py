@@ -0,0 +1,103 @@
+"""
+Module: bench_models.py
+
+Benchmark of the KDC db models lookups versus the registry size.
+
+For every registry size a clients file and a servers file are generated in a temporary directory and loaded by the
+models, then random existing records are looked up:
+    - Clients.get_password_hash_by_client_id (ticket request, 1027)
+    - Clients.is_exist (registration, 1024)
+    - Servers.get_aes_key_by_server_id (ticket request, 1027)
+
+Usage (from the repository root):
+    python -m benchmarks.bench_models [--sizes 1000 10000 100000 1000000] [--lookups 10000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from KDC.db.models.Clients import Clients
+from KDC.db.models.Servers import Servers
+from lib.utils import pack_key_hex, pack_key_base64
+
+
+def write_registry(directory, size):
+    """
+    Writes a clients file and a servers file with `size` records each.
+
+    Returns:
+        tuple: (clients file path, servers file path, client ids, client names, server ids)
+    """
+    client_ids, client_names, server_ids = [], [], []
+    clients_path = os.path.join(directory, f'clients_{size}')
+    servers_path = os.path.join(directory, f'servers_{size}')
+
+    with open(clients_path, 'w') as clients_file, open(servers_path, 'w') as servers_file:
+        for i in range(size):
+            client_id, name, server_id = f'{i:016x}', f'client{i}', f'{size + i:016x}'
+            client_ids.append(client_id)
+            client_names.append(name)
+            server_ids.append(server_id)
+
+            clients_file.write(f"{pack_key_hex(client_id.encode('utf-8'))}:{name}:"
+                               f"{pack_key_base64(os.urandom(32))}:{time.time()}\n")
+            servers_file.write(f"{pack_key_hex(server_id.encode('utf-8'))}:server{i}:127.0.0.1:{8000 + i % 1000}:"
+                               f"{pack_key_base64(os.urandom(32))}\n")
+
+    return clients_path, servers_path, client_ids, client_names, server_ids
+
+
+def model_file_path(path):
+    # the models open os.getcwd() + file_path
+    return '/' + os.path.relpath(path, os.getcwd())
+
+
+def time_lookups(lookup, keys):
+    """
+    Returns:
+        dict: mean/p50/p99 latency of a single lookup in microseconds.
+    """
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        lookup(key)
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    latencies.sort()
+    return {
+        'mean_us': statistics.fmean(latencies),
+        'p50_us': latencies[len(latencies) // 2],
+        'p99_us': latencies[int(len(latencies) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KDC db models lookup latency versus registry size")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'lookup':<32} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            clients_path, servers_path, client_ids, client_names, server_ids = write_registry(directory, size)
+            clients = Clients(model_file_path(clients_path))
+            servers = Servers(model_file_path(servers_path))
+
+            lookups = {
+                'get_password_hash_by_client_id': (clients.get_password_hash_by_client_id, client_ids),
+                'is_exist (client)': (lambda name: clients.is_exist({'name': name}), client_names),
+                'get_aes_key_by_server_id': (servers.get_aes_key_by_server_id, server_ids),
+            }
+            for name, (lookup, keys) in lookups.items():
+                result = time_lookups(lookup, random.choices(keys, k=args.lookups))
+                print(f"{size:>10} {name:<32} {result['mean_us']:>10.2f} {result['p50_us']:>10.2f} "
+                      f"{result['p99_us']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Module: bench_replay_cache.py
+
+Benchmark of lib.ReplayCache at high insert rates.
+
+Fresh random keys are checked at a simulated rate (the clock is simulated, so the run is not bound by the real rate)
+for several windows, with a small share of replays. For each configuration (with and without the Bloom filter front) it
+reports the cost of a check, the share of checks answered by the Bloom filter alone, and the number of remembered keys
+at the end, which must stay below rate * (window + bucket_span) whatever the duration of the run.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_replay_cache [--rates 10000 100000] [--window 30] [--windows 3] [--replay-share 0.01]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from lib.ReplayCache import ReplayCache
+
+
+def cache_memory(cache):
+    # the sets, the keys (all of the same size) and the Bloom filters
+    memory = 0
+    for _, keys in cache.buckets:
+        memory += sys.getsizeof(keys) + sum(sys.getsizeof(key) for key in keys)
+    for _, bloom in cache.blooms:
+        memory += sys.getsizeof(bloom.array)
+
+    return memory
+
+
+def run(rate, window, windows, replay_share, bloom_bits):
+    """
+    Returns:
+        dict: The results of a run.
+    """
+    cache = ReplayCache(window=window, bloom_bits=bloom_bits)
+    total = int(rate * window * windows)
+    step = 1 / rate
+    recent = []
+    missed_replays = 0
+
+    now = 1_700_000_000.0
+    start = time.perf_counter()
+    for i in range(total):
+        now += step
+        if recent and random.random() < replay_share:
+            # a replay of a key of the last seconds
+            if cache.check_and_add(random.choice(recent), now):
+                missed_replays += 1
+        else:
+            key = os.urandom(24)
+            cache.check_and_add(key, now)
+            recent.append(key)
+            if len(recent) > 1000:
+                recent = recent[500:]
+    elapsed = time.perf_counter() - start
+
+    stats = cache.stats()
+    return {
+        'checks': total,
+        'us_per_check': elapsed / total * 1e6,
+        'checks_per_second': total / elapsed,
+        'keys': stats['keys'],
+        'max_keys': int(rate * (window + cache.bucket_span)),
+        'bloom_skip_share': stats['bloom_skips'] / total,
+        'missed_replays': missed_replays,
+        'memory_mb': cache_memory(cache) / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lib.ReplayCache check cost and memory at high insert rates")
+    parser.add_argument('--rates', type=int, nargs='+', default=[10000, 100000], help="simulated checks per second")
+    parser.add_argument('--window', type=float, default=30, help="acceptance window in seconds")
+    parser.add_argument('--windows', type=float, default=3, help="duration of the run, in windows")
+    parser.add_argument('--replay-share', type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'rate/s':>8} {'bloom':>6} {'checks':>10} {'us/check':>9} {'checks/s':>10} {'keys':>9} {'max keys':>9} "
+          f"{'bloom skip':>10} {'missed':>6} {'MB':>8}")
+    for rate in args.rates:
+        keys_per_window = int(rate * args.window)
+        for bloom_bits in (0, 10 * keys_per_window):
+            result = run(rate, args.window, args.windows, args.replay_share, bloom_bits)
+            print(f"{rate:>8} {'on' if bloom_bits else 'off':>6} {result['checks']:>10} "
+                  f"{result['us_per_check']:>9.2f} {result['checks_per_second']:>10.0f} {result['keys']:>9} "
+                  f"{result['max_keys']:>9} {result['bloom_skip_share']:>10.1%} {result['missed_replays']:>6} "
+                  f"{result['memory_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Module: loadgen.py
+
+End-to-end load generator of the full Kerberos flow.
+
+It starts a KDC and N Messages servers as subprocesses on free local ports, with a scratch registry, credentials files and
+tickets snapshots in a work directory, then drives M concurrent synthetic clients through:
+    - register: registration at the KDC (1024 -> 1600)
+    - servers_list: servers list (1026 -> 1602)
+    - ticket: ticket request for one of the servers (1027 -> 1603)
+    - key_delivery: authenticator and ticket to the Messages server (1028 -> 1604)
+    - message: a stream of messages (1029 -> 1605)
+
+Every request is timed from the client side (connections are kept alive as by the real client). A step that does not
+get its expected response is counted under the response code (e.g. 1601, 1609) or under 'exception' (refused, timed
+out), and the client stops there. The key derived from the password (PBKDF2, like the KDC does on registration) is
+computed once per client and is not part of the timed steps.
+
+The clients are threads, spread over `--processes` processes so the client side does not become the bottleneck. The
+report gives, per step, the throughput (successful requests per second over the span of the step) and the p50/p95/p99
+latency, it is printed and written as JSON with the request metrics of every server (stats request, 1030) at the end of
+the run.
+
+Usage (from the repository root):
+    python -m benchmarks.loadgen [--clients 20] [--msg-servers 2] [--messages 10] [--message-size 100]
+                                 [--processes 1] [--engine threads] [--output loadgen.json] [--work-dir DIR]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import lib.utils
+from benchmarks.bench_crypto import environment
+from lib.ConnectionPool import ConnectionPool
+from lib.config import __api_version__, salt
+from lib.utils import send_request, hash_password, encrypt_aes_cbc, encrypt_aes_cbc_fields, decrypt_aes_cbc_fields
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = '127.0.0.1'
+STEPS = ('register', 'servers_list', 'ticket', 'key_delivery', 'message')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, log_path, timeout):
+    """
+    Waits until the server process accepts connections on the port.
+
+    Raises:
+        RuntimeError: If the process exits or does not listen before the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+    with open(log_path) as log_file:
+        log_tail = ''.join(log_file.readlines()[-20:])
+    raise RuntimeError(f"The server of '{log_path}' is not listening on port {port}:\n{log_tail}")
+
+
+def start_server(args, log_path):
+    log_file = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, '-u', *args], stdout=log_file, stderr=subprocess.STDOUT,
+                               stdin=subprocess.DEVNULL)
+    log_file.close()  # the process holds its own descriptor
+
+    return process
+
+
+def start_servers(work_dir, msg_servers, engine, timeout, run_id):
+    """
+    Starts the KDC and the Messages servers, each Messages server registers at the KDC on start.
+
+    Returns:
+        tuple: (the server processes, the KDC first, {server name: port})
+    """
+    kdc_port = free_port()
+    db_dir = os.path.join(work_dir, 'kdc')
+    os.makedirs(db_dir)
+    kdc_info_path = os.path.join(work_dir, 'srv.info')
+    with open(kdc_info_path, 'w') as file:
+        file.write(f'{HOST}:{kdc_port}')
+
+    kdc_log = os.path.join(work_dir, 'kdc.log')
+    kdc = start_server([os.path.join(ROOT, 'KDC', 'app.py'), '--engine', engine, '--port', str(kdc_port),
+                        '--db-dir', db_dir], kdc_log)
+    processes = [kdc]
+    ports = {'kdc': kdc_port}
+    wait_for_port(kdc_port, kdc, kdc_log, timeout)
+
+    for i in range(msg_servers):
+        port = free_port()
+        creds_path = os.path.join(work_dir, f'msg{i}.info')
+        with open(creds_path, 'w') as file:
+            file.write(f'{HOST}:{port}\nloadgen-{run_id}-{i}')
+
+        msg_log = os.path.join(work_dir, f'msg{i}.log')
+        msg = start_server([os.path.join(ROOT, 'MSG', 'app.py'), '--engine', engine, '--creds', creds_path,
+                            '--kdc-info', kdc_info_path, '--tickets-snapshot', os.path.join(work_dir, f'tickets{i}')],
+                           msg_log)
+        processes.append(msg)
+        ports[f'msg{i}'] = port
+        wait_for_port(port, msg, msg_log, timeout)
+
+    return processes, ports
+
+
+def stop_servers(processes, timeout=30):
+    # the servers shut down gracefully on SIGINT (journals compacted, tickets snapshot written)
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for process in processes:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def fetch_stats(port):
+    """
+    Returns:
+        dict: The request metrics of the server (stats request, 1030 -> 1606), None if they cannot be fetched.
+    """
+    try:
+        response = send_request(HOST, port, {'header': {'client_id': 'loadgen', 'version': __api_version__,
+                                                        'code': 1030}})
+    except Exception:
+        return None
+
+    if response['header']['code'] != 1606:
+        return None
+
+    return json.loads(response['payload']['stats'])
+
+
+def timed_request(records, step, address, request, expected_code):
+    """
+    Sends a request and records (step, start, latency, outcome), the outcome being 'ok', the unexpected response code
+    or 'exception'.
+
+    Returns:
+        dict: The response, None if it is not the expected one.
+    """
+    start = time.monotonic()
+    try:
+        response = send_request(*address, request)
+    except Exception:
+        records.append((step, start, time.monotonic() - start, 'exception'))
+        return None
+
+    code = response['header']['code']
+    records.append((step, start, time.monotonic() - start, 'ok' if code == expected_code else code))
+
+    return response if code == expected_code else None
+
+
+def run_client(index, kdc_address, run_id, messages, message, records):
+    """
+    Drives one synthetic client through the whole flow, stops at the first failed step.
+    """
+    name, password = f'loadgen-{run_id}-client{index}', secrets.token_hex(16)
+
+    response = timed_request(records, 'register', kdc_address, {
+        'header': {'client_id': 'undefined', 'version': __api_version__, 'code': 1024},
+        'payload': {'name': name, 'password': password}
+    }, 1600)
+    if response is None:
+        return
+    client_id = response['payload']['client_id']
+
+    response = timed_request(records, 'servers_list', kdc_address, {
+        'header': {'client_id': client_id, 'version': __api_version__, 'code': 1026}
+    }, 1602)
+    if not response or not response['payload']:
+        return
+    server = response['payload'][index % len(response['payload'])]
+    server_address = (server['server_ip'], server['server_port'])
+
+    client_key = hash_password(password, salt)
+    nonce = secrets.token_bytes(8)
+    response = timed_request(records, 'ticket', kdc_address, {
+        'header': {'client_id': client_id, 'version': __api_version__, 'code': 1027},
+        'payload': {'server_id': server['server_id'], 'nonce': nonce}
+    }, 1603)
+    if response is None:
+        return
+    symmetric_key = response['payload']['symmetric_key']
+    iv = symmetric_key['symm_iv']
+    session_key, decrypted_nonce = decrypt_aes_cbc_fields(client_key, iv, (symmetric_key['aes_key'],
+                                                                          symmetric_key['nonce']))
+    if decrypted_nonce != nonce:
+        records.append(('ticket', time.monotonic(), 0, 'bad nonce'))
+        return
+
+    auth_iv, (version, encrypted_client_id, encrypted_server_id, timestamp) = encrypt_aes_cbc_fields(
+        session_key, (str(__api_version__).encode('utf-8'), client_id.encode('utf-8'),
+                      server['server_id'].encode('utf-8'), str(time.time()).encode('utf-8')))
+    response = timed_request(records, 'key_delivery', server_address, {
+        'header': {'client_id': client_id, 'version': __api_version__, 'code': 1028},
+        'payload': {
+            'authenticator': {'auth_iv': auth_iv, 'version': version, 'client_id': encrypted_client_id,
+                              'server_id': encrypted_server_id, 'timestamp': timestamp},
+            'ticket': response['payload']['ticket']
+        }
+    }, 1604)
+    if response is None:
+        return
+
+    _, encrypted_message = encrypt_aes_cbc(session_key, message, iv)
+    for _ in range(messages):
+        response = timed_request(records, 'message', server_address, {
+            'header': {'client_id': client_id, 'version': __api_version__, 'code': 1029},
+            'payload': {'message_size': len(encrypted_message), 'iv': iv, 'message_content': encrypted_message}
+        }, 1605)
+        if response is None:
+            return
+
+
+def run_clients(first_index, count, kdc_address, run_id, messages, message_size):
+    """
+    Runs `count` clients concurrently (one thread each), in a client process.
+
+    Returns:
+        list: The records of all the requests.
+    """
+    # keep a connection alive per client thread
+    lib.utils.connection_pool = ConnectionPool(max_size=count)
+
+    records = []
+    message = b'x' * message_size
+    threads = [threading.Thread(target=run_client, args=(first_index + i, kdc_address, run_id, messages, message,
+                                                         records)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lib.utils.connection_pool.close_all()
+    return records
+
+
+def percentile(latencies, share):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * share))]
+
+
+def report(records):
+    """
+    Returns:
+        dict: step -> requests, successes, errors by outcome, throughput and latency percentiles (ms).
+    """
+    steps = {}
+    for step in STEPS:
+        step_records = [record for record in records if record[0] == step]
+        latencies = sorted(latency * 1e3 for _, _, latency, outcome in step_records if outcome == 'ok')
+        errors = {}
+        for _, _, _, outcome in step_records:
+            if outcome != 'ok':
+                errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+
+        span = (max(start + latency for _, start, latency, _ in step_records) -
+                min(start for _, start, _, _ in step_records)) if step_records else 0
+        steps[step] = {
+            'requests': len(step_records),
+            'ok': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / span if span else 0,
+            'p50_ms': percentile(latencies, 0.5) if latencies else None,
+            'p95_ms': percentile(latencies, 0.95) if latencies else None,
+            'p99_ms': percentile(latencies, 0.99) if latencies else None,
+            'max_ms': latencies[-1] if latencies else None,
+        }
+
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load generator of the KDC and Messages servers")
+    parser.add_argument('--clients', type=int, default=20, help="concurrent synthetic clients")
+    parser.add_argument('--msg-servers', type=int, default=2, help="Messages servers, the clients are spread on them")
+    parser.add_argument('--messages', type=int, default=10, help="messages sent by every client")
+    parser.add_argument('--message-size', type=int, default=100, help="bytes of every message")
+    parser.add_argument('--processes', type=int, default=1, help="client processes, the clients are spread on them")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads', help="servers engine")
+    parser.add_argument('--startup-timeout', type=float, default=30, help="seconds a server may take to listen")
+    parser.add_argument('--output', default='loadgen.json', help="JSON results file")
+    parser.add_argument('--work-dir', help="directory of the servers files and logs, a temporary one by default")
+    args = parser.parse_args()
+
+    run_id = secrets.token_hex(4)
+    with tempfile.TemporaryDirectory(prefix='loadgen-') as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+        processes, ports = start_servers(work_dir, args.msg_servers, args.engine, args.startup_timeout, run_id)
+        kdc_port = ports['kdc']
+        try:
+            print(f"KDC on port {kdc_port} and {args.msg_servers} Messages servers started in '{work_dir}', "
+                  f"running {args.clients} clients")
+            records = []
+            start = time.monotonic()
+            with concurrent.futures.ProcessPoolExecutor(args.processes) as executor:
+                shares = [args.clients // args.processes + (i < args.clients % args.processes)
+                          for i in range(args.processes)]
+                futures = [executor.submit(run_clients, sum(shares[:i]), share, (HOST, kdc_port), run_id,
+                                           args.messages, args.message_size)
+                           for i, share in enumerate(shares) if share]
+                for future in futures:
+                    records += future.result()
+            duration = time.monotonic() - start
+
+            # the servers side view of the same run
+            server_stats = {name: fetch_stats(port) for name, port in ports.items()}
+        finally:
+            stop_servers(processes)
+
+    steps = report(records)
+    print(f"{'step':<13} {'requests':>8} {'ok':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9}  errors")
+    for step, result in steps.items():
+        latencies = ' '.join(f"{result[key]:>9.2f}" if result[key] is not None else f"{'-':>9}"
+                             for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+        errors = ', '.join(f"{outcome}: {count}" for outcome, count in result['errors'].items()) or '-'
+        print(f"{step:<13} {result['requests']:>8} {result['ok']:>8} {result['throughput']:>9.1f} {latencies}  "
+              f"{errors}")
+    print(f"{args.clients} clients in {duration:.2f}s")
+
+    with open(args.output, 'w') as file:
+        json.dump({'environment': environment(), 'parameters': vars(args), 'duration': duration, 'steps': steps,
+                   'server_stats': server_stats}, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+"""
+Module: Connection.py
+
+This module defines the Connection class, a thin wrapper of an accepted socket which keeps the state of the connection
+between the frames it serves.
+
+Attributes:
+    - sock (socket.socket): The wrapped socket, every other attribute is delegated to it.
+    - keep_alive (bool): True if the client asked to keep the connection open after the current frame.
+    - response_code (int): The code of the response sent for the current frame, None before it is sent.
+    - send_time (float): Seconds spent sending the response of the current frame (see lib.Metrics).
+"""
+
+
+class Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.keep_alive = False
+        self.response_code = None
+        self.send_time = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
@@ -0,0 +1,115 @@
+"""
+Module: ConnectionPool.py
+
+This module defines the ConnectionPool class, a thread-safe pool of client connections keyed by server address.
+
+A connection is returned to the pool only if the server agreed to keep it alive (it echoed `lib.config.keep_alive_flag`),
+so servers which close after every frame simply get a new connection per request. Pooled connections are health checked
+before they are reused and evicted once they are idle for `max_idle_time` seconds, which should stay below the idle
+timeout of the servers.
+
+Methods:
+- __init__: Initializes the pool with its limits.
+- acquire: Returns an idle healthy connection to the address, or a new one.
+- release: Returns a connection to the pool, or closes it.
+- evict_idle: Closes the connections which were idle for too long.
+- close_all: Closes all the idle connections.
+"""
+
+import select
+import socket
+import threading
+import time
+
+
+def is_healthy(connection):
+    """
+    Check that an idle connection can be reused.
+    An idle connection should have nothing to read, if it is readable the server closed it (or sent garbage).
+
+    Args:
+        connection (socket.socket): The idle connection.
+
+    Returns:
+        bool: True if the connection can be reused.
+    """
+    try:
+        readable, _, _ = select.select([connection], [], [], 0)
+    except (OSError, ValueError):
+        return False
+
+    return not readable
+
+
+class ConnectionPool:
+
+    def __init__(self, max_size=8, max_idle_time=20):
+        """
+        Params:
+        - max_size (int): Maximum number of idle connections kept per address.
+        - max_idle_time (float): Seconds an idle connection is kept before it is closed.
+        """
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.idle = {}  # (ip, port) -> [(connection, released_at), ...]
+        self.lock = threading.Lock()
+
+    def acquire(self, address):
+        """
+        Returns:
+            tuple: (connection, is_reused)
+        """
+        self.evict_idle()
+
+        while True:
+            with self.lock:
+                idle_connections = self.idle.get(address)
+                if not idle_connections:
+                    break
+                connection, _ = idle_connections.pop()  # the most recently used is the most likely to be alive
+
+            if is_healthy(connection):
+                return connection, True
+            connection.close()
+
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            connection.connect(address)
+        except Exception:
+            connection.close()
+            raise
+
+        return connection, False
+
+    def release(self, address, connection, keep_alive):
+        if keep_alive:
+            with self.lock:
+                idle_connections = self.idle.setdefault(address, [])
+                if len(idle_connections) < self.max_size:
+                    idle_connections.append((connection, time.monotonic()))
+                    return
+
+        connection.close()
+
+    def evict_idle(self):
+        expired = []
+        deadline = time.monotonic() - self.max_idle_time
+        with self.lock:
+            for address, idle_connections in self.idle.items():
+                # connections are appended in release order, so the expired ones are at the start
+                expired_count = 0
+                while expired_count < len(idle_connections) and idle_connections[expired_count][1] < deadline:
+                    expired_count += 1
+                expired += idle_connections[:expired_count]
+                del idle_connections[:expired_count]
+
+        for connection, _ in expired:
+            connection.close()
+
+    def close_all(self):
+        with self.lock:
+            idle_connections = [connection for connections in self.idle.values() for connection, _ in connections]
+            self.idle.clear()
+
+        for connection in idle_connections:
+            connection.close()
@@ -0,0 +1,282 @@
+"""
+Module: Metrics.py
+
+This module defines the Metrics class, the thread-safe request instrumentation shared by the KDC and the Messages
+server, and the optional Prometheus text endpoint serving it.
+
+For every request code the servers count the requests, the requests in flight, the responses by response code (the
+errors 1601/1609 among them) and the exceptions raised by the controllers, and keep a latency histogram of each phase
+of a request:
+    - decode: receiving the frame (once its first bytes arrived) and unpacking it,
+    - controller: running the controller, its sending excluded,
+    - send: packing and sending the response.
+
+The histograms have fixed buckets (cumulative counts, like Prometheus), so recording a request is a few additions
+whatever the traffic and the percentiles of a snapshot are estimated from the buckets (the upper bound of the bucket).
+Gauges computed on demand (e.g. the worker pool queue depth) can be added with `add_gauge`.
+
+The metrics are read with the stats request (1030 -> 1606, a JSON snapshot) on the protocol port, or in the Prometheus
+text format on `http://127.0.0.1:<metrics port>/metrics` when the server is started with --metrics-port.
+
+Classes:
+- Histogram: Cumulative latency histogram with fixed buckets.
+- Metrics: Per request code counters, in-flight gauges, errors and phase histograms.
+
+Functions:
+- start_metrics_server: Serves the Prometheus text format of the metrics on a local port.
+- stop_metrics_server: Stops it.
+"""
+
+import bisect
+import http.server
+import json
+import logging
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PHASES = ('decode', 'controller', 'send')
+ERROR_RESPONSE_CODES = (1601, 1609)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+
+        return counts
+
+    def percentile(self, share):
+        # the upper bound of the bucket holding the percentile, None above the last bucket
+        rank = share * self.count
+        for bound, count in zip(self.buckets, self.cumulative_counts()):
+            if count >= rank:
+                return bound
+
+        return None
+
+
+class Metrics:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Params:
+        - buckets (tuple): Upper bounds of the latency histograms buckets in seconds.
+        """
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+        self.requests = {}  # request code -> requests
+        self.in_flight = {}  # request code -> requests being served
+        self.responses = {}  # (request code, response code) -> responses
+        self.exceptions = {}  # request code -> exceptions raised while serving a request
+        self.latencies = {}  # (request code, phase) -> Histogram
+        self.gauges = {}  # name -> function returning the value
+
+    def start_request(self, code):
+        with self.lock:
+            self.in_flight[code] = self.in_flight.get(code, 0) + 1
+
+    def end_request(self, code, phase_times, response_code=None, is_exception=False, in_flight=True):
+        """
+        Records a served request.
+
+        Params:
+        - code (str): The request code, 'undecoded' for a frame which could not be unpacked.
+        - phase_times (dict): Seconds spent in each phase (decode, controller, send).
+        - response_code (int): The code of the response sent, None if no response was sent.
+        - is_exception (bool): True if the request raised an exception.
+        - in_flight (bool): True if the request was counted in flight by start_request.
+        """
+        with self.lock:
+            if in_flight:
+                self.in_flight[code] -= 1
+            self.requests[code] = self.requests.get(code, 0) + 1
+            if response_code is not None:
+                self.responses[code, response_code] = self.responses.get((code, response_code), 0) + 1
+            if is_exception:
+                self.exceptions[code] = self.exceptions.get(code, 0) + 1
+
+            for phase, seconds in phase_times.items():
+                histogram = self.latencies.get((code, phase))
+                if histogram is None:
+                    histogram = self.latencies[code, phase] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+    def add_gauge(self, name, function):
+        """
+        Params:
+        - name (str): The gauge name, e.g. 'tickets'.
+        - function (callable): Returns the current value, called on every snapshot. A function returning a dict (e.g.
+                               WorkerPool.stats) adds a gauge per key, named '<name>_<key>'.
+        """
+        self.gauges[name] = function
+
+    def gauge_values(self):
+        values = {}
+        for name, function in self.gauges.items():
+            value = function()
+            if isinstance(value, dict):
+                values.update((f'{name}_{key}', key_value) for key, key_value in value.items())
+            else:
+                values[name] = value
+
+        return values
+
+    def snapshot(self):
+        """
+        Returns:
+        - dict: The metrics by request code (requests, in flight, responses, errors, exceptions and the latency of each
+                phase in seconds), and the gauges.
+        """
+        with self.lock:
+            codes = sorted(set(self.requests) | set(self.in_flight))
+            routes = {}
+            for code in codes:
+                responses = {str(response_code): count
+                             for (request_code, response_code), count in self.responses.items() if request_code == code}
+                latency = {}
+                for phase in PHASES:
+                    histogram = self.latencies.get((code, phase))
+                    if histogram is not None:
+                        latency[phase] = {
+                            'count': histogram.count,
+                            'mean': histogram.sum / histogram.count,
+                            'p50': histogram.percentile(0.5),
+                            'p95': histogram.percentile(0.95),
+                            'p99': histogram.percentile(0.99),
+                        }
+
+                routes[code] = {
+                    'requests': self.requests.get(code, 0),
+                    'in_flight': self.in_flight.get(code, 0),
+                    'responses': responses,
+                    'errors': sum(count for response_code, count in responses.items()
+                                  if int(response_code) in ERROR_RESPONSE_CODES),
+                    'exceptions': self.exceptions.get(code, 0),
+                    'latency': latency,
+                }
+
+        return {
+            'uptime': time.time() - self.started,
+            'routes': routes,
+            'gauges': self.gauge_values(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot()).encode('utf-8')
+
+    def prometheus_text(self, prefix):
+        """
+        Params:
+        - prefix (str): Prefix of the metric names, e.g. 'kdc'.
+
+        Returns:
+        - str: The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{label}="{label_value}"' for label, label_value in labels.items())
+                lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {value}" if labels else
+                             f"{prefix}_{name}{suffix} {value}")
+
+        with self.lock:
+            metric('requests_total', 'counter', "Requests served, by request code.",
+                   [('', {'code': code}, count) for code, count in sorted(self.requests.items())])
+            metric('requests_in_flight', 'gauge', "Requests being served, by request code.",
+                   [('', {'code': code}, count) for code, count in sorted(self.in_flight.items())])
+            metric('responses_total', 'counter', "Responses sent, by request code and response code.",
+                   [('', {'code': code, 'response': response_code}, count)
+                    for (code, response_code), count in sorted(self.responses.items())])
+            metric('errors_total', 'counter', "Error responses (1601, 1609) sent, by request code and response code.",
+                   [('', {'code': code, 'response': response_code}, count)
+                    for (code, response_code), count in sorted(self.responses.items())
+                    if response_code in ERROR_RESPONSE_CODES])
+            metric('exceptions_total', 'counter', "Exceptions raised while serving a request, by request code.",
+                   [('', {'code': code}, count) for code, count in sorted(self.exceptions.items())])
+
+            samples = []
+            for (code, phase), histogram in sorted(self.latencies.items()):
+                labels = {'code': code, 'phase': phase}
+                for bound, count in zip((*self.buckets, '+Inf'), histogram.cumulative_counts()):
+                    samples.append(('_bucket', {**labels, 'le': bound}, count))
+                samples.append(('_sum', labels, histogram.sum))
+                samples.append(('_count', labels, histogram.count))
+            metric('request_phase_seconds', 'histogram', "Latency of the phases (decode, controller, send) of the "
+                                                         "requests, by request code.", samples)
+
+        for name, value in self.gauge_values().items():
+            metric(name, 'gauge', name.replace('_', ' ').capitalize() + '.', [('', {}, value)])
+
+        return '\n'.join(lines) + '\n'
+
+
+"""
+metrics: Metrics
+    The metrics of the requests served by the process, shared by the serving engines and the stats controller.
+"""
+metrics = Metrics()
+
+metrics_server = None
+
+
+def start_metrics_server(port, prefix, host='127.0.0.1'):
+    """
+    Serves the Prometheus text format of the metrics on http://host:port/metrics from a daemon thread.
+
+    Params:
+    - port (int): The port of the endpoint.
+    - prefix (str): Prefix of the metric names, e.g. 'kdc'.
+    - host (str): The address of the endpoint, local only by default.
+    """
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = metrics.prometheus_text(prefix).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # no line per scrape
+
+    global metrics_server
+    metrics_server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Metrics are served", extra={'url': f"http://{host}:{port}/metrics"})
+
+
+def stop_metrics_server():
+    global metrics_server
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+        metrics_server = None
@@ -0,0 +1,138 @@
+"""
+Module: ReplayCache.py
+
+This module defines the ReplayCache class, a thread-safe cache of the keys (nonces, authenticators) seen during an
+acceptance window, used to reject replayed requests.
+
+The keys are stored in time buckets (sets of `bucket_span` seconds). A bucket is dropped as a whole once its whole span
+is older than the window, so there is no per-key expiry work and the memory is bounded by the number of keys received
+during a window, not by the total traffic. A check looks the key up in the window / bucket_span + 1 buckets, a constant.
+
+An optional Bloom filter in front of the buckets answers "never seen" for most fresh keys with a single hash, without
+looking into the buckets. It has two generations of one window each (the older one is dropped when the window passes),
+so it only ever holds the keys of the last two windows. A Bloom positive is confirmed in the buckets, so a false
+positive never rejects a fresh key. The hashes are computed in Python, so the filter only pays off when a check has
+many buckets to look into (a long window of short buckets), see benchmarks/bench_replay_cache.py.
+
+Methods:
+- __init__: Initializes the cache with its window and bucket span.
+- expire: Drops the buckets (and the Bloom generation) which left the window.
+- check_and_add: Returns True for a fresh key (and remembers it), False for a replay.
+- __contains__: Checks if a key was seen during the window.
+- __len__: Number of remembered keys.
+- stats: Returns the number of keys, buckets and the Bloom filter hits.
+"""
+
+import collections
+import hashlib
+import threading
+import time
+
+
+class BloomFilter:
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def positions(self, key):
+        # one digest, split in `hashes` positions (double hashing)
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, positions):
+        for position in positions:
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def contains(self, positions):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in positions)
+
+
+class ReplayCache:
+
+    def __init__(self, window=300, bucket_span=10, bloom_bits=0, bloom_hashes=4):
+        """
+        Params:
+        - window (float): Seconds a key is remembered (at least), the acceptance window of the requests.
+        - bucket_span (float): Seconds of keys per bucket, a key may be remembered up to `bucket_span` seconds longer.
+        - bloom_bits (int): Bits of each generation of the Bloom filter, 0 disables it. About 10 bits per key received
+                            during a window give 1% false positives with 4 hashes.
+        - bloom_hashes (int): Hash functions of the Bloom filter.
+        """
+        self.window = window
+        self.bucket_span = bucket_span
+        self.buckets = collections.deque()  # (bucket number, set of keys), from the oldest to the newest
+        self.lock = threading.Lock()
+
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self.blooms = collections.deque()  # (generation number, BloomFilter), at most two
+        self.bloom_skips = 0  # checks answered by the Bloom filter alone
+        self.replays = 0
+
+    def expire(self, now):
+        # drop the buckets whose whole span is older than the window
+        oldest_bucket = int((now - self.window) // self.bucket_span)
+        while self.buckets and self.buckets[0][0] < oldest_bucket:
+            self.buckets.popleft()
+
+        if self.bloom_bits:
+            generation = int(now // self.window)
+            while self.blooms and self.blooms[0][0] < generation - 1:
+                self.blooms.popleft()
+            if not self.blooms or self.blooms[-1][0] != generation:
+                self.blooms.append((generation, BloomFilter(self.bloom_bits, self.bloom_hashes)))
+
+    def check_and_add(self, key, now=None):
+        """
+        Params:
+        - key (bytes): The nonce or authenticator, unique per legitimate request.
+        - now (float): The current time, time.time() by default.
+
+        Returns:
+        - bool: True if the key was not seen during the window (it is remembered), False if it is a replay.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            self.expire(now)
+
+            positions = None
+            maybe_seen = True
+            if self.bloom_bits:
+                positions = self.blooms[0][1].positions(key)
+                maybe_seen = any(bloom.contains(positions) for _, bloom in self.blooms)
+                if not maybe_seen:
+                    self.bloom_skips += 1
+
+            if maybe_seen and any(key in keys for _, keys in self.buckets):
+                self.replays += 1
+                return False
+
+            bucket = int(now // self.bucket_span)
+            if not self.buckets or self.buckets[-1][0] < bucket:  # a clock going back adds to the newest bucket
+                self.buckets.append((bucket, set()))
+            self.buckets[-1][1].add(key)
+            if positions is not None:
+                self.blooms[-1][1].add(positions)
+
+            return True
+
+    def __contains__(self, key):
+        with self.lock:
+            self.expire(time.time())
+            return any(key in keys for _, keys in self.buckets)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(keys) for _, keys in self.buckets)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'keys': sum(len(keys) for _, keys in self.buckets),
+                'buckets': len(self.buckets),
+                'replays': self.replays,
+                'bloom_skips': self.bloom_skips,
+            }
@@ -0,0 +1,222 @@
+"""
+Module: WorkerPool.py
+
+This module defines the WorkerPool class, a fixed-size pool of worker threads which serves accepted connections.
+
+Accepted connections wait in a bounded queue. Once the queue depth reaches the rejection threshold, new connections are
+rejected on the accepting thread: a prebuilt response (1609) is sent and the connection is closed, so a flood of
+requests can never grow the number of threads or the memory of the server. The request bytes already received from a
+rejected connection are drained (without blocking) after the response, closing a socket with unread data would reset
+the connection and the client could miss the response.
+
+Kept-alive connections do not hold a worker while they are idle: when the handler returns True the connection is parked
+in a selector watched by a single thread, and it is queued again once its next frame arrives (counted as requeued, the
+accepted/rejected counters only count the new connections). Parked connections are closed after `idle_timeout` seconds
+without a frame.
+
+Methods:
+- __init__: Initializes the pool with a connection handler and its limits.
+- start: Starts the worker threads.
+- submit: Queues an accepted connection, or rejects it when the queue is too deep.
+- reject: Sends the prebuilt rejection response and closes the connection.
+- park: Hands an idle kept-alive connection to the selector thread.
+- stats: Returns the queue depth and the accepted/rejected/requeued counters.
+- shutdown: Stops the worker threads once the queued connections are served.
+"""
+
+import collections
+import logging
+import queue
+import selectors
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REJECT_DRAIN_BYTES = 65536  # unread request bytes drained from a rejected connection before closing it
+
+
+class WorkerPool:
+
+    def __init__(self, handler, size=8, queue_size=256, reject_depth=None, reject_response=None, idle_timeout=30,
+                 max_idle=1024):
+        """
+        Params:
+        - handler (Callable[[socket.socket], bool]): Serves a frame of a connection. Returns True to keep the connection
+                                                     open (it is parked), otherwise it is responsible for closing it.
+        - size (int): Number of worker threads.
+        - queue_size (int): Maximum number of accepted connections waiting for a worker.
+        - reject_depth (int): Queue depth from which new connections are rejected, defaults to queue_size.
+        - reject_response (bytes): Packed response sent to rejected connections.
+        - idle_timeout (float): Seconds a parked connection may wait for its next frame.
+        - max_idle (int): Maximum number of parked connections, more are closed.
+        """
+        self.handler = handler
+        self.size = size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.reject_depth = queue_size if reject_depth is None else min(reject_depth, queue_size)
+        self.reject_response = reject_response
+
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.requeued = 0  # frames of kept-alive connections queued again
+        self.requeue_rejected = 0
+        self.busy = 0
+        self.workers = []
+
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self.parked = collections.OrderedDict()  # connection -> deadline, in deadline order
+        self.pending_park = collections.deque()
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        for i in range(self.size):
+            worker = threading.Thread(target=self.work, name=f"worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+        threading.Thread(target=self.watch_idle, name="idle-watcher", daemon=True).start()
+
+    def submit(self, connection, is_new=True):
+        """
+        Params:
+        - connection: The connection to serve.
+        - is_new (bool): False for the next frame of a kept-alive connection, counted apart from the new connections.
+        """
+        if self.queue.qsize() >= self.reject_depth:
+            self.reject(connection, is_new)
+            return False
+
+        try:
+            self.queue.put_nowait(connection)
+        except queue.Full:
+            self.reject(connection, is_new)
+            return False
+
+        with self.lock:
+            if is_new:
+                self.accepted += 1
+            else:
+                self.requeued += 1
+        return True
+
+    def reject(self, connection, is_new=True):
+        with self.lock:
+            if is_new:
+                self.rejected += 1
+            else:
+                self.requeue_rejected += 1
+
+        try:
+            if self.reject_response is not None:
+                connection.sendall(self.reject_response)
+            # end the connection gracefully: the unread request bytes would make close() reset it
+            connection.shutdown(socket.SHUT_WR)
+            connection.setblocking(False)
+            drained = 0
+            while drained < REJECT_DRAIN_BYTES:
+                data = connection.recv(REJECT_DRAIN_BYTES - drained)
+                if not data:
+                    break
+                drained += len(data)
+        except OSError:  # including BlockingIOError, nothing more to drain
+            pass
+        finally:
+            connection.close()
+
+    def work(self):
+        while True:
+            connection = self.queue.get()
+            if connection is None:  # shutdown
+                break
+
+            with self.lock:
+                self.busy += 1
+            try:
+                if self.handler(connection):
+                    self.park(connection)
+            except Exception as e:
+                logger.error("Error in worker", extra={'error': e})
+            finally:
+                with self.lock:
+                    self.busy -= 1
+
+    def park(self, connection):
+        self.pending_park.append(connection)
+        try:
+            self.wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+
+    def watch_idle(self):
+        self.wakeup_receiver.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+
+        while self.running:
+            timeout = None
+            if self.parked:
+                timeout = max(0, next(iter(self.parked.values())) - time.monotonic())
+
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.wakeup_receiver:
+                    try:
+                        while self.wakeup_receiver.recv(4096):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    continue
+
+                # the next frame (or the end of the connection) arrived, hand it back to the workers
+                connection = key.fileobj
+                self.selector.unregister(connection)
+                del self.parked[connection]
+                self.submit(connection, is_new=False)
+
+            while self.pending_park:
+                connection = self.pending_park.popleft()
+                if len(self.parked) >= self.max_idle:
+                    connection.close()
+                    continue
+                self.selector.register(connection, selectors.EVENT_READ)
+                self.parked[connection] = time.monotonic() + self.idle_timeout
+
+            # close the connections which were idle for too long
+            now = time.monotonic()
+            while self.parked and next(iter(self.parked.values())) <= now:
+                connection, _ = self.parked.popitem(last=False)
+                self.selector.unregister(connection)
+                connection.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.size,
+                'busy_workers': self.busy,
+                'queue_depth': self.queue.qsize(),
+                'queue_size': self.queue.maxsize,
+                'reject_depth': self.reject_depth,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'requeued': self.requeued,
+                'requeue_rejected': self.requeue_rejected,
+                'idle_connections': len(self.parked),
+            }
+
+    def shutdown(self):
+        self.running = False
+        try:
+            self.wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+
+        for _ in self.workers:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                break
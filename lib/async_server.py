@@ -0,0 +1,246 @@
+"""
+Module: async_server.py
+
+asyncio serving engine shared by the KDC and the Messages server.
+
+All the connections are served from a single event loop. A frame is received with asyncio streams, unpacked with the
+same codec as the threaded engine and dispatched to the same `routes` table, so the wire format is byte-identical.
+Connections whose client asks for keep-alive (`lib.config.keep_alive_flag`) serve frames until the client closes them or
+they stay idle for `keep_alive_timeout` seconds.
+Controllers of routes listed in `blocking_codes` (CPU-heavy or blocking I/O, e.g. password hashing) run in a worker
+thread so they never block the event loop.
+Every frame is recorded in the request metrics (lib.Metrics), its decode phase starts once its header arrived, so the
+idle time of a kept-alive connection is not counted.
+
+Classes:
+- StreamConnection: A connection object for the controllers which collects the data they send.
+
+Functions:
+- receive_header_async: Receives the header of a frame from an asyncio stream.
+- receive_data_async: Receives a single frame from an asyncio stream.
+- handle_stream: Serves a single client connection.
+- raise_open_files_limit: Raises the open files limit so the loop can hold thousands of connections.
+- serve_async: Runs the server until it is interrupted.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from lib.codec import compiled_package_dict
+from lib.config import package_dict
+from lib.log import log_request
+from lib.Metrics import metrics
+from lib.utils import unpack_data, send, is_keep_alive, REQUEST, RESPONSE
+
+logger = logging.getLogger(__name__)
+
+
+class StreamConnection:
+    """
+    A socket-like object given to the controllers instead of a real socket.
+    The data sent by the controller is collected and written to the stream by the event loop once the controller returns,
+    so controllers may safely run in worker threads.
+    """
+
+    def __init__(self):
+        self.buffers = []
+        self.keep_alive = False
+        self.response_code = None
+        self.send_time = 0.0
+
+    def sendall(self, data):
+        self.buffers.append(data)
+
+    def settimeout(self, timeout):
+        pass
+
+
+async def receive_header_async(reader: asyncio.StreamReader, packing_type: str, timeout=10) -> bytes:
+    """
+    Receive the header of a frame from an asyncio stream.
+
+    Parameters:
+    - reader (asyncio.StreamReader): The stream to read from.
+    - packing_type (str): Type of data packing ('request' or 'response').
+    - timeout (int): Timeout value for the header.
+
+    Returns:
+    bytes: The header.
+    """
+
+    header_struct = compiled_package_dict[packing_type]['header']['struct']
+    return await asyncio.wait_for(reader.readexactly(header_struct.size), timeout)
+
+
+async def receive_payload_async(reader: asyncio.StreamReader, packing_type: str, header_chunk: bytes,
+                                timeout=10) -> bytes:
+    """
+    Receive the rest of a frame whose header was received.
+
+    Returns:
+    bytes: The header followed by the payload.
+    """
+
+    header_struct = compiled_package_dict[packing_type]['header']['struct']
+    payload_size = header_struct.unpack_from(header_chunk)[-1]  # payload_size
+
+    payload_chunk = await asyncio.wait_for(reader.readexactly(payload_size), timeout)
+
+    return header_chunk + payload_chunk
+
+
+async def receive_data_async(reader: asyncio.StreamReader, packing_type: str, timeout=10) -> bytes:
+    """
+    Receive a single frame from an asyncio stream.
+
+    Parameters:
+    - reader (asyncio.StreamReader): The stream to read from.
+    - packing_type (str): Type of data packing ('request' or 'response').
+    - timeout (int): Timeout value for the frame.
+
+    Returns:
+    bytes: Received data.
+    """
+
+    header_chunk = await receive_header_async(reader, packing_type, timeout)
+    return await receive_payload_async(reader, packing_type, header_chunk, timeout)
+
+
+async def handle_stream(routes: dict, api_version: int, blocking_codes, keep_alive_timeout, server_logger,
+                        reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Serves a client connection: receives a request, runs its controller and sends back the response.
+    While the client asks to keep the connection alive, the next frames are served on the same connection.
+
+    Params:
+    - routes (dict): Request codes to controllers, '0' is the not found controller.
+    - api_version (int): The api version in the error response header.
+    - blocking_codes (Iterable[str]): Request codes whose controllers run in a worker thread.
+    - keep_alive_timeout (float): Seconds a kept-alive connection may stay idle between frames.
+    - server_logger (logging.Logger): The logger of the served requests and their errors.
+    - reader (asyncio.StreamReader), writer (asyncio.StreamWriter): The client connection streams.
+    """
+
+    frames_served = 0
+    try:
+        while True:
+            connection = StreamConnection()
+            controller = 'undefined'
+            metrics_code = None  # the route of the request, once the frame is decoded
+            phase_times = {}
+            is_exception = False
+            client_id = None
+            start = None
+            try:
+                # Receive request from client, the first frame has the same timeout as the threads engine
+                timeout = keep_alive_timeout if frames_served else 10
+                header_chunk = await receive_header_async(reader, REQUEST, timeout)
+                start = time.perf_counter()
+                data_receive = await receive_payload_async(reader, REQUEST, header_chunk, timeout)
+                req = unpack_data(package_dict, REQUEST, data_receive)
+
+                # keep the connection open for the next frames if the client asked for it
+                connection.keep_alive = is_keep_alive(req['header'])
+
+                req_code = str(req['header']['code'])
+                client_id = req['header']['client_id']
+
+                controller = routes.get(req_code, routes['0'])  # 0 means, not found
+                metrics_code = req_code if req_code in routes else '0'
+                metrics.start_request(metrics_code)
+                controller_start = time.perf_counter()
+                phase_times['decode'] = controller_start - start
+                if req_code in blocking_codes:
+                    await asyncio.to_thread(controller, connection, req)
+                else:
+                    controller(connection, req)
+                phase_times['controller'] = time.perf_counter() - controller_start - connection.send_time
+
+            except Exception as e:
+                # the client closed the connection, or the kept-alive connection stayed idle for too long
+                if start is None and (isinstance(e, asyncio.IncompleteReadError) and not e.partial or
+                                      isinstance(e, asyncio.TimeoutError) and frames_served):
+                    break
+                is_exception = True
+
+                server_logger.warning("Error during communication",
+                                      extra={'route': metrics_code or 'undecoded', 'client_id': client_id,
+                                             'controller': getattr(controller, '__name__', controller), 'error': e})
+
+                # Response to client in case of error
+                err_response = {
+                    'header': {
+                        'version': api_version,
+                        'code': 1609
+                    }
+                }
+                connection.keep_alive = False
+                send(connection, RESPONSE, err_response)
+
+            send_start = time.perf_counter()
+            writer.writelines(connection.buffers)
+            await writer.drain()
+            if start is not None:
+                phase_times['send'] = connection.send_time + time.perf_counter() - send_start
+                metrics.end_request(metrics_code or 'undecoded', phase_times, connection.response_code, is_exception,
+                                    in_flight=metrics_code is not None)
+                log_request(server_logger, metrics_code or 'undecoded', client_id, connection.response_code,
+                            time.perf_counter() - start)
+
+            if not connection.keep_alive:
+                break
+            frames_served += 1
+
+    except ConnectionError as e:
+        server_logger.warning("Error during communication", extra={'error': e})
+    finally:
+        writer.close()
+
+
+def raise_open_files_limit():
+    """
+    Raises the soft limit of open file descriptors to the hard limit, every idle connection holds one descriptor.
+    Does nothing on platforms without the `resource` module.
+    """
+
+    if resource is None:
+        return
+
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard_limit == resource.RLIM_INFINITY or soft_limit < hard_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+        except (ValueError, OSError):
+            pass
+
+
+async def serve_async(host: str, port: int, routes: dict, api_version: int, blocking_codes=(), backlog=100,
+                      keep_alive_timeout=30, server_logger=logger):
+    """
+    Runs an asyncio server on the given address until it is cancelled or interrupted.
+
+    Params:
+    - host (str), port (int): The address to listen on.
+    - routes (dict): Request codes to controllers, '0' is the not found controller.
+    - api_version (int): The api version in the error response header.
+    - blocking_codes (Iterable[str]): Request codes whose controllers run in a worker thread.
+    - backlog (int): The listen backlog of the server socket.
+    - keep_alive_timeout (float): Seconds a kept-alive connection may stay idle between frames.
+    - server_logger (logging.Logger): The logger of the served requests and their errors, e.g. the 'kdc' logger.
+    """
+
+    raise_open_files_limit()
+
+    client_connected = functools.partial(handle_stream, routes, api_version, frozenset(blocking_codes),
+                                         keep_alive_timeout, server_logger)
+    server = await asyncio.start_server(client_connected, host, port, backlog=backlog)
+
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,284 @@
+"""
+Module: codec.py
+
+Precompiled codec for the communication protocol described by `lib.config.package_dict`.
+
+`compile_package_dict` turns every header and payload entry of a package dictionary into a codec dictionary holding a
+ready `struct.Struct` object and direct field maps, so packing and unpacking a frame no longer has to recompute struct
+sizes, rebuild cycled format strings or flatten/unflatten key names.
+
+Codec dictionary fields:
+    - struct (struct.Struct): Compiled struct for one item (the last item excluded when its size is unknown).
+    - keys (tuple): The flattened keys of the item, as defined in `package_dict`.
+    - paths (tuple): The keys split into their nested path, e.g. ('ticket', 'aes_key').
+    - str_indexes (tuple): Indexes of the fields with `str` type that should be decoded after unpacking.
+    - is_list (bool): True if the payload is a list of items.
+    - is_last_item_has_unknown_size (bool): True if the last item is raw bytes with unknown length.
+
+The general `package_dict` is compiled once at import, other dictionaries are compiled on first use and cached.
+"""
+
+import struct
+
+from lib.config import package_dict as general_package_dict
+
+
+def compile_format(format_dict: dict) -> dict:
+    """
+    Compile a single header/payload entry of a package dictionary.
+
+    Parameters:
+    - format_dict (dict): A header or payload entry containing 'format', 'keys' and 'types'.
+
+    Returns:
+    dict: The codec dictionary of the entry.
+    """
+
+    keys = tuple(format_dict['keys'])
+    types = tuple(format_dict['types'])
+
+    return {
+        'struct': struct.Struct(format_dict['format']),
+        'keys': keys,
+        'paths': tuple(tuple(key.split('__')) for key in keys),
+        'str_indexes': tuple(i for i, value_type in enumerate(types) if value_type is str),
+        'is_list': 'is_list' in format_dict,
+        'is_last_item_has_unknown_size': 'is_last_item_has_unknown_size' in format_dict,
+    }
+
+
+def compile_package_dict(package_dict: dict) -> dict:
+    """
+    Compile all the headers and payloads of a package dictionary.
+
+    Parameters:
+    - package_dict (dict): Dictionary containing the data packing format.
+
+    Returns:
+    dict: {packing_type: {'header': codec, 'payload': {code: codec or None}}}
+    """
+
+    compiled = {}
+    for packing_type, packing_dict in package_dict.items():
+        compiled[packing_type] = {
+            'header': compile_format(packing_dict['header']),
+            'payload': {code: (compile_format(payload) if payload is not None else None)
+                        for code, payload in packing_dict['payload'].items()}
+        }
+
+    return compiled
+
+
+compiled_package_dict = compile_package_dict(general_package_dict)
+_compiled_cache = {id(general_package_dict): (general_package_dict, compiled_package_dict)}
+
+
+def get_compiled(package_dict: dict) -> dict:
+    """
+    Get the compiled codecs of a package dictionary, compiling it on first use.
+
+    Parameters:
+    - package_dict (dict): Dictionary containing the data packing format.
+
+    Returns:
+    dict: The compiled package dictionary.
+    """
+
+    cached = _compiled_cache.get(id(package_dict))
+    if cached is None or cached[0] is not package_dict:
+        cached = (package_dict, compile_package_dict(package_dict))
+        _compiled_cache[id(package_dict)] = cached
+
+    return cached[1]
+
+
+def iter_leaves(data):
+    """
+    Iterate over the leaf values of a nested dictionary in insertion order (same order as `flatten_dict`).
+    Strings are encoded to utf-8 bytes on the way.
+
+    Parameters:
+    - data (dict): The nested dictionary.
+
+    Yields:
+    The leaf values, ready for struct packing.
+    """
+
+    for value in data.values():
+        if isinstance(value, dict):
+            yield from iter_leaves(value)
+        elif isinstance(value, str):
+            yield value.encode('utf-8')
+        else:
+            yield value
+
+
+def build_item(codec: dict, values) -> dict:
+    """
+    Build a nested dictionary from unpacked values using the precompiled field paths.
+
+    Parameters:
+    - codec (dict): The codec dictionary of the item.
+    - values (sequence): The unpacked values, in the order of the keys.
+
+    Returns:
+    dict: The nested item dictionary.
+    """
+
+    item = {}
+    for path, value in zip(codec['paths'], values):
+        if len(path) == 1:
+            item[path[0]] = value
+            continue
+
+        current_dict = item
+        for part in path[:-1]:
+            if part not in current_dict:
+                current_dict[part] = {}
+            current_dict = current_dict[part]
+        current_dict[path[-1]] = value
+
+    return item
+
+
+def decode_strings(codec: dict, values: tuple) -> tuple:
+    """
+    Decode the `str` typed fields of unpacked values and strip their null padding.
+
+    Parameters:
+    - codec (dict): The codec dictionary of the item.
+    - values (tuple): The unpacked values.
+
+    Returns:
+    tuple: The cleaned values.
+    """
+
+    if not codec['str_indexes']:
+        return values
+
+    values = list(values)
+    for i in codec['str_indexes']:
+        if isinstance(values[i], bytes):
+            values[i] = values[i].rstrip(b'\x00').decode('utf-8')
+
+    return tuple(values)
+
+
+def pack_frame_parts(compiled: dict, packing_type: str, req: dict) -> list:
+    """
+    Pack a request/response dictionary into a preallocated buffer.
+    When the last item has unknown size it is not copied into the buffer but returned as a separate part,
+    so the caller can send both parts with one scatter-gather call.
+
+    Parameters:
+    - compiled (dict): The compiled package dictionary.
+    - packing_type (str): Type of data packing ('request' or 'response').
+    - req (dict): The request or response dictionary to be packed.
+                  req['header']['payload_size'] is set to the size of the packed payload.
+
+    Returns:
+    list: [buffer] or [buffer, last_item], the concatenation of the parts is the packed frame.
+    """
+
+    header_codec = compiled[packing_type]['header']
+    header_struct = header_codec['struct']
+    header = req['header']
+    code = str(header['code'])
+    payload_codec = compiled[packing_type]['payload'][code]
+
+    payload, tail = (), None
+    payload_size = 0
+    if payload_codec is not None:
+        payload = tuple(iter_leaves(req['payload']))
+        if payload_codec['is_last_item_has_unknown_size']:
+            payload, tail = payload[:-1], payload[-1]
+            payload_size = payload_codec['struct'].size + len(tail)
+        else:
+            items_count = len(payload) // len(payload_codec['keys'])
+            payload_size = payload_codec['struct'].size * items_count
+
+    header['payload_size'] = payload_size
+    header_values = tuple(header[key].encode('utf-8') if isinstance(header[key], str) else header[key]
+                          for key in header_codec['keys'])
+
+    buffer_size = header_struct.size + payload_size - (len(tail) if tail is not None else 0)
+    buffer = bytearray(buffer_size)
+    header_struct.pack_into(buffer, 0, *header_values)
+
+    if payload_codec is not None:
+        payload_struct = payload_codec['struct']
+        fields_count = len(payload_codec['keys'])
+        offset = header_struct.size
+
+        if tail is not None:
+            payload_struct.pack_into(buffer, offset, *payload)
+            return [buffer, tail]
+
+        for i in range(0, len(payload), fields_count):
+            payload_struct.pack_into(buffer, offset, *payload[i:i + fields_count])
+            offset += payload_struct.size
+
+    return [buffer]
+
+
+def pack_frame(compiled: dict, packing_type: str, req: dict) -> bytearray:
+    """
+    Pack a request/response dictionary into a single buffer.
+
+    Parameters:
+    - compiled (dict): The compiled package dictionary.
+    - packing_type (str): Type of data packing ('request' or 'response').
+    - req (dict): The request or response dictionary to be packed.
+
+    Returns:
+    bytearray: The packed header followed by the packed payload.
+    """
+
+    parts = pack_frame_parts(compiled, packing_type, req)
+    buffer = parts[0]
+    if len(parts) > 1:
+        buffer += parts[1]
+
+    return buffer
+
+
+def unpack_frame(compiled: dict, packing_type: str, data) -> dict:
+    """
+    Unpack a frame into a request/response dictionary.
+
+    Parameters:
+    - compiled (dict): The compiled package dictionary.
+    - packing_type (str): Type of data packing ('request' or 'response').
+    - data (bytes-like): The packed frame.
+
+    Returns:
+    dict: {'header': dict, 'payload': dict, list or None}
+    """
+
+    header_codec = compiled[packing_type]['header']
+    header_struct = header_codec['struct']
+    header_values = decode_strings(header_codec, header_struct.unpack_from(data, 0))
+    header = dict(zip(header_codec['keys'], header_values))
+
+    payload_codec = compiled[packing_type]['payload'][str(header['code'])]
+    if payload_codec is None:
+        return {'header': header, 'payload': None}
+
+    payload_struct = payload_codec['struct']
+    payload_data = memoryview(data)[header_struct.size:]
+
+    if payload_codec['is_list']:
+        payload = [build_item(payload_codec, decode_strings(payload_codec, values))
+                   for values in payload_struct.iter_unpack(payload_data)]
+    elif not len(payload_data):
+        payload = {}
+    else:
+        values = payload_struct.unpack_from(payload_data, 0)
+
+        # the last item has unknown length, it is not included in the format of the struct
+        if payload_codec['is_last_item_has_unknown_size']:
+            values += (bytes(payload_data[payload_struct.size:]),)
+
+        payload = build_item(payload_codec, decode_strings(payload_codec, values))
+
+    return {'header': header, 'payload': payload}
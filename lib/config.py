@@ -5,6 +5,16 @@ __api_version__: int
 salt: bytes
     A salt value used for password hashing.
 
+keep_alive_flag: int
+    A bit of the header `version` field used to negotiate persistent connections. A client sets it on a request to ask
+    the server to keep the connection open for more frames, the server echoes it on the response when it agrees.
+    Old servers and clients ignore the header version, so they keep the one frame per connection behaviour.
+
+idempotent_request_codes: frozenset
+    The request codes which can be sent again when a kept-alive connection fails before the response: serving them
+    twice has no effect (1026 servers list, 1030 stats). The registrations, tickets (nonce), symmetric keys
+    (authenticator) and messages are not resent once the request was written.
+
 package_dict: dict
     A dictionary defining the format of requests and responses for the communication protocol (for struct library).
 
@@ -15,6 +25,7 @@ The `package_dict` is structured based on the communication codes for Key Distri
     - 1025: Register Server
     - 1026: Get Servers List
     - 1027: Get Symmetric Key
+    - 1030: Get Stats (KDC and MSG servers)
 
 - MSG Server Codes:
     - 1028: Send Symmetric Key to Server
@@ -27,6 +38,7 @@ The `package_dict` is structured based on the communication codes for Key Distri
     - 1603: Symmetric Key Response
     - 1604: Symmetric Key Accepted
     - 1605: Message Sent successfully
+    - 1606: Stats, a JSON snapshot of the request metrics (see lib.Metrics)
     - 1609: General server error
 
 Each request and response code has a specific format and payload structure defined in `package_dict`.
@@ -37,6 +49,8 @@ Note: This documentation provides an overview, and for specific details, refer t
 
 
 __api_version__ = 24
+keep_alive_flag = 0x80
+idempotent_request_codes = frozenset((1026, 1030))
 salt = b'=\xdc\xee\xf2.\xfaa\xc9\xa3\xc5\xf7\xf8,Z\xcfw\x06\x92\xcc/|\xfa\xd8\xfa\xa4\xcf\xe1\x8e\x8b\xdb\x1b\xbf'
 
 package_dict = {
@@ -54,6 +68,9 @@ package_dict = {
                      'keys': ('authenticator__auth_iv', 'authenticator__version', 'authenticator__client_id', 'authenticator__server_id', 'authenticator__timestamp', 'ticket__version', 'ticket__client_id', 'ticket__server_id', 'ticket__timestamp', 'ticket__ticket_iv', 'ticket__aes_key', 'ticket__expiration_time'),
                      'types': (bytes, bytes, bytes, bytes, bytes, int, str, str, float, bytes, bytes, bytes)},
             '1029': {'format': '<I16s', 'is_last_item_has_unknown_size': True, 'keys': ('message_size', 'iv', 'message_content'), 'types': (bytes, bytes, bytes)},
+
+            # KDC and MSG Server
+            '1030': None,
         },
     }, 'response': {
         'header': {'format': '<BHI', 'keys': ('version', 'code', 'payload_size'), 'types': (int, int, int)},
@@ -72,6 +89,9 @@ package_dict = {
             '1604': None,
             '1605': None,
             '1609': None,
+
+            # KDC and MSG Server
+            '1606': {'format': '<I', 'is_last_item_has_unknown_size': True, 'keys': ('stats_size', 'stats'), 'types': (int, bytes)},
         },
     }
 }
@@ -0,0 +1,169 @@
+"""
+Module: log.py
+
+Asynchronous structured logging of the KDC and the Messages server, built on the `logging` module.
+
+The loggers of the servers ('kdc', 'msg' and the lib modules) hand their records to a bounded queue (`QueueHandler`),
+a single listener thread (`QueueListener`) formats and writes them. So a request thread never takes the console lock
+and never waits for a slow terminal or pipe. A record that does not fit in a full queue is dropped instead of blocking
+the request, the dropped records are counted in the 'log_dropped' gauge of the metrics (lib.Metrics).
+
+A record is one line of the time, the level, the logger, the message and its key=value fields, the fields are passed
+with `extra` and their values are quoted (repr) when they hold spaces, quotes, '=' or control characters, e.g.:
+    logger.info("Client registered", extra={'route': '1024', 'client_id': client_id})
+    2024-02-10 12:00:00,123 INFO kdc Client registered route=1024 client_id=2f1c...
+
+The per-request success records are INFO, the failed requests WARNING and the server errors ERROR, so the level WARNING
+turns the success records off in production. The served requests (route, client_id, response, latency_ms) are logged at
+DEBUG, they cost nothing unless the level is DEBUG. The levels are colored when the output supports ANSI escape codes
+(detected once, at start).
+
+Functions:
+- start_logging: Starts the listener thread and routes the records of all the loggers to it.
+- stop_logging: Writes the queued records and stops the listener thread.
+- log_request: Logs a served request at DEBUG.
+- dropped_records: Returns the number of records dropped because the queue was full (the 'log_dropped' gauge).
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+
+from lib.utils import ANSI_SUPPORTED, RED, GREEN, YELLOW, MAGENTA
+
+LEVEL_COLORS = {
+    logging.DEBUG: MAGENTA,
+    logging.INFO: GREEN,
+    logging.WARNING: YELLOW,
+    logging.ERROR: RED,
+    logging.CRITICAL: RED,
+}
+
+# the attributes of every LogRecord, the others come from `extra` and are written as key=value fields
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', logging.INFO, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# a value with one of these characters is quoted, so a client-controlled value (a message, a client id) cannot end the
+# record line or forge a field
+UNSAFE_CHARACTERS = re.compile(r'[\s="\'\\\x00-\x1f\x7f]')
+
+
+def quote(value):
+    text = str(value)
+    if text and not UNSAFE_CHARACTERS.search(text):
+        return text
+
+    return repr(text)
+
+
+class KeyValueFormatter(logging.Formatter):
+
+    def __init__(self, colors=False):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+        self.colors = colors
+
+    def format(self, record):
+        line = super().format(record)
+        if not line.isprintable():
+            line = line.encode('unicode_escape').decode('ascii')  # one line per record, whatever the message
+        fields = ' '.join(f'{key}={quote(value)}' for key, value in vars(record).items()
+                          if key not in RECORD_ATTRIBUTES)
+        if fields:
+            line = f'{line} {fields}'
+
+        if self.colors and record.levelno in LEVEL_COLORS:
+            return f"\033[{LEVEL_COLORS[record.levelno]}m{line}\033[0m"
+
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler which never blocks: a record which does not fit in the full queue is dropped and counted.
+    """
+
+    def __init__(self, records_queue):
+        super().__init__(records_queue)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # only the message arguments are merged here, the listener thread formats the record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+
+handler = None
+listener = None
+
+
+def start_logging(level='INFO', stream=None, queue_size=10000):
+    """
+    Starts the listener thread and routes the records of all the loggers to it through the queue.
+
+    Params:
+    - level (str): The minimum level of the records, e.g. 'WARNING' to turn off the per-request success records.
+    - stream: The output of the records, sys.stdout by default.
+    - queue_size (int): Records waiting for the listener, more records are dropped.
+    """
+    global handler, listener
+    stream = sys.stdout if stream is None else stream
+    colors = ANSI_SUPPORTED and hasattr(stream, 'isatty') and stream.isatty()
+
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(KeyValueFormatter(colors))
+
+    handler = DroppingQueueHandler(queue.Queue(queue_size))
+    listener = logging.handlers.QueueListener(handler.queue, stream_handler)
+
+    root_logger = logging.getLogger()
+    root_logger.handlers = [handler]
+    root_logger.setLevel(level.upper())
+
+    listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the listener thread, called on exit.
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def dropped_records():
+    """
+    Returns:
+    - int: The records dropped because the queue was full, since the start of the logging.
+    """
+    return handler.dropped if handler is not None else 0
+
+
+def log_request(logger, route, client_id, response_code, seconds):
+    """
+    Logs a served request at DEBUG.
+
+    Params:
+    - logger (logging.Logger): The logger of the server.
+    - route (str): The request code.
+    - client_id (str): The client ID of the request header, None if the frame could not be decoded.
+    - response_code (int): The code of the response sent.
+    - seconds (float): The time spent serving the request.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request served", extra={'route': route, 'client_id': client_id, 'response': response_code,
+                                              'latency_ms': round(seconds * 1e3, 3)})
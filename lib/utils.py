@@ -1,19 +1,26 @@
 import base64
 import binascii
+import functools
 import json
 import os
 import socket
 import struct
 import platform
 import sys
+import time
 from itertools import cycle
 
-from lib.config import salt as general_salt, package_dict as general_package_dict, package_dict
+from lib.config import salt as general_salt, package_dict as general_package_dict, package_dict, keep_alive_flag, \
+    idempotent_request_codes
+from lib.ConnectionPool import ConnectionPool
+from lib.codec import get_compiled, compiled_package_dict, pack_frame, pack_frame_parts, unpack_frame
 from Crypto.Cipher import AES
 from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 
+SERVER_CIPHERS_CACHE_SIZE = 1024  # server keys whose AES ciphers are kept, see get_server_aes_ecb
+
 
 def pack_key_base64(key: bytes):
     """
@@ -129,6 +136,141 @@ def encrypt_aes_cbc(key: bytes, data: bytes, iv: bytes = None) -> (bytes, bytes)
     return cipher.iv, ciphered_data
 
 
+def get_aes_ecb(key: bytes):
+    """
+        Get the AES block cipher (ECB mode) of a key, for a batch of fields: the key schedule is computed once per batch
+        instead of once per field. The cipher is not kept, so no key material outlives the call (the client derived
+        keys are zeroized buffers, see Client/data/DerivedKeys.py). Use get_server_aes_ecb for the server keys.
+
+    Parameters:
+        - key (bytes | bytearray): The AES key.
+
+    Returns:
+        The AES cipher object in ECB mode.
+    """
+    return AES.new(bytes(key), AES.MODE_ECB)
+
+
+@functools.lru_cache(maxsize=SERVER_CIPHERS_CACHE_SIZE)
+def get_cached_aes_ecb(key: bytes):
+    return AES.new(key, AES.MODE_ECB)
+
+
+def get_server_aes_ecb(key: bytes):
+    """
+        Get the AES block cipher (ECB mode) of a long-term server key, cached so its key schedule is computed once for
+        all the tickets of the server. An ECB cipher object has no chaining state, so it is shared between threads.
+        Only immutable keys are cached, a bytearray key (a zeroizable buffer) gets a cipher of its own.
+
+    Parameters:
+        - key (bytes): The AES key of the server.
+
+    Returns:
+        The AES cipher object in ECB mode.
+    """
+    if not isinstance(key, bytes):
+        return get_aes_ecb(key)
+
+    return get_cached_aes_ecb(key)
+
+
+def as_aes_ecb(key):
+    # the fields helpers take an AES key or the AES cipher of a key (see get_aes_ecb, get_server_aes_ecb)
+    if isinstance(key, (bytes, bytearray, memoryview)):
+        return get_aes_ecb(key)
+
+    return key
+
+
+def xor_bytes(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+def encrypt_aes_cbc_fields(key: bytes, fields: tuple, iv: bytes = None) -> (bytes, tuple):
+    """
+        Encrypt several fields using AES in CBC mode, each field on its own under the same key and IV. The result is the
+        same as calling encrypt_aes_cbc for every field with this IV.
+
+        The chaining is done on a single block cipher of the key (see get_aes_ecb), round by round across the fields:
+        the n-th blocks of all the fields are encrypted together, so the fields cost one block cipher call per block of
+        the longest field instead of a cipher setup each. Meant for short fields (the tickets, the authenticators), use
+        encrypt_aes_cbc for large data.
+
+    Parameters:
+        - key (bytes): The key for AES encryption, or its AES cipher in ECB mode (see get_server_aes_ecb).
+        - fields (tuple): The data of the fields to be encrypted.
+        - iv (bytes, optional): The initialization vector for AES encryption. If not provided, a random vector will be
+                                generated.
+
+    Returns:
+        Tuple[bytes, tuple]: A tuple containing the initialization vector (iv) and the encrypted fields.
+    """
+
+    if iv is None:
+        iv = get_random_bytes(16)
+
+    cipher = as_aes_ecb(key)
+    padded_fields = [pad(field, AES.block_size) for field in fields]
+    encrypted_fields = [bytearray() for _ in fields]
+    previous_blocks = [iv] * len(fields)
+
+    offset = 0
+    while True:
+        round_fields = [i for i, field in enumerate(padded_fields) if len(field) > offset]
+        if not round_fields:
+            break
+
+        plain_blocks = b''.join(padded_fields[i][offset:offset + AES.block_size] for i in round_fields)
+        chained = xor_bytes(plain_blocks, b''.join(previous_blocks[i] for i in round_fields))
+        encrypted_blocks = cipher.encrypt(chained)
+
+        for n, i in enumerate(round_fields):
+            block = encrypted_blocks[n * AES.block_size:(n + 1) * AES.block_size]
+            encrypted_fields[i] += block
+            previous_blocks[i] = block
+        offset += AES.block_size
+
+    return iv, tuple(bytes(field) for field in encrypted_fields)
+
+
+def decrypt_aes_cbc_fields(key: bytes, iv: bytes, encrypted_fields: tuple) -> tuple:
+    """
+        Decrypt several fields encrypted using AES in CBC mode under the same key and IV (see encrypt_aes_cbc_fields).
+        The result is the same as calling decrypt_aes_cbc for every field.
+
+        CBC decryption does not chain the block cipher calls: all the blocks of all the fields are decrypted in a single
+        call of the block cipher of the key, then xored with their previous ciphertext block (the IV for the
+        first block of a field).
+
+    Parameters:
+        - key (bytes): The key for AES decryption, or its AES cipher in ECB mode (see get_server_aes_ecb).
+        - iv (bytes): The initialization vector for AES decryption.
+        - encrypted_fields (tuple): The encrypted fields.
+
+    Returns:
+        tuple: The decrypted fields.
+
+    Raises:
+        ValueError: A field is not a whole number of blocks, or its padding is invalid (wrong key).
+    """
+
+    for field in encrypted_fields:
+        if not field or len(field) % AES.block_size:
+            raise ValueError("Data must be padded to 16 byte boundary in CBC mode")
+
+    ciphertext = b''.join(encrypted_fields)
+    previous_blocks = b''.join(iv + field[:-AES.block_size] for field in encrypted_fields)
+    plaintext = xor_bytes(as_aes_ecb(key).decrypt(ciphertext), previous_blocks)
+
+    decrypted_fields = []
+    offset = 0
+    for field in encrypted_fields:
+        decrypted_fields.append(unpad(plaintext[offset:offset + len(field)], AES.block_size))
+        offset += len(field)
+
+    return tuple(decrypted_fields)
+
+
 """
 REQUEST, RESPONSE: str
     Constants representing the types of communication messages - request and response.
@@ -180,9 +322,9 @@ def unflatten_dict(data):
     return nested_dict
 
 
-def pack_data(package_dict: dict, packing_type: str, req: dict) -> bytes:
+def pack_data(package_dict: dict, packing_type: str, req: dict) -> bytearray:
     """
-    Pack data into a binary format based on the specified packing type using struct library.
+    Pack data into a binary format based on the specified packing type using the precompiled codec (lib.codec).
 
     Parameters:
     - package_dict (dict): Dictionary containing the data packing format.
@@ -190,45 +332,15 @@ def pack_data(package_dict: dict, packing_type: str, req: dict) -> bytes:
     - req (dict): The request or response dictionary to be packed.
 
     Returns:
-    bytes: Packed binary data.
+    bytearray: Packed binary data.
     """
 
-    code = str(req['header']['code'])
-
-    packed_payload = b''
-    if package_dict[packing_type]['payload'][code] is not None:
-        payload_format = package_dict[packing_type]['payload'][code]['format']
-        req['header']['payload_size'] = struct.calcsize(payload_format)
-
-        payload_keys = package_dict[packing_type]['payload'][code]['keys']
-        flattened_payload = flatten_dict(req['payload'])
-
-        payload = tuple(flattened_payload.values())
-        payload = tuple(value.encode("utf-8") if isinstance(value, str) else value for value in payload)
-        payload_format_cycled_per_keys = payload_format[0] + str(payload_format[1:]) * int(
-            len(payload) / len(payload_keys))
-
-        if 'is_last_item_has_unknown_size' in package_dict[packing_type]['payload'][code]:
-            last_val = payload[-1]
-            # assume last value is in bytes type
-            payload_format_cycled_per_keys += f'{len(last_val)}s'
-        packed_payload = struct.pack(payload_format_cycled_per_keys, *payload)
-
-
-    # calculate payload size
-    req['header']['payload_size'] = len(packed_payload)
-    header = tuple(req['header'].values())
-    header = tuple(value.encode("utf-8") if isinstance(value, str) else value for value in header)
-
-    header_format = package_dict[packing_type]['header']['format']
-    packed_header = struct.pack(header_format, *header)
-
-    return packed_header + packed_payload
+    return pack_frame(get_compiled(package_dict), packing_type, req)
 
 
 def unpack_data(package_dict: dict, packing_type: str, data: bytes) -> dict:
     """
-    Unpack binary data into a dictionary based on the specified packing type using struct library.
+    Unpack binary data into a dictionary based on the specified packing type using the precompiled codec (lib.codec).
 
     Parameters:
     - package_dict (dict): Dictionary containing the data packing format.
@@ -239,82 +351,16 @@ def unpack_data(package_dict: dict, packing_type: str, data: bytes) -> dict:
     dict: Unpacked data as a dictionary.
     """
 
-    # unpack header
-    header_format = package_dict[packing_type]['header']['format']
-    header_types = package_dict[packing_type]['header']['types']
-    header_size = struct.calcsize(header_format)
-    unpacked_data = struct.unpack(header_format, data[:header_size])
-    cleaned_data = []
-    for i, value in enumerate(unpacked_data):
-        cleaned_value = value
-
-        # if type is str then decode it
-        if header_types[i] is str and isinstance(value, bytes):
-            cleaned_value = cleaned_value.rstrip(b'\x00').decode('utf-8')
-
-        cleaned_data.append(cleaned_value)
-    header_keys = package_dict[packing_type]['header']['keys']
-    header = dict(zip(header_keys, tuple(cleaned_data)))
-
-    # unpack payload
-    code = str(header['code'])
-    if package_dict[packing_type]['payload'][code] is not None:
-        payload_types = package_dict[packing_type]['payload'][code]['types']
-        payload_format = package_dict[packing_type]['payload'][code]['format']
-        payload_size = struct.calcsize(payload_format)
-
-        sliced_data = data[header_size:]
-        list_data = []
-        payload = {}
-        while len(sliced_data):
-            # unpack slice
-            unpacked_data = struct.unpack(payload_format, sliced_data[:payload_size])
-
-            # if the last item has unknown length then we will unpack it
-            # make sure that the last item is not included in the format of the struct
-            if 'is_last_item_has_unknown_size' in package_dict[packing_type]['payload'][code]:
-                last_item = sliced_data[payload_size:]
-                unpacked_data += (last_item,)
-
-            # clean padding from strings
-            cleaned_data = []
-            for i, value in enumerate(unpacked_data):
-                cleaned_value = value
-
-                # if type is str then decode it
-                if payload_types[i] is str and isinstance(value, bytes):
-                    cleaned_value = cleaned_value.rstrip(b'\x00').decode('utf-8')
-
-                cleaned_data.append(cleaned_value)
-            cleaned_data = tuple(cleaned_data)
-
-            # concat keys to values
-            payload_keys = package_dict[packing_type]['payload'][code]['keys']
-            payload = dict(zip(payload_keys, cleaned_data))
-
-            # unflatten payload
-            payload = unflatten_dict(payload)
-
-            # prepare next slice
-            list_data += [payload]
-            sliced_data = sliced_data[payload_size:]
-
-            # Check if the type of data in payload is list -> return list[...] else dict{...}
-            if 'is_list' not in package_dict[packing_type]['payload'][code]:
-                break
-
-        if 'is_list' in package_dict[packing_type]['payload'][code]:
-            payload = list_data
-
-    else:
-        payload = None
-
-    return {'header': header, 'payload': payload}
+    return unpack_frame(get_compiled(package_dict), packing_type, data)
 
 
 def send(connection, packing_type: str, data: dict):
     """
     Send packed data to the specified connection.
+    If the connection is kept alive (connection.keep_alive), the keep-alive flag is set in the header version (of a copy,
+    the data is not modified).
+    On a served connection (lib.Connection, StreamConnection) the response code and the send time are recorded for the
+    request metrics (lib.Metrics).
 
     Parameters:
     - connection: Connection object.
@@ -322,91 +368,192 @@ def send(connection, packing_type: str, data: dict):
     - data (dict): Data to be sent.
 
     """
-    packed_data = pack_data(general_package_dict, packing_type, data)
-    send_data(connection, packed_data)
+    start = time.perf_counter()
+    if getattr(connection, 'keep_alive', False):
+        data = {**data, 'header': {**data['header'], 'version': data['header']['version'] | keep_alive_flag}}
 
+    packed_parts = pack_frame_parts(compiled_package_dict, packing_type, data)
+    send_data(connection, packed_parts)
 
-def send_data(connection, data: bytes):
+    if hasattr(connection, 'response_code'):
+        connection.response_code = data['header']['code']
+        connection.send_time += time.perf_counter() - start
+
+
+def send_data(connection, data):
     """
     Send raw data over the specified connection.
+    A list of buffers is sent with one scatter-gather call (sendmsg) when the platform supports it,
+    the buffers are never concatenated or copied.
+
+    Parameters:
+    - connection: Connection object.
+    - data (bytes-like or list): Data to be sent, or a list of buffers to be sent one after the other.
+    """
+
+    buffers = data if isinstance(data, (list, tuple)) else [data]
+
+    if len(buffers) == 1 or not hasattr(connection, 'sendmsg'):
+        for buffer in buffers:
+            connection.sendall(buffer)
+        return
+
+    views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    while views:
+        sent = connection.sendmsg(views)
+
+        # drop the buffers which were fully sent and continue from the middle of a partially sent one
+        while views and sent >= views[0].nbytes:
+            sent -= views[0].nbytes
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def receive_into(connection, view: memoryview) -> int:
+    """
+    Receive data from the connection straight into the given buffer until it is full or the peer closes.
 
     Parameters:
     - connection: Connection object.
-    - data (bytes): Data to be sent.
+    - view (memoryview): The buffer to fill.
+
+    Returns:
+    int: Number of bytes received.
     """
 
-    # Send the data in chunks
-    chunk_size = 1024
-    for i in range(0, len(data), chunk_size):
-        connection.sendall(data[i:i + chunk_size])
+    received = 0
+    size = view.nbytes
+    while received < size:
+        chunk_size = connection.recv_into(view[received:])
+        if not chunk_size:
+            break
+        received += chunk_size
+
+    return received
 
 
-def receive_data(connection, packing_type: str, timeout=10) -> bytes:
+def receive_data(connection, packing_type: str, timeout=10) -> bytearray:
     """
     Receive data from the specified connection.
+    The frame is received straight into a buffer preallocated from the payload size in the header.
 
     Parameters:
     - connection: Connection object.
     - timeout (int): Timeout value for the connection.
 
     Returns:
-    bytes: Received data.
+    bytearray: Received data.
     """
 
     connection.settimeout(timeout)  # Set a timeout for this connection
 
     # Receive the size of the data
-    header_format = package_dict[packing_type]['header']['format']
-    header_size = struct.calcsize(header_format)
-    header_chunk = connection.recv(header_size)
-    header_values = struct.unpack(header_format, header_chunk)
-    payload_size = header_values[-1]  # payload_size
+    header_struct = compiled_package_dict[packing_type]['header']['struct']
+    header_size = header_struct.size
+    header_chunk = bytearray(header_size)
+    header_received = receive_into(connection, memoryview(header_chunk))
+    if header_received == 0:
+        raise EOFError("Connection closed by peer")
+    if header_received < header_size:
+        raise ConnectionError("Connection closed before receiving the header")
+
+    payload_size = header_struct.unpack_from(header_chunk)[-1]  # payload_size
     data_size = header_size + payload_size
 
-    # Receive the data in chunks
-    received_data = header_chunk
-    while len(received_data) < data_size:
-        chunk = connection.recv(min(1024, data_size - len(received_data)))
-        if not chunk:
-            break
-        received_data += chunk
+    # Receive the payload into the rest of the buffer
+    received_data = bytearray(data_size)
+    received_data[:header_size] = header_chunk
+    with memoryview(received_data) as view:
+        received_size = header_size + receive_into(connection, view[header_size:])
+
+    if received_size < data_size:
+        del received_data[received_size:]
 
     return received_data
 
 
+def is_keep_alive(header: dict) -> bool:
+    """
+    Check if the keep-alive flag is set in the version of an unpacked header.
+
+    Parameters:
+    - header (dict): The unpacked header.
+
+    Returns:
+    bool: True if the peer keeps the connection open for more frames.
+    """
+    return bool(header['version'] & keep_alive_flag)
+
+
+"""
+connection_pool: ConnectionPool
+    The connections kept alive by the servers, shared by all the requests of the process.
+"""
+connection_pool = ConnectionPool()
+
+
 def send_request(ip, port, data: dict) -> dict:
     """
     Send a request to the specified IP and port and receive the response.
+    The request asks the server to keep the connection alive, the connection is then reused by the next requests to the
+    same server. A pooled connection that was closed by the server meanwhile is replaced by a new one.
+
+    When a reused connection fails, the request is sent again on a new connection only if the server cannot have served
+    it: the failure happened while the request was being written (the server never gets a whole frame), or the request
+    is idempotent (lib.config.idempotent_request_codes). A registration, a ticket or a message is never sent twice.
 
     Parameters:
     - ip (str): IP address of the server.
     - port (int): Port number to connect to.
-    - data (dict): Data to be sent in the request.
+    - data (dict): Data to be sent in the request, it is not modified.
 
     Returns:
     dict: Response data received from the server.
     """
-    connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    address = (ip, port)
+    data = {**data, 'header': {**data['header'], 'version': data['header']['version'] | keep_alive_flag}}
+    is_idempotent = data['header']['code'] in idempotent_request_codes
 
     try:
-        # Establish connection to server
-        connection.connect((ip, port))
-        # Send data
-        send(connection, REQUEST, data)
+        while True:
+            # Establish connection to server, or reuse a kept-alive one
+            connection, is_reused = connection_pool.acquire(address)
+            is_sent = False
+
+            try:
+                # Send data
+                send(connection, REQUEST, data)
+                is_sent = True
+
+                # Get response back
+                response = receive_data(connection, RESPONSE)
+                unpacked_res = unpack_data(general_package_dict, RESPONSE, response)
 
-        # Get response back
-        response = receive_data(connection, RESPONSE)
-        unpacked_res = unpack_data(general_package_dict, RESPONSE, response)
+            except (EOFError, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if is_reused and (not is_sent or is_idempotent):
+                    continue  # the server closed the idle connection before it got the request, or resending is safe
+                raise
+
+            except BaseException:
+                connection.close()
+                raise
+
+            connection_pool.release(address, connection, is_keep_alive(unpacked_res['header']))
+            return unpacked_res
 
-        return unpacked_res
     except ConnectionRefusedError:
         raise Exception("Error: Connection refused. Ensure that the server is running.")
     except Exception as e:
         raise Exception(f"Error during communication: {e}")
 
-    finally:
-        connection.close()
 
+"""
+ANSI_SUPPORTED: bool
+    True if the platform supports ANSI escape codes, detected once at import.
+"""
+ANSI_SUPPORTED = platform.system() != 'Windows' or 'ANSICON' in os.environ or 'CONEMUANSI' in os.environ
 
 # ANSI escape codes for some colors
 RED = "91"  # Red
@@ -428,10 +575,7 @@ def color(text, color_code):
     Returns:
         str: The colored text.
     """
-    # Check if the platform supports ANSI escape codes
-    colors_supported = platform.system() != 'Windows' or 'ANSICON' in os.environ or 'CONEMUANSI' in os.environ
-
-    if colors_supported:
+    if ANSI_SUPPORTED:
         # Add ANSI escape codes to the text
         return f"\033[{color_code}m{text}\033[0m"
     else:
@@ -449,10 +593,7 @@ def bold(text):
         str: The bold-formatted text.
     """
 
-    # Check if the platform supports ANSI escape codes
-    bold_supported = platform.system() != 'Windows' or 'ANSICON' in os.environ or 'CONEMUANSI' in os.environ
-
-    if bold_supported:
+    if ANSI_SUPPORTED:
         return "\033[1m" + text + "\033[0m"
     else:
         return text
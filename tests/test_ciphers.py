@@ -0,0 +1,24 @@
+from Crypto.Random import get_random_bytes
+
+from lib.utils import get_server_aes_ecb, get_cached_aes_ecb, encrypt_aes_cbc_fields, decrypt_aes_cbc_fields
+
+
+def test_a_server_key_reuses_its_cached_cipher():
+    server_key = get_random_bytes(32)
+
+    cipher = get_server_aes_ecb(server_key)
+    assert get_server_aes_ecb(bytes(bytearray(server_key))) is cipher
+
+    # the fields helpers take the cipher or the key, with the same result
+    iv, encrypted_fields = encrypt_aes_cbc_fields(cipher, (b'session key', b'1700000000'))
+    assert encrypt_aes_cbc_fields(server_key, (b'session key', b'1700000000'), iv) == (iv, encrypted_fields)
+    assert decrypt_aes_cbc_fields(cipher, iv, encrypted_fields) == (b'session key', b'1700000000')
+
+
+def test_a_bytearray_key_is_never_cached():
+    derived_key = bytearray(get_random_bytes(32))
+    cached = get_cached_aes_ecb.cache_info().currsize
+
+    assert get_server_aes_ecb(derived_key) is not get_server_aes_ecb(derived_key)
+    encrypt_aes_cbc_fields(derived_key, (b'nonce',))
+    assert get_cached_aes_ecb.cache_info().currsize == cached
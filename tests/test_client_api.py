@@ -0,0 +1,46 @@
+import os
+
+from Crypto.Random import get_random_bytes
+
+cwd = os.getcwd()
+from Client import api, data  # noqa: E402 (the Client package changes the working directory)
+os.chdir(cwd)
+
+from lib.utils import encrypt_aes_cbc_fields  # noqa: E402
+
+
+def test_get_symmetric_key_kdc_twice_uses_the_cached_derived_key(monkeypatch):
+    password_key = get_random_bytes(32)
+    session_keys = []
+    hashed = []
+
+    def hash_password(password, salt):
+        hashed.append(password)
+        return password_key
+
+    def send_request(ip, port, request):
+        # the KDC response (1603): the session key and the nonce encrypted with the key derived from the password
+        session_key = get_random_bytes(32)
+        session_keys.append(session_key)
+        iv, (encrypted_nonce, encrypted_session_key) = encrypt_aes_cbc_fields(
+            password_key, (request['payload']['nonce'], session_key))
+        return {
+            'header': {'code': 1603},
+            'payload': {
+                'symmetric_key': {'symm_iv': iv, 'nonce': encrypted_nonce, 'aes_key': encrypted_session_key},
+                'ticket': {'server_id': request['payload']['server_id']},
+            }
+        }
+
+    monkeypatch.setattr(api, 'hash_password', hash_password)
+    monkeypatch.setattr(api, 'send_request', send_request)
+    data.load_db()
+
+    for i in range(2):
+        _, session_key, ticket = api.get_symmetric_key_kdc('client', 'password', 'server')
+        assert session_key == session_keys[i]
+        assert ticket == {'server_id': 'server'}
+
+    # the second request decrypted with the cached key (a zeroizable bytearray)
+    assert hashed == ['password']
+    assert isinstance(data.db['derived_keys'].get_key('client'), bytearray)
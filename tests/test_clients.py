@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from KDC.db.models.Clients import Clients
+
+
+def client(i):
+    return {'client_id': f'{i:016x}', 'name': f'client{i}', 'password_hash': bytes(32), 'last_seen': '1.0'}
+
+
+@pytest.fixture
+def clients(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # the model paths are relative to the working directory
+    clients = Clients('/clients', compact_threshold=4)
+    yield clients
+    clients.close()
+
+
+def test_last_seen_go_to_the_sidecar_and_survive_a_restart(clients, tmp_path):
+    for i in range(3):
+        clients.add_client(client(i))
+
+    for heartbeat in range(10):
+        clients.touch(client(1)['client_id'], timestamp=100.0 + heartbeat)
+        clients.flush_last_seen()
+    clients.last_seen_journal.drain()
+
+    # the heartbeats never reach the clients journal, so they never compact the clients file
+    assert clients.journal.records_count == 3
+    assert all(record.startswith('add:') for record in clients.journal.read_records())
+
+    clients.close()
+    reloaded = Clients('/clients', compact_threshold=4)
+    try:
+        assert reloaded.registry.by_id[client(1)['client_id']]['last_seen'] == '109.0'
+        assert reloaded.registry.by_id[client(2)['client_id']]['last_seen'] == '1.0'
+    finally:
+        reloaded.close()
+    assert os.path.exists(tmp_path / 'clients.last_seen')
+
+
+def test_unknown_clients_are_ignored(clients):
+    clients.add_client(client(0))
+    clients.write_last_seen({'unknown': 5.0, client(0)['client_id']: 6.0})
+
+    assert 'unknown' not in clients.registry.by_id
+    assert clients.registry.by_id[client(0)['client_id']]['last_seen'] == 6.0
@@ -0,0 +1,150 @@
+"""
+Bit-exact compatibility of the compiled codec (lib.codec, behind pack_data/unpack_data) with the struct codec it
+replaced, kept below as the reference (legacy_pack_data/legacy_unpack_data), for every code of package_dict.
+"""
+
+import copy
+import os
+import re
+import struct
+
+import pytest
+
+from lib.config import package_dict, __api_version__
+from lib.utils import pack_data, unpack_data, flatten_dict, unflatten_dict
+
+LIST_SIZES = (1, 3, 100)  # items of the list payloads (1602)
+TAIL_SIZES = (0, 1, 100, 70000)  # bytes of the last item of unknown size (1029, 1606)
+
+
+def legacy_pack_data(package_dict: dict, packing_type: str, req: dict) -> bytes:
+    code = str(req['header']['code'])
+
+    packed_payload = b''
+    if package_dict[packing_type]['payload'][code] is not None:
+        payload_format = package_dict[packing_type]['payload'][code]['format']
+        req['header']['payload_size'] = struct.calcsize(payload_format)
+
+        payload_keys = package_dict[packing_type]['payload'][code]['keys']
+        flattened_payload = flatten_dict(req['payload'])
+
+        payload = tuple(flattened_payload.values())
+        payload = tuple(value.encode("utf-8") if isinstance(value, str) else value for value in payload)
+        payload_format_cycled_per_keys = payload_format[0] + str(payload_format[1:]) * int(
+            len(payload) / len(payload_keys))
+
+        if 'is_last_item_has_unknown_size' in package_dict[packing_type]['payload'][code]:
+            last_val = payload[-1]
+            # assume last value is in bytes type
+            payload_format_cycled_per_keys += f'{len(last_val)}s'
+        packed_payload = struct.pack(payload_format_cycled_per_keys, *payload)
+
+    # calculate payload size
+    req['header']['payload_size'] = len(packed_payload)
+    header = tuple(req['header'].values())
+    header = tuple(value.encode("utf-8") if isinstance(value, str) else value for value in header)
+
+    header_format = package_dict[packing_type]['header']['format']
+    packed_header = struct.pack(header_format, *header)
+
+    return packed_header + packed_payload
+
+
+def legacy_clean(types, values):
+    return tuple(value.rstrip(b'\x00').decode('utf-8') if types[i] is str and isinstance(value, bytes) else value
+                 for i, value in enumerate(values))
+
+
+def legacy_unpack_data(package_dict: dict, packing_type: str, data: bytes) -> dict:
+    header_format = package_dict[packing_type]['header']['format']
+    header_size = struct.calcsize(header_format)
+    header = dict(zip(package_dict[packing_type]['header']['keys'],
+                      legacy_clean(package_dict[packing_type]['header']['types'],
+                                   struct.unpack(header_format, data[:header_size]))))
+
+    code = str(header['code'])
+    payload_dict = package_dict[packing_type]['payload'][code]
+    if payload_dict is None:
+        return {'header': header, 'payload': None}
+
+    payload_size = struct.calcsize(payload_dict['format'])
+    sliced_data = data[header_size:]
+    list_data = []
+    payload = {}
+    while len(sliced_data):
+        unpacked_data = struct.unpack(payload_dict['format'], sliced_data[:payload_size])
+        if 'is_last_item_has_unknown_size' in payload_dict:
+            unpacked_data += (sliced_data[payload_size:],)
+
+        payload = unflatten_dict(dict(zip(payload_dict['keys'], legacy_clean(payload_dict['types'], unpacked_data))))
+        list_data += [payload]
+        sliced_data = sliced_data[payload_size:]
+        if 'is_list' not in payload_dict:
+            break
+
+    if 'is_list' in payload_dict:
+        payload = list_data
+
+    return {'header': header, 'payload': payload}
+
+
+def field_value(count, char, value_type):
+    if char == 's':
+        # full size fields, the str ones without null bytes so they come back unchanged
+        return 'x' * count if value_type is str else os.urandom(count)
+    if char in 'fd':
+        return 1.5
+
+    return 7
+
+
+def build_frame(packing_type, code, size):
+    header_keys = package_dict[packing_type]['header']['keys']
+    header = {'client_id': '0123456789abcdef', 'version': __api_version__, 'code': int(code)}
+    header = {key: header[key] for key in header_keys if key in header}
+
+    payload_format = package_dict[packing_type]['payload'][code]
+    if payload_format is None:
+        return {'header': header, 'payload': None}
+
+    fields = [(int(count) if count else 1, char)
+              for count, char in re.findall(r'(\d*)([a-zA-Z?])', payload_format['format'])]
+    item = {key: field_value(count, char, value_type)
+            for key, (count, char), value_type in zip(payload_format['keys'], fields, payload_format['types'])}
+    if 'is_list' in payload_format:
+        payload = {f'{key}__{i}': value for i in range(size) for key, value in item.items()}  # as get_servers_list
+    elif 'is_last_item_has_unknown_size' in payload_format:
+        payload = unflatten_dict({**item, payload_format['keys'][-1]: os.urandom(size)})
+    else:
+        payload = unflatten_dict(item)
+
+    return {'header': header, 'payload': payload}
+
+
+def frames():
+    # (packing type, code, size) of every code, the list and unknown size payloads in several sizes
+    for packing_type, packing_dict in package_dict.items():
+        for code, payload_format in packing_dict['payload'].items():
+            sizes = (None,)
+            if payload_format is not None and 'is_list' in payload_format:
+                sizes = LIST_SIZES
+            elif payload_format is not None and 'is_last_item_has_unknown_size' in payload_format:
+                sizes = TAIL_SIZES
+
+            for size in sizes:
+                yield pytest.param(packing_type, code, size, id=f'{packing_type}-{code}-{size}')
+
+
+@pytest.mark.parametrize('packing_type, code, size', list(frames()))
+def test_compiled_codec_matches_the_legacy_codec(packing_type, code, size):
+    frame = build_frame(packing_type, code, size)
+
+    data = bytes(pack_data(package_dict, packing_type, copy.deepcopy(frame)))
+    assert data == legacy_pack_data(package_dict, packing_type, copy.deepcopy(frame))
+    assert unpack_data(package_dict, packing_type, data) == legacy_unpack_data(package_dict, packing_type, data)
+
+
+def test_every_code_is_covered():
+    covered = {(packing_type, code) for packing_type, code, _ in (param.values for param in frames())}
+    assert covered == {(packing_type, code)
+                       for packing_type, packing_dict in package_dict.items() for code in packing_dict['payload']}
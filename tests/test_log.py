@@ -0,0 +1,39 @@
+import logging
+import queue
+
+from lib.log import KeyValueFormatter, DroppingQueueHandler
+
+
+def format_record(message, **fields):
+    record = logging.LogRecord('msg', logging.INFO, __file__, 1, message, (), None)
+    record.__dict__.update(fields)
+    return KeyValueFormatter().format(record)
+
+
+def test_client_controlled_values_cannot_forge_records():
+    forged = "hi\n2024-02-10 12:00:00,000 ERROR kdc forged route=1024"
+    client_id = 'a b="c"'
+    line = format_record("Message received", route='1029', client_id=client_id, content=forged)
+
+    assert '\n' not in line
+    assert line.endswith(f" route=1029 client_id={client_id!r} content={forged!r}")
+
+
+def test_plain_values_and_messages_are_not_quoted():
+    assert format_record("Client registered", route='1024', size=12).endswith(" Client registered route=1024 size=12")
+    assert '\n' not in format_record("line\nbreak")
+
+
+def test_records_dropped_by_a_full_queue_are_counted():
+    records_queue = queue.Queue(1)
+    handler = DroppingQueueHandler(records_queue)
+    logger = logging.getLogger('test.dropped')
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        for _ in range(3):
+            logger.warning("Record")
+    finally:
+        logger.removeHandler(handler)
+
+    assert records_queue.qsize() == 1 and handler.dropped == 2
@@ -0,0 +1,145 @@
+"""
+Concurrency stress of the text db models, reduced from the benchmark it replaces: reader threads run the hot read paths
+while writer threads register clients and servers against the copy-on-write registry (see Registry.py).
+    - Clients.get_password_hash_by_client_id (ticket request, 1027)
+    - Servers.get_all_servers (servers list, 1026)
+    - Servers.get_aes_key_by_server_id (ticket request, 1027)
+
+The readers check that every snapshot they see is consistent (a record is in both indexes or in none, a listed server
+has a key), and that every record whose registration returned is found.
+"""
+
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from KDC.db.models.Clients import Clients, client_to_line
+from KDC.db.models.Registry import IDS_CHUNK
+from KDC.db.models.Servers import Servers, server_to_line
+
+READERS = 4
+WRITERS = 4
+REGISTRATIONS = 50  # per writer
+PRELOAD = IDS_CHUNK + 500  # clients in the registry before the run, more than one chunk of ids
+PRELOAD_SERVERS = 50
+COMPACT_THRESHOLD = 64  # so the journals are compacted in the background during the run
+
+
+def make_client(i):
+    return {'client_id': f'c{i:015x}', 'name': f'stress-client{i}', 'password_hash': os.urandom(32),
+            'last_seen': str(time.time())}
+
+
+def make_server(i):
+    return {'server_id': f's{i:015x}', 'name': f'stress-server{i}', 'server_ip': '127.0.0.1',
+            'server_port': 9000 + i % 1000, 'aes_key': os.urandom(32)}
+
+
+class Stress:
+
+    def __init__(self, clients, servers, preloaded_client_ids, preloaded_server_ids):
+        self.clients = clients
+        self.servers = servers
+        self.registered_client_ids = list(preloaded_client_ids)  # appended once a registration returned
+        self.registered_server_ids = list(preloaded_server_ids)
+        self.errors = []
+        self.reads = 0
+        self.lock = threading.Lock()
+        self.running = True
+
+    def fail(self, message):
+        with self.lock:
+            self.errors.append(message)
+
+    def read(self):
+        reads = 0
+        while self.running:
+            try:
+                client_id = random.choice(self.registered_client_ids)
+                if self.clients.get_password_hash_by_client_id(client_id) is None:
+                    self.fail(f"registered client {client_id} not found")
+
+                server_id = random.choice(self.registered_server_ids)
+                if self.servers.get_aes_key_by_server_id(server_id) is None:
+                    self.fail(f"registered server {server_id} not found")
+
+                registry = self.clients.registry
+                if len(registry.by_id) != len(registry.by_name) or len(registry.by_id) != len(registry.records):
+                    self.fail("torn clients snapshot")
+
+                if reads % 100 == 0:
+                    for server in self.servers.get_all_servers():
+                        if self.servers.get_aes_key_by_server_id(server['server_id']) is None:
+                            self.fail(f"listed server {server['server_id']} has no key")
+            except Exception as e:
+                self.fail(f"reader: {e!r}")
+            reads += 1
+            time.sleep(0)  # as a request between its reads, lets the writers and the journal threads run
+
+        with self.lock:
+            self.reads += reads
+
+    def write(self, first, count):
+        for i in range(first, first + count):
+            try:
+                client = make_client(i)
+                self.clients.add_client(client)
+                self.registered_client_ids.append(client['client_id'])
+
+                if i % 10 == 0:
+                    server = make_server(i)
+                    self.servers.add_server(server)
+                    self.registered_server_ids.append(server['server_id'])
+            except Exception as e:
+                self.fail(f"writer: {e!r}")
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # the model paths are relative to the working directory
+    preloaded_clients = [make_client(-i) for i in range(1, PRELOAD + 1)]
+    preloaded_servers = [make_server(-i) for i in range(1, PRELOAD_SERVERS + 1)]
+    with open(tmp_path / 'clients', 'w') as file:
+        file.writelines(f"{client_to_line(client)}\n" for client in preloaded_clients)
+    with open(tmp_path / 'servers', 'w') as file:
+        file.writelines(f"{server_to_line(server)}\n" for server in preloaded_servers)
+
+    return [client['client_id'] for client in preloaded_clients], [server['server_id'] for server in preloaded_servers]
+
+
+def test_concurrent_reads_and_registrations(registry):
+    client_ids, server_ids = registry
+    clients = Clients('/clients', compact_threshold=COMPACT_THRESHOLD)
+    servers = Servers('/servers', compact_threshold=COMPACT_THRESHOLD)
+    stress = Stress(clients, servers, client_ids, server_ids)
+
+    readers = [threading.Thread(target=stress.read) for _ in range(READERS)]
+    writers = [threading.Thread(target=stress.write, args=(writer * REGISTRATIONS, REGISTRATIONS))
+               for writer in range(WRITERS)]
+    try:
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+    finally:
+        stress.running = False
+        for thread in readers:
+            thread.join()
+
+    assert stress.errors == [] and stress.reads > 0
+    assert len(clients.clients) == PRELOAD + WRITERS * REGISTRATIONS
+    assert len(servers.servers) == PRELOAD_SERVERS + WRITERS * REGISTRATIONS // 10
+
+    # every registration is durable
+    clients.close()
+    servers.close()
+    reloaded_clients, reloaded_servers = Clients('/clients'), Servers('/servers')
+    try:
+        assert len(reloaded_clients.clients) == PRELOAD + WRITERS * REGISTRATIONS
+        assert len(reloaded_servers.servers) == PRELOAD_SERVERS + WRITERS * REGISTRATIONS // 10
+    finally:
+        reloaded_clients.close()
+        reloaded_servers.close()
@@ -0,0 +1,29 @@
+from KDC.db.models.Registry import Registry, IDS_CHUNK
+
+
+def client(i, last_seen='0'):
+    return {'client_id': f'{i:016x}', 'name': f'client{i}', 'last_seen': last_seen}
+
+
+def test_writes_return_new_registries_and_keep_the_old_ones():
+    registry = Registry('client_id', [client(i) for i in range(IDS_CHUNK + 10)])
+
+    added = registry.added(client(-1))
+    updated = added.updated({client(3)['client_id']: client(3, last_seen='1'), 'unknown': client(-2)})
+    removed = updated.removed(client(-1))
+
+    assert len(registry.records) == IDS_CHUNK + 10 and 'client-1' not in registry.by_name
+    assert len(added.records) == IDS_CHUNK + 11 and added.records[-1]['name'] == 'client-1'
+    assert updated.records[3]['last_seen'] == '1' and updated.by_name['client3']['last_seen'] == '1'
+    assert added.records[3]['last_seen'] == '0' and 'unknown' not in updated.by_id
+    assert len(removed.by_id) == len(removed.by_name) == len(removed.records) == IDS_CHUNK + 10
+    assert [record['name'] for record in removed.records] == [f'client{i}' for i in range(IDS_CHUNK + 10)]
+
+
+def test_a_write_shares_the_unmodified_shards():
+    registry = Registry('client_id', [client(i) for i in range(5000)])
+    added = registry.added(client(-1))
+
+    shared = sum(old is new for old, new in zip(registry.by_id.shards, added.by_id.shards))
+    assert shared == len(registry.by_id.shards) - 1
+    assert added.ids.chunks[:-1] == registry.ids.chunks[:-1]
@@ -0,0 +1,86 @@
+import socket
+import threading
+
+import pytest
+
+import lib.utils
+from lib.Connection import Connection
+from lib.ConnectionPool import ConnectionPool
+from lib.config import __api_version__, keep_alive_flag
+from lib.utils import send_request, receive_data, unpack_data, send, REQUEST, RESPONSE
+
+
+class DroppingServer:
+    """
+    Serves the first request of a connection (keeping it alive), then reads the second one and closes the connection
+    without responding, as a server which closes an idle connection right when a request arrives.
+    """
+
+    def __init__(self):
+        self.socket = socket.create_server(('127.0.0.1', 0))
+        self.address = self.socket.getsockname()
+        self.received = []  # request codes, in the order they arrived
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_connection, args=(connection,), daemon=True).start()
+
+    def serve_connection(self, sock):
+        connection = Connection(sock)
+        with sock:
+            for frame in range(2):
+                try:
+                    request = unpack_data(lib.utils.package_dict, REQUEST, receive_data(connection, REQUEST))
+                except EOFError:  # the client closed the connection
+                    return
+                self.received.append(request['header']['code'])
+                if frame == 1:
+                    return
+
+                connection.keep_alive = True
+                send(connection, RESPONSE, {'header': {'version': __api_version__, 'code': 1605}})
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(lib.utils, 'connection_pool', ConnectionPool())
+    server = DroppingServer()
+    yield server
+    server.socket.close()
+    lib.utils.connection_pool.close_all()
+
+
+def request(code):
+    return {'header': {'client_id': '0123456789abcdef', 'version': __api_version__, 'code': code}, 'payload': None}
+
+
+def message():
+    return {**request(1029), 'payload': {'message_size': 5, 'iv': bytes(16), 'message_content': b'hello'}}
+
+
+def test_a_request_which_may_have_been_served_is_not_sent_again(server):
+    send_request(*server.address, message())
+
+    with pytest.raises(Exception):
+        send_request(*server.address, message())
+    assert server.received == [1029, 1029]
+
+
+def test_an_idempotent_request_is_sent_again_on_a_new_connection(server):
+    send_request(*server.address, message())
+
+    response = send_request(*server.address, request(1026))
+    assert response['header']['code'] == 1605
+    assert server.received == [1029, 1026, 1026]
+
+
+def test_the_request_is_not_modified(server):
+    servers_list = request(1026)
+    send_request(*server.address, servers_list)
+
+    assert servers_list == request(1026) and not servers_list['header']['version'] & keep_alive_flag
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from KDC.db.models import SqliteDatabase, SqliteClients, SqliteServers
+from KDC.db.models.Storage import ClientsStorage, ServersStorage
+
+
+def test_a_backend_missing_a_method_cannot_be_created():
+    class PartialClients(ClientsStorage):
+        def is_exist(self, other_client):
+            return False
+
+    class PartialServers(ServersStorage):
+        def get_all_servers(self):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialClients()
+    with pytest.raises(TypeError):
+        PartialServers()
+
+
+def test_migrate_copies_the_text_registry_of_the_db_dir_to_sqlite(monkeypatch, tmp_path):
+    import KDC.config as cfg
+    import KDC.db.models as models
+    from KDC import migrate
+
+    monkeypatch.chdir(tmp_path)  # the model paths are relative to the working directory
+    for name in ('__db_clients_path__', '__db_servers_path__', '__db_sqlite_path__', '__db_binary_clients_path__'):
+        monkeypatch.setattr(cfg, name, getattr(cfg, name))
+    models.set_db_dir(tmp_path / 'registry')
+    os.mkdir(tmp_path / 'registry')
+
+    client = {'client_id': '0123456789abcdef', 'name': 'alice', 'password_hash': bytes(range(32)),
+              'last_seen': '1700000000.0'}
+    server = {'server_id': 'fedcba9876543210', 'name': 'printer', 'server_ip': '127.0.0.1', 'server_port': 1235,
+              'aes_key': bytes(range(32, 64))}
+    text_db = models.open_text_db()
+    text_db['clients'].add_client(client)
+    text_db['servers'].add_server(server)
+    for model in text_db.values():
+        model.close()
+
+    assert migrate.migrate_to_sqlite() == (1, 1)
+    assert migrate.migrate_to_sqlite() == (0, 0)  # run again, the records already exist
+
+    database = SqliteDatabase(cfg.__db_sqlite_path__)
+    clients, servers = SqliteClients(database), SqliteServers(database)
+    try:
+        assert clients.is_exist({'name': 'alice'})
+        assert clients.get_password_hash_by_client_id(client['client_id']) == client['password_hash']
+        assert servers.get_aes_key_by_server_id(server['server_id']) == server['aes_key']
+        assert servers.get_all_servers() == [{key: server[key] for key in ('server_id', 'name', 'server_ip',
+                                                                          'server_port')}]
+    finally:
+        clients.close()
+    assert os.path.exists(tmp_path / 'registry' / 'kdc.sqlite3')
@@ -0,0 +1,56 @@
+import socket
+import time
+
+from lib.Connection import Connection
+from lib.WorkerPool import WorkerPool
+
+
+def connected_pair():
+    with socket.create_server(('127.0.0.1', 0)) as server:
+        client = socket.create_connection(server.getsockname())
+        connection, _ = server.accept()
+    return client, connection
+
+
+def echo(connection):
+    # serves a line per frame, keeps the connection open until the client closes it
+    data = connection.recv(1024)
+    if not data:
+        connection.close()
+        return False
+
+    connection.sendall(data)
+    return True
+
+
+def test_the_frames_of_a_kept_alive_connection_are_not_counted_as_accepted():
+    pool = WorkerPool(echo, size=1)
+    pool.start()
+    client, connection = connected_pair()
+    try:
+        pool.submit(Connection(connection))
+        for frame in (b'one', b'two', b'three'):
+            client.sendall(frame)
+            assert client.recv(1024) == frame
+        time.sleep(0.05)  # the last frame parks the connection again
+
+        stats = pool.stats()
+        assert stats['accepted'] == 1 and stats['requeued'] == 2 and stats['rejected'] == 0
+    finally:
+        client.close()
+        pool.shutdown()
+
+
+def test_a_rejected_connection_with_an_unread_request_gets_the_response():
+    pool = WorkerPool(echo, size=1, reject_depth=0, reject_response=b'rejected')
+    client, connection = connected_pair()
+    try:
+        client.sendall(b'request')
+        time.sleep(0.05)  # the request is in the receive buffer of the server, unread
+
+        assert not pool.submit(Connection(connection), is_new=False)
+        assert client.recv(1024) == b'rejected'
+        assert client.recv(1024) == b''
+        assert pool.stats()['requeue_rejected'] == 1 and pool.stats()['rejected'] == 0
+    finally:
+        client.close()